@@ -0,0 +1,106 @@
+"""saved_songs dedup constraints and covering index
+
+Revision ID: 3c5e1f9a2b7d
+Revises: af2a1da122c6
+Create Date: 2026-10-19 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c5e1f9a2b7d'
+down_revision: Union[str, Sequence[str], None] = 'af2a1da122c6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _normalize_song_key(title, artist):
+    # Копия app.services.catalog_service.normalize_song_key -
+    # миграция не должна зависеть от кода приложения
+    norm_title = " ".join((title or "").split()).casefold()
+    norm_artist = " ".join((artist or "").split()).casefold()
+    return f"{norm_title}\x1f{norm_artist}"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # Таблица раньше создавалась только через create_all
+    if not inspector.has_table('saved_songs'):
+        op.create_table('saved_songs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('youtube_video_id', sa.String(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('artist', sa.String(), nullable=True),
+        sa.Column('date_saved', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_saved_songs_id'), 'saved_songs', ['id'], unique=False)
+
+    columns = {c['name'] for c in sa.inspect(bind).get_columns('saved_songs')}
+    if 'dedup_key' not in columns:
+        op.add_column('saved_songs', sa.Column('dedup_key', sa.String(), nullable=True))
+
+    # Заполняем ключ и удаляем дубликаты (оставляем самую раннюю запись)
+    saved_songs = sa.table('saved_songs',
+        sa.column('id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('youtube_video_id', sa.String),
+        sa.column('title', sa.String),
+        sa.column('artist', sa.String),
+        sa.column('dedup_key', sa.String),
+    )
+    rows = bind.execute(
+        sa.select(saved_songs.c.id, saved_songs.c.user_id, saved_songs.c.youtube_video_id,
+                  saved_songs.c.title, saved_songs.c.artist).order_by(saved_songs.c.id)
+    ).all()
+    seen_videos, seen_keys, duplicates = set(), set(), []
+    for row in rows:
+        key = _normalize_song_key(row.title, row.artist)
+        if (row.user_id, row.youtube_video_id) in seen_videos or (row.user_id, key) in seen_keys:
+            duplicates.append(row.id)
+            continue
+        seen_videos.add((row.user_id, row.youtube_video_id))
+        seen_keys.add((row.user_id, key))
+        bind.execute(saved_songs.update().where(saved_songs.c.id == row.id).values(dedup_key=key))
+    if duplicates:
+        bind.execute(saved_songs.delete().where(saved_songs.c.id.in_(duplicates)))
+
+    # На свежей базе create_all мог уже создать ограничения из модели
+    inspector = sa.inspect(bind)
+    existing_constraints = {c['name'] for c in inspector.get_unique_constraints('saved_songs')}
+    existing_indexes = {i['name'] for i in inspector.get_indexes('saved_songs')}
+
+    with op.batch_alter_table('saved_songs') as batch_op:
+        batch_op.alter_column('dedup_key', existing_type=sa.String(), nullable=False)
+        if 'uq_saved_songs_user_video' not in existing_constraints:
+            batch_op.create_unique_constraint('uq_saved_songs_user_video', ['user_id', 'youtube_video_id'])
+        if 'uq_saved_songs_user_dedup_key' not in existing_constraints:
+            batch_op.create_unique_constraint('uq_saved_songs_user_dedup_key', ['user_id', 'dedup_key'])
+
+    # Покрывающий индекс для списка избранного (INCLUDE учитывается только в PostgreSQL)
+    if 'ix_saved_songs_user_date_saved' not in existing_indexes:
+        op.create_index(
+            'ix_saved_songs_user_date_saved',
+            'saved_songs',
+            ['user_id', sa.text('date_saved DESC'), sa.text('id DESC')],
+            unique=False,
+            postgresql_include=['youtube_video_id', 'title', 'artist'],
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_saved_songs_user_date_saved', table_name='saved_songs')
+    with op.batch_alter_table('saved_songs') as batch_op:
+        batch_op.drop_constraint('uq_saved_songs_user_dedup_key', type_='unique')
+        batch_op.drop_constraint('uq_saved_songs_user_video', type_='unique')
+        batch_op.drop_column('dedup_key')
@@ -0,0 +1,44 @@
+"""create embeddings
+
+Revision ID: 5d8f3a1c7e42
+Revises: e4a7c2d9b315
+Create Date: 2026-10-19 13:02:17.884251
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8f3a1c7e42'
+down_revision: Union[str, Sequence[str], None] = 'e4a7c2d9b315'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('embeddings',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('ref_key', sa.String(), nullable=False),
+    sa.Column('provider', sa.String(length=64), nullable=False),
+    sa.Column('dim', sa.Integer(), nullable=False),
+    sa.Column('vector', sa.LargeBinary(), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('kind', 'provider', 'ref_key', name='uq_embeddings_kind_provider_ref')
+    )
+    op.create_index(op.f('ix_embeddings_id'), 'embeddings', ['id'], unique=False)
+    op.create_index('ix_embeddings_provider_kind_updated', 'embeddings', ['provider', 'kind', 'updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_embeddings_provider_kind_updated', table_name='embeddings')
+    op.drop_index(op.f('ix_embeddings_id'), table_name='embeddings')
+    op.drop_table('embeddings')
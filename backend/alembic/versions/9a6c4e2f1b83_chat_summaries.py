@@ -0,0 +1,43 @@
+"""chat summaries and chat_messages history index
+
+Revision ID: 9a6c4e2f1b83
+Revises: 5d8f3a1c7e42
+Create Date: 2026-10-19 14:41:09.215734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a6c4e2f1b83'
+down_revision: Union[str, Sequence[str], None] = '5d8f3a1c7e42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chat_summaries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=False),
+    sa.Column('summarized_until_id', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('token_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # chat_messages раньше создавалась только через create_all
+    if sa.inspect(op.get_bind()).has_table('chat_messages'):
+        existing = {i['name'] for i in sa.inspect(op.get_bind()).get_indexes('chat_messages')}
+        if 'ix_chat_messages_user_id_id' not in existing:
+            op.create_index('ix_chat_messages_user_id_id', 'chat_messages', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if sa.inspect(op.get_bind()).has_table('chat_messages'):
+        op.drop_index('ix_chat_messages_user_id_id', table_name='chat_messages')
+    op.drop_table('chat_summaries')
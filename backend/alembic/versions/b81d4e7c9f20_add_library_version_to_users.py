@@ -0,0 +1,40 @@
+"""add library_version to users, saved_songs.date_saved NOT NULL
+
+Revision ID: b81d4e7c9f20
+Revises: 3c5e1f9a2b7d
+Create Date: 2026-10-19 11:03:27.884512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81d4e7c9f20'
+down_revision: Union[str, Sequence[str], None] = '3c5e1f9a2b7d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Версия библиотеки избранного для ETag у GET /media/saved-songs
+    op.add_column('users', sa.Column('library_version', sa.Integer(), nullable=False, server_default='0'))
+
+    # Курсор пагинации - (date_saved, id): старые строки без даты получают дату регистрации пользователя
+    op.execute(
+        "UPDATE saved_songs SET date_saved = COALESCE("
+        "(SELECT users.created_at FROM users WHERE users.id = saved_songs.user_id), CURRENT_TIMESTAMP) "
+        "WHERE date_saved IS NULL"
+    )
+    with op.batch_alter_table('saved_songs') as batch_op:
+        batch_op.alter_column('date_saved', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('saved_songs') as batch_op:
+        batch_op.alter_column('date_saved', existing_type=sa.DateTime(), nullable=True)
+    op.drop_column('users', 'library_version')
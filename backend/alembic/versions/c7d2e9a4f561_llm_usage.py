@@ -0,0 +1,50 @@
+"""llm usage accounting
+
+Revision ID: c7d2e9a4f561
+Revises: 9a6c4e2f1b83
+Create Date: 2026-10-19 20:02:37.508113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d2e9a4f561'
+down_revision: Union[str, Sequence[str], None] = '9a6c4e2f1b83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('llm_usage',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('endpoint', sa.String(length=64), nullable=True),
+    sa.Column('operation', sa.String(length=32), nullable=False),
+    sa.Column('backend', sa.String(length=32), nullable=True),
+    sa.Column('model', sa.String(length=64), nullable=True),
+    sa.Column('prompt_tokens', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('completion_tokens', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('cached_tokens', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('cost_usd', sa.Float(), nullable=True),
+    sa.Column('latency_ms', sa.Float(), nullable=True),
+    sa.Column('cache_hit', sa.Boolean(), nullable=False),
+    sa.Column('estimated', sa.Boolean(), nullable=False),
+    sa.Column('ok', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_llm_usage_created_at', 'llm_usage', ['created_at'], unique=False)
+    op.create_index('ix_llm_usage_user_created', 'llm_usage', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_llm_usage_user_created', table_name='llm_usage')
+    op.drop_index('ix_llm_usage_created_at', table_name='llm_usage')
+    op.drop_table('llm_usage')
@@ -0,0 +1,35 @@
+"""image analyses by perceptual hash
+
+Revision ID: d3f8b6a2c914
+Revises: c7d2e9a4f561
+Create Date: 2026-10-19 21:14:52.381907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f8b6a2c914'
+down_revision: Union[str, Sequence[str], None] = 'c7d2e9a4f561'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('image_analyses',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('image_hash', sa.BigInteger(), nullable=False),
+    sa.Column('language', sa.String(length=8), nullable=False),
+    sa.Column('analysis', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('image_analyses')
@@ -0,0 +1,57 @@
+"""create catalog_tracks and catalog_track_tags
+
+Revision ID: e4a7c2d9b315
+Revises: b81d4e7c9f20
+Create Date: 2026-10-19 12:20:05.310947
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c2d9b315'
+down_revision: Union[str, Sequence[str], None] = 'b81d4e7c9f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('catalog_tracks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('track_key', sa.String(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('artist', sa.String(), nullable=True),
+    sa.Column('youtube_video_id', sa.String(), nullable=True),
+    sa.Column('save_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('recommend_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('track_key')
+    )
+    op.create_index(op.f('ix_catalog_tracks_id'), 'catalog_tracks', ['id'], unique=False)
+    op.create_table('catalog_track_tags',
+    sa.Column('track_id', sa.Integer(), nullable=False),
+    sa.Column('tag', sa.String(), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['track_id'], ['catalog_tracks.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('track_id', 'tag')
+    )
+
+    # Наполняем каталог уже сохраненными песнями
+    op.execute("""
+        INSERT INTO catalog_tracks (track_key, title, artist, youtube_video_id, save_count, recommend_count)
+        SELECT dedup_key, MIN(title), MIN(artist), MIN(youtube_video_id), COUNT(*), 0
+        FROM saved_songs
+        GROUP BY dedup_key
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('catalog_track_tags')
+    op.drop_index(op.f('ix_catalog_tracks_id'), table_name='catalog_tracks')
+    op.drop_table('catalog_tracks')
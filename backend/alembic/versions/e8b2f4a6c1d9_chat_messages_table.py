@@ -0,0 +1,44 @@
+"""chat_messages table
+
+Revision ID: e8b2f4a6c1d9
+Revises: 4b9e1d7a3c28
+Create Date: 2026-10-19 23:12:40.381902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b2f4a6c1d9'
+down_revision: Union[str, Sequence[str], None] = '4b9e1d7a3c28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # chat_messages раньше создавалась только через create_all при импорте приложения;
+    # теперь схемой управляет только Alembic - на существующих базах таблица уже есть
+    if sa.inspect(op.get_bind()).has_table('chat_messages'):
+        return
+    op.create_table('chat_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('media_url', sa.String(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_chat_messages_id'), 'chat_messages', ['id'], unique=False)
+    op.create_index('ix_chat_messages_user_id_id', 'chat_messages', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Таблица могла существовать до этой ревизии - данные чата не удаляем
+    pass
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..dependencies import get_admin_user
+from ..models.user import User
+from ..services.image_hash import image_analysis_cache
+from ..services.usage import GROUP_COLUMNS, usage_summary
+
+router = APIRouter(tags=["admin"])
+
+
+@router.get("/usage")
+def get_llm_usage(
+    days: int = Query(7, ge=1, le=90),
+    group_by: str = Query("endpoint"),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Расход токенов и стоимость вызовов LLM за последние days дней.
+    group_by: endpoint, operation, model, backend, user или day; top_calls - самые дорогие вызовы
+    """
+    if group_by not in GROUP_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"group_by: одно из {', '.join(GROUP_COLUMNS)}")
+    return JSONResponse(content=usage_summary(db, days=days, group_by=group_by, limit=limit))
+
+
+@router.get("/image-dedup")
+def get_image_dedup_stats(admin: User = Depends(get_admin_user)):
+    """Повторное использование анализов изображений в этом воркере: размер индекса, доля попаданий, задержка поиска"""
+    return JSONResponse(content=image_analysis_cache.stats())
@@ -0,0 +1,30 @@
+# backend/app/api/audio.py
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, RedirectResponse
+
+from ..services.audio_cache import is_safe_filename
+from ..container import container
+
+router = APIRouter(tags=["audio"])
+
+
+@router.get("/{filename}")
+def get_cached_audio(filename: str):
+    """
+    Отдает файл по старой ссылке /audio_cache/{filename}: с локального диска
+    (шардированная раскладка) или редиректом на presigned-ссылку хранилища.
+    Обычная функция: запросы к S3 блокирующие, FastAPI выполняет ее в пуле потоков
+    """
+    if not is_safe_filename(filename):
+        raise HTTPException(status_code=400, detail="Недопустимое имя файла")
+
+    storage = container.audio_storage
+    file_path = storage.local_path(filename)
+    if file_path:
+        return FileResponse(path=file_path)
+
+    if storage.exists(filename):
+        return RedirectResponse(url=storage.url_for(filename), status_code=307)
+
+    raise HTTPException(status_code=404, detail="Файл не найден")
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Request, Depends
+from functools import lru_cache
 from fastapi.responses import JSONResponse
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
@@ -8,31 +9,33 @@ import os
 from app.config import FRONTEND_URL, BACKEND_BASE_URL   
 from ..database import get_db
 from ..models.user import User
-from app.services.auth_service import AuthService
 from ..dependencies import get_current_user
+from ..container import container
 
-from authlib.integrations.starlette_client import OAuth
-from authlib.integrations.base_client.errors import MismatchingStateError
 from app.config import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET
 
 router = APIRouter(tags=["auth"])
-auth_service = AuthService()
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-oauth = OAuth()
-oauth.register(
-    name='google',
-    client_id=GOOGLE_CLIENT_ID,
-    client_secret=GOOGLE_CLIENT_SECRET,
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={
-        'scope': 'openid email profile',
-        'prompt': 'select_account'  # Заставляем Google показывать выбор аккаунта
-    },
-)
+@lru_cache(maxsize=1)
+def get_google_oauth():
+    """OAuth-клиент Google (authlib) - регистрируется при первом обращении, не при импорте"""
+    from authlib.integrations.starlette_client import OAuth
+    oauth = OAuth()
+    oauth.register(
+        name='google',
+        client_id=GOOGLE_CLIENT_ID,
+        client_secret=GOOGLE_CLIENT_SECRET,
+        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+        client_kwargs={
+            'scope': 'openid email profile',
+            'prompt': 'select_account'  # Заставляем Google показывать выбор аккаунта
+        },
+    )
+    return oauth
 
 
 @router.get("/ngrok-url")
@@ -95,7 +98,7 @@ async def clerk_webhook(request: Request, db: Session = Depends(get_db)):
                 email_verified = primary_email.get("verification", {}).get("status") == "verified"
                 
                 # Создаем или обновляем пользователя
-                user = auth_service.create_or_update_clerk_user(
+                user = container.auth_service.create_or_update_clerk_user(
                     db=db,
                     clerk_id=clerk_id,
                     email=email,
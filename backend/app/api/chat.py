@@ -1,27 +1,32 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status, Form, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
-from typing import Dict, Any, List
+from fastapi.responses import JSONResponse, FileResponse, RedirectResponse, StreamingResponse
+from typing import Dict, Any, List, Optional
 import json
 import uuid
 import time
-import aiohttp
-from ..services.openai_service import OpenAIService
-from ..config import MAX_FILE_SIZE, ALLOWED_EXTENSIONS
-from ..dependencies import get_current_user
+from ..config import MAX_FILE_SIZE, ALLOWED_EXTENSIONS, AUDIO_CACHE_DIR, MAX_BATCH_FILES
+from ..services.audio_cache import is_safe_filename, public_url
+from ..services.catalog_service import mood_tags
+from ..services.candidate_retrieval import CANDIDATES_FOR_LLM, LOCAL_POOL_SIZE, merge_candidates, retrieval_engine
+from ..services.embedding_index import embedding_store
+from ..services.metrics import metrics
+from ..services.llm_limiter import priority_for
+from ..services.usage import bind_usage, usage_recorder
+from ..services.tokens import count_message_tokens
+from ..dependencies import get_current_user, get_optional_user
+from ..container import container
 from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models.user import SavedSong, User, ChatMessage
+from ..database import get_db, SessionLocal
+from ..models.user import User, ChatMessage
 from ..schemas import ChatMessageCreate, ChatMessageOut, GenerateBeatRequest, GenerateBeatResponse, GenerateBeatStatusRequest, RecommendationsRequest
 import asyncio
+import anyio
 import os
-import requests
 
 router = APIRouter(tags=["chat"])
 
-# Инициализируем сервисы
-openai_service = OpenAIService()
+# Сервисы OpenAI, вкусов, каталога, контекста чата и хранилище аудио - в container (создаются при первом запросе)
 
-AUDIO_CACHE_DIR = "audio_cache"
 os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
 
 @router.post("/analyze-media")
@@ -35,11 +40,10 @@ async def analyze_media(
     """
     Анализирует загруженный медиафайл и возвращает анализ настроения
     """
+    bind_usage(current_user, "/chat/analyze-media")
     try:
         # Проверяем лимиты использования
-        from ..services.auth_service import AuthService
-        auth_service = AuthService()
-        auth_service.check_usage_limit(db, current_user)
+        container.auth_service.check_usage_limit(db, current_user)
         
         print(f"🔍 Получен файл: {file.filename}, размер: {file.size}, тип: {file.content_type}, язык: {language}")
         
@@ -62,7 +66,7 @@ async def analyze_media(
         print("🚀 Начинаем анализ медиафайла...")
         
         # Анализируем медиафайл с учетом языка
-        analysis = await openai_service.analyze_media_mood(file, language=language)
+        analysis = await container.openai_service.analyze_media_mood(file, language=language, priority=priority_for(current_user))
         
         print(f"📊 Результат анализа: {analysis}")
         
@@ -75,38 +79,212 @@ async def analyze_media(
         print(f"❌ Ошибка в analyze_media: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка анализа файла: {str(e)}")
 
+@router.post("/analyze-media/batch")
+async def analyze_media_batch(
+    files: List[UploadFile] = File(...),
+    language: str = Form("ru"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Анализ нескольких изображений одной публикации (карусель): один Vision-запрос
+    на всю пачку, результат по каждому изображению и общий вайб (overall).
+    Дневной лимит списывается один раз на пачку.
+    """
+    bind_usage(current_user, "/chat/analyze-media/batch")
+    if not files:
+        raise HTTPException(status_code=400, detail="Не переданы файлы")
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Слишком много файлов (максимум {MAX_BATCH_FILES})")
+    for file in files:
+        if file.size and file.size > MAX_FILE_SIZE:
+            raise HTTPException(status_code=400, detail=f"Файл {file.filename} слишком большой (максимум 10MB)")
+        file_ext = '.' + (file.filename or '').split('.')[-1].lower()
+        if file_ext not in ALLOWED_EXTENSIONS or container.openai_service.get_file_type(file.filename) != "image":
+            raise HTTPException(status_code=400, detail=f"Файл {file.filename}: в пакетном анализе - только изображения")
+
+    # Файлы читаются параллельно, лимит проверяем до запроса к модели - один раз на пачку
+    contents = await asyncio.gather(*(file.read() for file in files))
+    if any(len(content) > MAX_FILE_SIZE for content in contents):
+        raise HTTPException(status_code=400, detail="Файл слишком большой (максимум 10MB)")
+
+    container.auth_service.check_usage_limit(db, current_user)
+
+    print(f"🔍 Пакетный анализ: {len(files)} изображений, язык: {language}")
+    start = time.perf_counter()
+    try:
+        analysis = await container.openai_service.analyze_images_batch(
+            [(content, file.filename) for content, file in zip(contents, files)],
+            language=language, priority=priority_for(current_user)
+        )
+    except Exception as e:
+        print(f"❌ Ошибка в analyze_media_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ошибка анализа файлов: {str(e)}")
+    metrics.observe("analyze_batch.ms", (time.perf_counter() - start) * 1000)
+    metrics.observe("analyze_batch.size", len(files))
+    return JSONResponse(content=analysis)
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _completed(value):
+    return value
+
+
+def _embed_mood(mood_analysis: Dict[str, Any]):
+    """Вектор настроения или None - без эмбеддинга рекомендации все равно работают"""
+    try:
+        return embedding_store.embed_mood(mood_analysis)
+    except Exception as e:
+        print(f"[EMBED] Не удалось получить эмбеддинг настроения: {e}")
+        return None
+
+
+def _record_recommendations(db: Session, mood_analysis: Dict[str, Any], results: List[Dict[str, Any]],
+                            mood_vector=None, embedding_candidates: List[Dict[str, Any]] = ()) -> None:
+    """Пополняет локальный каталог и индекс эмбеддингов ответами модели (локальные и запасные подборки не учитываются)"""
+    tracks = []
+    for result in results:
+        rec = result.get("recommendations") or {}
+        if rec.get("source") == "local" or rec.get("fallback"):
+            continue
+        llm_tracks = [t for t in rec.get("recommended_tracks") or [] if isinstance(t, dict)]
+        embedding_store.record_recall(embedding_candidates, llm_tracks)
+        tracks.extend(llm_tracks)
+    if not tracks:
+        return
+    try:
+        container.catalog_service.record_recommendations(db, tracks, mood_tags(mood_analysis))
+        embedding_store.record(db, mood_vector, tracks)
+    except Exception as e:
+        db.rollback()
+        print(f"[CATALOG] Не удалось обновить каталог: {e}")
+
+async def _stream_recommendation_events(db: Session, mood_analysis: Dict[str, Any], plans: List[tuple], language: str,
+                                        mood_vector, embedding_candidates: List[Dict[str, Any]], priority: int):
+    """
+    SSE-поток рекомендаций: track ({"list", "track"}) для каждого трека по мере генерации,
+    list_done ({"list", "recommendations"}) по завершении подборки, в конце done.
+    Подборки global и personal генерируются параллельно, их треки перемежаются.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce(name, prefs, candidates, local_rec):
+        try:
+            if local_rec is not None:
+                for track in local_rec["recommended_tracks"]:
+                    await queue.put(("track", name, track))
+                await queue.put(("list", name, local_rec))
+                return
+            async for event in container.openai_service.stream_music_recommendations(
+                mood_analysis, prefs, n_tracks=5, language=language, candidates=candidates, priority=priority
+            ):
+                if "track" in event:
+                    await queue.put(("track", name, event["track"]))
+                else:
+                    await queue.put(("list", name, event["recommendations"]))
+        except Exception as e:
+            await queue.put(("error", name, str(e)))
+
+    start = time.perf_counter()
+    first_track_ms = None
+    producers = [asyncio.create_task(produce(*plan)) for plan in plans]
+    results = {}
+    deadline = start + 60.0
+    try:
+        while len(results) < len(plans):
+            kind, name, data = await asyncio.wait_for(queue.get(), timeout=max(0.0, deadline - time.perf_counter()))
+            if kind == "track":
+                if first_track_ms is None:
+                    first_track_ms = (time.perf_counter() - start) * 1000
+                    metrics.observe("recommend.first_track_ms", first_track_ms)
+                yield _sse("track", {"list": name, "track": data})
+            elif kind == "list":
+                results[name] = data
+                yield _sse("list_done", {"list": name, "recommendations": data})
+            else:
+                results[name] = None
+                yield _sse("error", {"list": name, "detail": f"Ошибка получения рекомендаций: {data}"})
+        metrics.observe("recommend.stream_total_ms", (time.perf_counter() - start) * 1000)
+        _record_recommendations(db, mood_analysis, [{"recommendations": rec} for rec in results.values() if rec],
+                                mood_vector, embedding_candidates)
+        yield _sse("done", {"ask_feedback": True})
+    except asyncio.TimeoutError:
+        print("[RECOMMEND] Timeout от OpenAI при потоковой выдаче")
+        yield _sse("error", {"detail": "OpenAI API не отвечает. Попробуйте позже."})
+    finally:
+        # Отключение клиента или таймаут - обрываем незавершенные запросы к модели
+        for task in producers:
+            task.cancel()
+
 @router.post("/get-recommendations")
 async def get_music_recommendations(
     mood_analysis: Dict[str, Any],
     language: str = "ru",  # Добавляем параметр языка
+    stream: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Получает две подборки: 5 персональных (по saved_songs) и 5 глобальных (по mood_analysis)
+    Получает две подборки: 5 персональных (по saved_songs) и 5 глобальных (по mood_analysis).
+    stream=true - треки приходят по одному по мере генерации (text/event-stream)
     """
+    bind_usage(current_user, "/chat/get-recommendations")
     try:
         global_prefs = {
             "top_genres": ["pop", "electronic", "indie"],
             "top_artists": ["The Weeknd", "Dua Lipa", "Post Malone"],
             "top_tracks": ["Blinding Lights", "Levitating", "Circles"]
         }
-        saved_songs = db.query(SavedSong).filter(SavedSong.user_id == current_user.id).all()
-        personal_prefs = {
-            "top_genres": [],
-            "top_artists": list({s.artist for s in saved_songs if s.artist}),
-            "top_tracks": list({s.title for s in saved_songs if s.title})
-        } if saved_songs else global_prefs
+        # Компактный профиль вкуса (top-K исполнителей с затуханием) вместо всего избранного
+        personal_prefs = container.taste_profile_service.get_preferences(db, current_user) or global_prefs
         print(f"[RECOMMEND] mood_analysis: {mood_analysis}, language: {language}")
         print(f"[RECOMMEND] personal_prefs: {personal_prefs}")
+
+        # Предварительный отбор из локального каталога (теги + треки под похожие настроения):
+        # при уверенном совпадении модель не вызываем
+        await asyncio.to_thread(retrieval_engine.ensure_fresh)
+        mood_vector = await asyncio.to_thread(_embed_mood, mood_analysis)
+        embedding_pool = await asyncio.to_thread(embedding_store.similar_tracks, mood_vector, LOCAL_POOL_SIZE)
+        # Полнота эмбеддингов считается по тем кандидатам, что уходят в промпт
+        embedding_candidates = embedding_pool[:CANDIDATES_FOR_LLM]
+        plans = []
+        for name, prefs in (("global", global_prefs), ("personal", personal_prefs)):
+            # Решение без модели - по широкому пулу, в промпт - только лучшие из него
+            pool = merge_candidates(retrieval_engine.retrieve(mood_analysis, prefs), embedding_pool, k=LOCAL_POOL_SIZE)
+            candidates = pool[:CANDIDATES_FOR_LLM]
+            local_rec = retrieval_engine.local_recommendations(mood_analysis, pool, n_tracks=5, language=language)
+            if local_rec is not None:
+                # Подборка из каталога вместо вызова модели - учитываем как попадание в кеш
+                usage_recorder.record("recommendations", cache_hit=True)
+            plans.append((name, prefs, candidates, local_rec))
+
+        if stream:
+            return StreamingResponse(
+                _stream_recommendation_events(db, mood_analysis, plans, language, mood_vector, embedding_candidates,
+                                              priority_for(current_user)),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        tasks = []
+        for _, prefs, candidates, local_rec in plans:
+            if local_rec is not None:
+                tasks.append(_completed({"success": True, "recommendations": local_rec}))
+            else:
+                tasks.append(container.openai_service.get_music_recommendations(
+                    mood_analysis, prefs, n_tracks=5, language=language, candidates=candidates,
+                    priority=priority_for(current_user)
+                ))
         try:
             print("[RECOMMEND] Запрашиваем рекомендации у OpenAI...")
-            global_task = openai_service.get_music_recommendations(mood_analysis, global_prefs, n_tracks=5, language=language)
-            personal_task = openai_service.get_music_recommendations(mood_analysis, personal_prefs, n_tracks=5, language=language)
             global_rec, personal_rec = await asyncio.wait_for(
-                asyncio.gather(global_task, personal_task), timeout=60.0
+                asyncio.gather(*tasks), timeout=60.0
             )
             print(f"[RECOMMEND] Ответ OpenAI: global={global_rec}, personal={personal_rec}")
+            _record_recommendations(db, mood_analysis, [global_rec, personal_rec], mood_vector, embedding_candidates)
             return JSONResponse(content={
                 "global": global_rec["recommendations"],
                 "personal": personal_rec["recommendations"],
@@ -122,50 +300,92 @@ async def get_music_recommendations(
         print(f"[RECOMMEND] Ошибка получения рекомендаций: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка получения рекомендаций: {str(e)}")
 
+def _summarize_history(user_id: int) -> None:
+    """Фоновое сворачивание старой переписки в резюме (своя сессия БД)"""
+    bind_usage(user_id, "/chat/chat")
+    db = SessionLocal()
+    try:
+        container.chat_context_service.summarize(db, user_id)
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ [CHAT] Не удалось обновить резюме пользователя {user_id}: {e}")
+    finally:
+        db.close()
+
+
+async def _stream_chat_events(messages: List[Dict[str, str]], priority: int):
+    """
+    SSE-поток ответа: события token ({"delta"}), затем done ({"ttft_ms", "total_ms"}) или error.
+    При отключении клиента Starlette отменяет генератор, и запрос к провайдеру обрывается.
+    """
+    start = time.perf_counter()
+    ttft_ms = None
+    completed = False
+    chunks = container.openai_service.stream_chat_completion(messages, max_tokens=300, priority=priority)
+    try:
+        async for delta in chunks:
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start) * 1000
+                metrics.observe("chat.ttft_ms", ttft_ms)
+            yield _sse("token", {"delta": delta})
+        completed = True
+        total_ms = (time.perf_counter() - start) * 1000
+        metrics.observe("chat.stream_total_ms", total_ms)
+        print(f"[CHAT] Поток завершен: TTFT {ttft_ms or 0:.0f}ms, всего {total_ms:.0f}ms")
+        yield _sse("done", {"ttft_ms": round(ttft_ms or 0, 1), "total_ms": round(total_ms, 1)})
+    except Exception as e:
+        completed = True
+        metrics.incr("chat.stream_errors")
+        print(f"❌ [CHAT] Ошибка потока: {e}")
+        yield _sse("error", {"detail": f"Ошибка чата: {str(e)}"})
+    finally:
+        if not completed:
+            metrics.incr("chat.stream_cancelled")
+            print(f"[CHAT] Клиент отключился через {(time.perf_counter() - start) * 1000:.0f}ms, обрываем запрос к модели")
+        # Закрываем upstream даже под отменой - иначе соединение с провайдером доживет до конца генерации
+        with anyio.CancelScope(shield=True):
+            await chunks.aclose()
+
+
 @router.post("/chat")
 async def chat_with_ai(
     message: str,
+    background_tasks: BackgroundTasks,
     mood_analysis: Dict[str, Any] = None,
-    user_id: str = None
+    user_id: str = None,
+    stream: bool = False,
+    language: str = "ru",
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_optional_user)
 ):
     """
-    Общий чат с ИИ для обсуждения музыки и настроения
+    Общий чат с ИИ для обсуждения музыки и настроения.
+    Для авторизованного пользователя в контекст входят резюме и последние сообщения из истории.
+    stream=true - ответ приходит по мере генерации (text/event-stream)
     """
+    bind_usage(current_user, "/chat/chat")
+    messages, needs_summary = container.chat_context_service.build_messages(
+        db, current_user.id if current_user else None, message, mood_analysis, language
+    )
+    metrics.observe("chat.context_tokens", count_message_tokens(messages, container.openai_service.chat_model))
+    if needs_summary:
+        background_tasks.add_task(_summarize_history, current_user.id)
+    if stream:
+        return StreamingResponse(
+            _stream_chat_events(messages, priority_for(current_user)),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
     try:
-        # Формируем контекст для ИИ
-        context = f"""
-        Ты музыкальный эксперт и помощник по подбору музыки. 
-        Пользователь написал: "{message}"
-        """
-        
-        if mood_analysis:
-            context += f"""
-            Контекст анализа настроения:
-            - Настроение: {mood_analysis.get('mood', 'neutral')}
-            - Описание: {mood_analysis.get('description', '')}
-            - Эмоции: {mood_analysis.get('emotions', [])}
-            """
-        
-        context += """
-        Ответь дружелюбно и помоги пользователю с музыкальными рекомендациями.
-        Можешь предложить жанры, исполнителей или обсудить музыкальные предпочтения.
-        """
-        
-        # Выбираем модель в зависимости от провайдера
-        if openai_service.use_azure:
-            model = openai_service.deployment_name
-        else:
-            model = "gpt-4"
-        
+        start = time.perf_counter()
         # Получаем ответ от ИИ
-        response = openai_service.client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Ты дружелюбный музыкальный эксперт, который помогает людям находить музыку по настроению."},
-                {"role": "user", "content": context}
-            ],
+        response = await container.openai_service.router.complete(
+            messages=messages,
+            priority=priority_for(current_user),
             max_tokens=300
         )
+        metrics.observe("chat.total_ms", (time.perf_counter() - start) * 1000)
         
         ai_response = response.choices[0].message.content
         
@@ -206,9 +426,11 @@ def delete_chat_history(db: Session = Depends(get_db), current_user: User = Depe
     db.commit()
     return None
 
-async def _run_riffusion_generation(prompt: str, request_id: str):
+def _run_riffusion_generation(prompt: str, request_id: str):
     """
     Фоновая задача для генерации и скачивания музыки.
+    Обычная функция: HTTP-запросы, ожидание и запись в хранилище блокирующие,
+    Starlette выполняет ее в пуле потоков, а не в event loop.
     """
     try:
         print(f"🎵 [BG] Starting generation for request_id: {request_id}, prompt: {prompt}")
@@ -216,8 +438,7 @@ async def _run_riffusion_generation(prompt: str, request_id: str):
         RIFFUSION_API_KEY = os.getenv("RIFFUSION_API_KEY")
         if not RIFFUSION_API_KEY:
             print("❌ RIFFUSION_API_KEY не задан для фоновой задачи")
-            with open(os.path.join(AUDIO_CACHE_DIR, f"{request_id}.error"), "w") as f:
-                f.write("Server not configured for music generation.")
+            container.audio_storage.write_text(f"{request_id}.error", "Server not configured for music generation.")
             return
 
         # --- 1. Отправка запроса на генерацию ---
@@ -230,15 +451,14 @@ async def _run_riffusion_generation(prompt: str, request_id: str):
         data = {"prompt": prompt}
 
         print(f"🎵 [BG] Sending initial request to Riffusion API...")
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        response = container.http.post(url, headers=headers, json=data, timeout=30)
         print(f"🎵 [BG] Initial response status: {response.status_code}")
         print(f"🎵 [BG] Initial response body: {response.text}")
         
         if response.status_code != 200:
             error_text = response.text
             print(f"❌ [BG] API Error: {error_text}")
-            with open(os.path.join(AUDIO_CACHE_DIR, f"{request_id}.error"), "w") as f:
-                f.write(f"API Error: {error_text}")
+            container.audio_storage.write_text(f"{request_id}.error", f"API Error: {error_text}")
             return
             
         initial_result = response.json()
@@ -248,8 +468,7 @@ async def _run_riffusion_generation(prompt: str, request_id: str):
         riffusion_request_id = initial_result.get("request_id")
         if not riffusion_request_id:
             print("❌ [BG] No request_id in response")
-            with open(os.path.join(AUDIO_CACHE_DIR, f"{request_id}.error"), "w") as f:
-                f.write("Failed to get request_id from API")
+            container.audio_storage.write_text(f"{request_id}.error", "Failed to get request_id from API")
             return
 
         # --- 2. Ожидание завершения генерации (Polling) ---
@@ -264,14 +483,13 @@ async def _run_riffusion_generation(prompt: str, request_id: str):
             print(f"🎵 [BG] Checking status for request_id: {riffusion_request_id} (elapsed: {elapsed}s)")
             
             # Save progress status
-            with open(os.path.join(AUDIO_CACHE_DIR, f"{request_id}.status"), "w") as f:
-                f.write(json.dumps({
-                    "status": "generating",
-                    "elapsed": elapsed,
-                    "progress": min(int((elapsed / max_wait_time) * 100), 95)
-                }))
+            container.audio_storage.write_text(f"{request_id}.status", json.dumps({
+                "status": "generating",
+                "elapsed": elapsed,
+                "progress": min(int((elapsed / max_wait_time) * 100), 95)
+            }))
             
-            status_resp = requests.post(status_url, headers=headers, json=status_data, timeout=30)
+            status_resp = container.http.post(status_url, headers=headers, json=status_data, timeout=30)
             print(f"🎵 [BG] Status check response: {status_resp.status_code}")
             print(f"🎵 [BG] Status check body: {status_resp.text}")
             
@@ -285,21 +503,21 @@ async def _run_riffusion_generation(prompt: str, request_id: str):
                     if audio_url:
                         print(f"🎵 [BG] Audio URL received: {audio_url}")
                         # --- 3. Скачивание файла ---
-                        audio_resp = requests.get(audio_url, timeout=120)
+                        # Качаем потоком: файл не держится целиком в памяти и сразу уходит в хранилище
+                        audio_resp = container.http.get(audio_url, timeout=120, stream=True)
                         if audio_resp.status_code == 200:
                             filename = f"{request_id}.mp3"
-                            file_path = os.path.join(AUDIO_CACHE_DIR, filename)
-                            with open(file_path, "wb") as f:
-                                f.write(audio_resp.content)
-                            print(f"✅ [BG] File saved: {file_path}")
+                            audio_resp.raw.decode_content = True
+                            with audio_resp:
+                                container.audio_storage.save_stream(filename, audio_resp.raw)
+                            print(f"✅ [BG] File saved: {filename}")
                             
                             # Update final status
-                            with open(os.path.join(AUDIO_CACHE_DIR, f"{request_id}.status"), "w") as f:
-                                f.write(json.dumps({
-                                    "status": "complete",
-                                    "elapsed": elapsed,
-                                    "progress": 100
-                                }))
+                            container.audio_storage.write_text(f"{request_id}.status", json.dumps({
+                                "status": "complete",
+                                "elapsed": elapsed,
+                                "progress": 100
+                            }))
                             return
                         else:
                             error_msg = f"Failed to download audio: {audio_resp.status_code}"
@@ -322,17 +540,18 @@ async def _run_riffusion_generation(prompt: str, request_id: str):
 
     except Exception as e:
         print(f"❌ [BG] Error in background task {request_id}: {str(e)}")
-        with open(os.path.join(AUDIO_CACHE_DIR, f"{request_id}.error"), "w") as f:
-            f.write(str(e))
-        with open(os.path.join(AUDIO_CACHE_DIR, f"{request_id}.status"), "w") as f:
-            f.write(json.dumps({
-                "status": "error",
-                "error": str(e),
-                "elapsed": int(time.time() - start_time) if 'start_time' in locals() else 0
-            }))
+        container.audio_storage.write_text(f"{request_id}.error", str(e))
+        container.audio_storage.write_text(f"{request_id}.status", json.dumps({
+            "status": "error",
+            "error": str(e),
+            "elapsed": int(time.time() - start_time) if 'start_time' in locals() else 0
+        }))
+
+# Обработчики ниже читают и пишут хранилище аудио (в режиме S3 - сетевые запросы boto3),
+# поэтому они обычные функции: FastAPI выполняет их в пуле потоков
 
 @router.post("/generate-beat", response_model=GenerateBeatResponse)
-async def generate_beat(request: GenerateBeatRequest, background_tasks: BackgroundTasks):
+def generate_beat(request: GenerateBeatRequest, background_tasks: BackgroundTasks):
     """
     Запускает фоновую задачу для генерации музыки через Riffusion.
     """
@@ -352,12 +571,11 @@ async def generate_beat(request: GenerateBeatRequest, background_tasks: Backgrou
         print(f"🎵 Generated request_id: {request_id}")
 
         # Create initial status file
-        with open(os.path.join(AUDIO_CACHE_DIR, f"{request_id}.status"), "w") as f:
-            f.write(json.dumps({
-                "status": "starting",
-                "elapsed": 0,
-                "progress": 0
-            }))
+        container.audio_storage.write_text(f"{request_id}.status", json.dumps({
+            "status": "starting",
+            "elapsed": 0,
+            "progress": 0
+        }))
 
         # Start background task
         print(f"🎵 Starting background task for request_id: {request_id}")
@@ -375,36 +593,32 @@ async def generate_beat(request: GenerateBeatRequest, background_tasks: Backgrou
         raise HTTPException(status_code=500, detail=f"Failed to start generation: {str(e)}")
 
 @router.post("/generate-beat/status")
-async def check_generation_status(request: GenerateBeatStatusRequest):
+def check_generation_status(request: GenerateBeatStatusRequest):
     """
     Проверяет статус генерации музыки по наличию файла в кеше.
     """
     try:
         request_id = request.request_id
-        if not request_id:
+        if not request_id or not is_safe_filename(request_id):
             return JSONResponse(status_code=400, content={"success": False, "error": "request_id не указан"})
         
         # Проверяем файл с ошибкой
-        error_file = os.path.join(AUDIO_CACHE_DIR, f"{request_id}.error")
-        if os.path.exists(error_file):
-            with open(error_file, "r") as f:
-                error_msg = f.read()
+        error_msg = container.audio_storage.read_text(f"{request_id}.error")
+        if error_msg is not None:
             return JSONResponse(content={"success": False, "status": "failed", "error": error_msg})
         
         # Проверяем готовый mp3 файл
-        success_file = os.path.join(AUDIO_CACHE_DIR, f"{request_id}.mp3")
-        if os.path.exists(success_file):
+        if container.audio_storage.exists(f"{request_id}.mp3"):
             return JSONResponse(content={
                 "success": True, 
                 "status": "complete",
-                "local_audio_url": f"/audio_cache/{request_id}.mp3"
+                "local_audio_url": public_url(f"{request_id}.mp3")
             })
         
         # Проверяем файл статуса
-        status_file = os.path.join(AUDIO_CACHE_DIR, f"{request_id}.status")
-        if os.path.exists(status_file):
-            with open(status_file, "r") as f:
-                status_data = json.loads(f.read())
+        status_text = container.audio_storage.read_text(f"{request_id}.status")
+        if status_text is not None:
+            status_data = json.loads(status_text)
             return JSONResponse(content={"success": True, **status_data})
         
         # Если нет ни одного файла статуса
@@ -418,18 +632,24 @@ async def check_generation_status(request: GenerateBeatStatusRequest):
         )
 
 @router.get("/download-beat/{filename}")
-async def download_beat(filename: str):
+def download_beat(filename: str):
     """
     Скачивает сгенерированную музыку
     """
     try:
         # Проверяем безопасность имени файла
-        if ".." in filename or "/" in filename or "\\" in filename:
+        if not is_safe_filename(filename):
             raise HTTPException(status_code=400, detail="Недопустимое имя файла")
         
         # Проверяем что файл существует
-        file_path = os.path.join(AUDIO_CACHE_DIR, filename)
-        if not os.path.exists(file_path):
+        file_path = container.audio_storage.local_path(filename)
+        if not file_path:
+            if container.audio_storage.exists(filename):
+                # Файл во внешнем хранилище - отдаем ссылку, байты не идут через API
+                return RedirectResponse(
+                    url=container.audio_storage.url_for(filename, download_name=f"aivi_generated_music_{filename}"),
+                    status_code=307
+                )
             raise HTTPException(status_code=404, detail="Файл не найден")
         
         # Определяем MIME тип
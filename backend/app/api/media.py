@@ -1,77 +1,88 @@
 # backend/app/api/media.py
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models.user import SavedSong as DBSavedSong, User
-from app.schemas import SavedSong as SavedSongSchema, SavedSongCreate
-from typing import List
-from datetime import datetime
+from app.models.user import User
+from app.schemas import (SavedSong as SavedSongSchema, SavedSongCreate,
+                         SavedSongsBulkCreate, SavedSongsBulkDelete, SavedSongsBulkResult)
+from app.services.saved_songs_service import InvalidCursorError, library_etag
+from app.services.http_cache import etag_matches
+from typing import List, Optional
 
 # Используем правильную функцию из dependencies
 from app.dependencies import get_current_user
+from app.container import container
 
 router = APIRouter()
 
+MAX_PAGE_SIZE = 500
+
+
 # Здесь будут только эндпоинты, связанные с загрузкой/анализом медиафайлов пользователя, без Spotify/Deezer/Last.fm
 
 @router.get("/saved-songs", response_model=List[SavedSongSchema])
-def get_saved_songs(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    songs = db.query(DBSavedSong).filter(DBSavedSong.user_id == current_user.id).order_by(DBSavedSong.date_saved.desc()).all()
-    print(f"🎵 [BACKEND] Fetching saved songs for user_id={current_user.id}: {len(songs)} songs found")
-    for song in songs:
-        print(f"  - {song.title} by {song.artist} (video_id: {song.youtube_video_id})")
+def get_saved_songs(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Избранное пользователя. Без limit - вся библиотека (как раньше),
+    с limit - страница и курсор следующей страницы в заголовке X-Next-Cursor.
+    Если библиотека не менялась (If-None-Match совпал с ETag) - 304 без запроса песен.
+    """
+    etag = library_etag(current_user)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    try:
+        songs, next_cursor = container.saved_songs_service.list_songs(db, current_user.id, limit=limit, cursor=cursor)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    response.headers.update(cache_headers)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return songs
 
 @router.post("/saved-songs", response_model=SavedSongSchema, status_code=status.HTTP_201_CREATED)
 def add_saved_song(song: SavedSongCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    print(f"🎵 [BACKEND] Attempting to save song: title='{song.title}', artist='{song.artist}', video_id='{song.youtube_video_id}' for user_id={current_user.id}")
-    
-    # Проверяем, не сохранена ли уже эта песня у данного пользователя
-    # Сначала проверяем по video_id
-    existing_song_by_video = db.query(DBSavedSong).filter(
-        DBSavedSong.user_id == current_user.id,
-        DBSavedSong.youtube_video_id == song.youtube_video_id
-    ).first()
-    
-    # Также проверяем по title и artist, чтобы избежать дубликатов одной песни с разными video_id
-    existing_song_by_title = db.query(DBSavedSong).filter(
-        DBSavedSong.user_id == current_user.id,
-        DBSavedSong.title == song.title,
-        DBSavedSong.artist == song.artist
-    ).first()
-    
-    if existing_song_by_video:
-        print(f"⚠️ [BACKEND] Song already exists by video_id: {existing_song_by_video.title} by {existing_song_by_video.artist}")
-    
-    if existing_song_by_title:
-        print(f"⚠️ [BACKEND] Song already exists by title/artist: {existing_song_by_title.title} by {existing_song_by_title.artist} (video_id: {existing_song_by_title.youtube_video_id})")
-    
-    if existing_song_by_video or existing_song_by_title:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT, 
-            detail="Эта песня уже сохранена в избранном"
-        )
-    
-    db_song = DBSavedSong(
+    # Дубликаты по video_id и по названию/исполнителю отсекаются одним INSERT ... ON CONFLICT DO NOTHING
+    db_song = container.saved_songs_service.add_song(
+        db,
         user_id=current_user.id,
         youtube_video_id=song.youtube_video_id,
         title=song.title,
         artist=song.artist,
-        date_saved=datetime.utcnow()
     )
-    db.add(db_song)
-    db.commit()
-    db.refresh(db_song)
-    
-    print(f"✅ [BACKEND] Song saved successfully: {db_song.title} by {db_song.artist} (video_id: {db_song.youtube_video_id})")
+    if db_song is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, 
+            detail="Эта песня уже сохранена в избранном"
+        )
     return db_song
 
 @router.delete("/saved-songs/{youtube_video_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_saved_song(youtube_video_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    db_song = db.query(DBSavedSong).filter(DBSavedSong.user_id == current_user.id, DBSavedSong.youtube_video_id == youtube_video_id).first()
-    if not db_song:
+    if not container.saved_songs_service.delete_song(db, current_user.id, youtube_video_id):
         raise HTTPException(status_code=404, detail="Song not found")
-    db.delete(db_song)
-    db.commit()
     return None
+
+@router.post("/saved-songs/bulk", response_model=SavedSongsBulkResult)
+def bulk_add_saved_songs(payload: SavedSongsBulkCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Импорт пачки песен (например, плейлиста) одной транзакцией; дубликаты пропускаются"""
+    results = container.saved_songs_service.bulk_add(db, current_user.id, [song.model_dump() for song in payload.songs])
+    created = sum(1 for r in results if r["status"] == "created")
+    return {"results": results, "created": created, "skipped": len(results) - created}
+
+@router.post("/saved-songs/bulk-delete", response_model=SavedSongsBulkResult)
+def bulk_delete_saved_songs(payload: SavedSongsBulkDelete, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Удаление пачки песен по youtube_video_id одной транзакцией"""
+    results = container.saved_songs_service.bulk_delete(db, current_user.id, payload.youtube_video_ids)
+    deleted = sum(1 for r in results if r["status"] == "deleted")
+    return {"results": results, "deleted": deleted, "skipped": len(results) - deleted}
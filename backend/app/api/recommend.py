@@ -6,31 +6,29 @@ import logging
 import random
 import string
 from fastapi import APIRouter, HTTPException, Depends, Request, Query
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, RedirectResponse
 from sqlalchemy.orm import Session
-import yt_dlp
-from yt_dlp.utils import ExtractorError, DownloadError
 from pydantic import BaseModel
 
 from ..dependencies import get_current_user
 from ..models.user import User
 from ..database import get_db
-from ..services.auth_service import AuthService
+from ..services.audio_cache import find_cached_audio, shard_dir, is_safe_filename
+from ..container import container
+from ..config import AUDIO_CACHE_DIR
 
 log = logging.getLogger(__name__)
 
 recommend_router = APIRouter()
-auth_service = AuthService()
 
-AUDIO_CACHE_DIR = "audio_cache"
 if not os.path.exists(AUDIO_CACHE_DIR):
     os.makedirs(AUDIO_CACHE_DIR)
 
-def _get_robust_yt_dlp_options():
+def _get_robust_yt_dlp_options(video_id: str):
     """Возвращает максимально совместимые опции для yt-dlp."""
     return {
         'format': 'bestaudio/best',
-        'outtmpl': os.path.join(AUDIO_CACHE_DIR, '%(id)s.%(ext)s'),
+        'outtmpl': os.path.join(shard_dir(video_id, create=True), '%(id)s.%(ext)s'),
         'noplaylist': True,
         'no_warnings': True,
         'quiet': True,
@@ -56,30 +54,35 @@ def _get_robust_yt_dlp_options():
     }
 
 def _download_youtube_audio(video_id: str) -> str:
-    """Скачивает аудио с YouTube с максимальной совместимостью."""
+    """
+    Скачивает аудио с YouTube с максимальной совместимостью.
+    Возвращает имя файла в хранилище аудио.
+    """
     log.info(f"🎵 Starting download for {video_id}")
     
     video_url = f"https://www.youtube.com/watch?v={video_id}"
     
     # Проверяем разные форматы файлов в кеше
-    for ext in ['m4a', 'mp3', 'webm', 'mp4']:
-        cached_file = os.path.join(AUDIO_CACHE_DIR, f"{video_id}.{ext}")
-        if os.path.exists(cached_file):
-            log.info(f"✅ Found cached file: {cached_file}")
-            return cached_file
+    cached_file = container.audio_storage.find_audio(video_id)
+    if cached_file:
+        log.info(f"✅ Found cached file: {cached_file}")
+        return cached_file
+    
+    # yt_dlp тяжелый - импортируется при первом скачивании, а не при старте приложения
+    import yt_dlp
     
     # Пробуем скачать с разными стратегиями
     strategies = [
         # Стратегия 1: Базовая
         {
             'name': 'basic',
-            'options': _get_robust_yt_dlp_options()
+            'options': _get_robust_yt_dlp_options(video_id)
         },
         # Стратегия 2: Только web клиент
         {
             'name': 'web_only',
             'options': {
-                **_get_robust_yt_dlp_options(),
+                **_get_robust_yt_dlp_options(video_id),
                 'extractor_args': {
                     'youtube': {
                         'player_client': ['web'],
@@ -93,7 +96,7 @@ def _download_youtube_audio(video_id: str) -> str:
             'name': 'minimal',
             'options': {
                 'format': 'worst[ext=mp4]/worst',
-                'outtmpl': os.path.join(AUDIO_CACHE_DIR, '%(id)s.%(ext)s'),
+                'outtmpl': os.path.join(shard_dir(video_id, create=True), '%(id)s.%(ext)s'),
                 'noplaylist': True,
                 'quiet': True,
                 'no_warnings': True,
@@ -119,11 +122,13 @@ def _download_youtube_audio(video_id: str) -> str:
                     ydl.download([video_url])
                     
                     # Ищем скачанный файл
-                    for ext in ['m4a', 'mp3', 'webm', 'mp4']:
-                        downloaded_file = os.path.join(AUDIO_CACHE_DIR, f"{video_id}.{ext}")
-                        if os.path.exists(downloaded_file):
-                            log.info(f"✅ Successfully downloaded: {downloaded_file}")
-                            return downloaded_file
+                    downloaded_file = find_cached_audio(video_id)
+                    if downloaded_file:
+                        log.info(f"✅ Successfully downloaded: {downloaded_file}")
+                        # yt-dlp пишет на локальный диск; переносим файл в хранилище
+                        filename = os.path.basename(downloaded_file)
+                        container.audio_storage.save_file(filename, downloaded_file)
+                        return filename
                     
                     log.warning(f"⚠️ Strategy {strategy['name']} completed but no file found")
                     
@@ -143,18 +148,25 @@ def _download_youtube_audio(video_id: str) -> str:
     )
 
 @recommend_router.get("/youtube-audio")
-async def get_youtube_audio(video_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """Временно отключено из-за блокировки YouTube."""
+def get_youtube_audio(video_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Временно отключено из-за блокировки YouTube.
+    Обычная функция: поиск в хранилище (S3 - запросы boto3) выполняется в пуле потоков."""
     
+    if not is_safe_filename(video_id):
+        raise HTTPException(status_code=400, detail="Invalid video_id")
+
     # Проверяем кеш - может быть есть уже скачанные файлы
-    for ext in ['m4a', 'mp3', 'webm', 'mp4']:
-        cached_file = os.path.join(AUDIO_CACHE_DIR, f"{video_id}.{ext}")
-        if os.path.exists(cached_file):
-            log.info(f"✅ Found cached file: {cached_file}")
-            def iterfile():
-                with open(cached_file, mode="rb") as file_like:
-                    yield from file_like
-            return StreamingResponse(iterfile(), media_type="audio/mp4")
+    cached_name = container.audio_storage.find_audio(video_id)
+    if cached_name:
+        log.info(f"✅ Found cached file: {cached_name}")
+        cached_file = container.audio_storage.local_path(cached_name)
+        if not cached_file:
+            # Файл во внешнем хранилище - редирект на presigned-ссылку
+            return RedirectResponse(url=container.audio_storage.url_for(cached_name), status_code=307)
+        def iterfile():
+            with open(cached_file, mode="rb") as file_like:
+                yield from file_like
+        return StreamingResponse(iterfile(), media_type="audio/mp4")
     
     # Если в кеше нет - возвращаем ошибку с понятным сообщением
     log.warning(f"⚠️ Audio download temporarily disabled due to YouTube restrictions for video: {video_id}")
@@ -167,6 +179,8 @@ async def get_youtube_audio(video_id: str, db: Session = Depends(get_db), curren
 async def search_youtube(q: str, max_results: int = 5):
     """Поиск видео на YouTube."""
     try:
+        import yt_dlp
+        
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
@@ -1,43 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import JWTError, jwt
 from sqlalchemy.orm import Session
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
+from typing import Optional
 import os
 from ..database import get_db
 from ..models.user import User
 from ..schemas import (UserCreate, UserLogin, Token, User as UserSchema, 
                       EmailVerification, ResendVerification, VerificationRequired,
                       GoogleAuthRequest, UserProfileUpdate)
-from ..services.auth_service import AuthService
+from ..services.throttle import throttle
+from ..services.profile_cache import profile_cache
+from ..services.http_cache import etag_matches
 from ..dependencies import get_current_user
+from ..container import container
 
 router = APIRouter(tags=["users"])
 security = HTTPBearer()
-auth_service = AuthService()
 
 # Google OAuth configuration
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 
 @router.post("/register", response_model=Token)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, request: Request, db: Session = Depends(get_db)):
     """Регистрация нового пользователя с email verification"""
+    await throttle.check(request, "register")
+    
     # Проверяем, существует ли пользователь с таким email
-    if auth_service.get_user_by_email(db, user_data.email):
+    if container.auth_service.get_user_by_email(db, user_data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким email уже существует"
         )
     
     # Проверяем, существует ли пользователь с таким username
-    if auth_service.get_user_by_username(db, user_data.username):
+    if container.auth_service.get_user_by_username(db, user_data.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким именем уже существует"
         )
     
     # Создаем нового пользователя с verification
-    user, verification_code = auth_service.create_user_with_verification(
+    user, verification_code = await container.auth_service.create_user_with_verification(
         db, user_data.email, user_data.username, user_data.password
     )
     
@@ -52,16 +58,19 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
 @router.post("/verify-email", response_model=Token)
-async def verify_email(verification_data: EmailVerification, db: Session = Depends(get_db)):
+async def verify_email(verification_data: EmailVerification, request: Request, db: Session = Depends(get_db)):
     """Подтверждение email адреса"""
-    if not auth_service.verify_email_code(db, verification_data.email, verification_data.verification_code):
+    await throttle.check(request, "verify_email", verification_data.email)
+    
+    if not container.auth_service.verify_email_code(db, verification_data.email, verification_data.verification_code):
+        await throttle.failed("verify_email", verification_data.email)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный или истекший код подтверждения"
         )
     
     # Get verified user
-    user = auth_service.get_user_by_email(db, verification_data.email)
+    user = container.auth_service.get_user_by_email(db, verification_data.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -69,7 +78,7 @@ async def verify_email(verification_data: EmailVerification, db: Session = Depen
         )
     
     # Create access token
-    access_token = auth_service.create_access_token(data={"sub": user.username})
+    access_token = container.auth_service.create_access_token(data={"sub": user.username})
     
     return Token(
         access_token=access_token,
@@ -78,9 +87,11 @@ async def verify_email(verification_data: EmailVerification, db: Session = Depen
     )
 
 @router.post("/resend-verification")
-async def resend_verification_code(resend_data: ResendVerification, db: Session = Depends(get_db)):
+async def resend_verification_code(resend_data: ResendVerification, request: Request, db: Session = Depends(get_db)):
     """Повторная отправка кода подтверждения"""
-    if not auth_service.resend_verification_code(db, resend_data.email):
+    await throttle.check(request, "resend_verification", resend_data.email)
+    
+    if not container.auth_service.resend_verification_code(db, resend_data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь не найден или уже подтвержден"
@@ -99,10 +110,14 @@ async def google_auth(auth_data: GoogleAuthRequest, db: Session = Depends(get_db
                 detail="Google OAuth не настроен"
             )
         
+        # google-auth нужен только этому эндпоинту
+        from google.oauth2 import id_token
+        from google.auth.transport import requests as google_requests
+        
         # Verify the token
         idinfo = id_token.verify_oauth2_token(
             auth_data.token, 
-            google_requests.Request(), 
+            google_requests.Request(session=container.http), 
             GOOGLE_CLIENT_ID
         )
         
@@ -113,7 +128,7 @@ async def google_auth(auth_data: GoogleAuthRequest, db: Session = Depends(get_db
         avatar_url = idinfo.get('picture', '')
         
         # Create or update user
-        user = auth_service.create_or_update_google_user(
+        user = container.auth_service.create_or_update_google_user(
             db=db,
             google_id=google_id,
             email=email,
@@ -122,7 +137,7 @@ async def google_auth(auth_data: GoogleAuthRequest, db: Session = Depends(get_db
         )
         
         # Create access token
-        access_token = auth_service.create_access_token(data={"sub": user.username})
+        access_token = container.auth_service.create_access_token(data={"sub": user.username})
         
         return Token(
             access_token=access_token,
@@ -144,10 +159,13 @@ async def google_auth(auth_data: GoogleAuthRequest, db: Session = Depends(get_db
         )
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, request: Request, db: Session = Depends(get_db)):
     """Вход пользователя"""
-    user = auth_service.authenticate_user(db, user_data.email, user_data.password)
+    # Лимит проверяется до bcrypt и запросов в БД; по email считаются только неверные пароли
+    await throttle.check(request, "login", user_data.email)
+    user = await container.auth_service.authenticate_user(db, user_data.email, user_data.password)
     if not user:
+        await throttle.failed("login", user_data.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
@@ -165,8 +183,11 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
             }
         )
     
+    # Успешный вход - неудачные попытки по этому email больше не считаются
+    await throttle.reset("login", user_data.email)
+    
     # Создаем токен доступа
-    access_token = auth_service.create_access_token(data={"sub": user.username})
+    access_token = container.auth_service.create_access_token(data={"sub": user.username})
     
     return Token(
         access_token=access_token,
@@ -174,28 +195,55 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
         user=UserSchema.from_orm(user)
     )
 
+def _profile(db: Session, user: User) -> dict:
+    """Профиль с лимитами анализов (без записи в БД)"""
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "name": user.name,
+        "avatar_url": user.avatar_url,
+        "account_type": user.account_type,
+        "daily_usage": container.auth_service.get_daily_usage(user),
+        "remaining_analyses": container.auth_service.get_remaining_analyses(db, user),
+        "is_verified": user.is_verified,
+        "provider": user.provider,
+        "created_at": user.created_at
+    }
+
+def _token_expires_at(token: str) -> Optional[float]:
+    """exp проверенного токена - снимок профиля не переживает сам токен"""
+    try:
+        exp = jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        return None
+    return float(exp) if exp is not None else None
+
 @router.get("/me")
 async def get_current_user_info(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
 ):
-    """Получение информации о текущем пользователе с данными профиля"""
-    # Подсчитываем оставшиеся анализы используя новую логику
-    remaining_analyses = auth_service.get_remaining_analyses(db, current_user)
+    """
+    Получение информации о текущем пользователе с данными профиля.
+    Ответ берется из снимка profile_cache по уже проверенному токену (собственный
+    JWT или Clerk) без запросов к БД; If-None-Match с текущим ETag - 304.
+    """
+    token = credentials.credentials
+    snapshot = profile_cache.get(token)
+    if snapshot is None:
+        # Полная проверка токена (для Clerk - JWKS по сети) и чтение пользователя - в пуле потоков
+        def load():
+            current_user = get_current_user(credentials, db)
+            return profile_cache.put(current_user, _profile(db, current_user), token, _token_expires_at(token))
+
+        snapshot = await run_in_threadpool(load)
     
-    return {
-        "id": current_user.id,
-        "username": current_user.username,
-        "email": current_user.email,
-        "name": current_user.name,
-        "avatar_url": current_user.avatar_url,
-        "account_type": current_user.account_type,
-        "daily_usage": current_user.daily_usage,
-        "remaining_analyses": remaining_analyses,
-        "is_verified": current_user.is_verified,
-        "provider": current_user.provider,
-        "created_at": current_user.created_at
-    }
+    cache_headers = {"ETag": snapshot.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    return JSONResponse(content=snapshot.content, headers=cache_headers)
 
 @router.put("/update-profile")
 async def update_profile(
@@ -204,7 +252,7 @@ async def update_profile(
     db: Session = Depends(get_db)
 ):
     """Обновление профиля пользователя"""
-    username = auth_service.verify_token(credentials.credentials)
+    username = container.auth_service.verify_token(credentials.credentials)
     if username is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -212,7 +260,7 @@ async def update_profile(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = auth_service.get_user_by_username(db, username)
+    user = container.auth_service.get_user_by_username(db, username)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -226,7 +274,7 @@ async def update_profile(
     
     if profile_data.username is not None:
         # Проверяем, что новый username уникален
-        existing_user = auth_service.get_user_by_username(db, profile_data.username.strip())
+        existing_user = container.auth_service.get_user_by_username(db, profile_data.username.strip())
         if existing_user and existing_user.id != user.id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -237,21 +285,6 @@ async def update_profile(
     db.commit()
     db.refresh(user)
     
-    # Подсчитываем оставшиеся анализы используя новую логику
-    remaining_analyses = auth_service.get_remaining_analyses(db, user)
-    
-    return {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "name": user.name,
-        "avatar_url": user.avatar_url,
-        "account_type": user.account_type,
-        "daily_usage": user.daily_usage,
-        "remaining_analyses": remaining_analyses,
-        "is_verified": user.is_verified,
-        "provider": user.provider,
-        "created_at": user.created_at
-    }
+    return _profile(db, user)
 
  
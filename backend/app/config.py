@@ -14,8 +14,43 @@ AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
 AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
 
+# Deployment с поддержкой изображений (Vision); по умолчанию - основной deployment
+AZURE_OPENAI_VISION_DEPLOYMENT = os.getenv("AZURE_OPENAI_VISION_DEPLOYMENT")
+
 # Fallback to regular OpenAI if Azure is not configured
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Свой адрес OpenAI-совместимого API (прокси, локальный stub-сервер для тестов)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4")
+OPENAI_VISION_MODEL = os.getenv("OPENAI_VISION_MODEL", "gpt-4o")
+
+# Роутер LLM-провайдеров: дополнительные бэкенды JSON-списком, например
+# [{"name": "azure-west", "kind": "azure", "api_key": "...", "endpoint": "https://...", "chat_model": "gpt-4o"}]
+LLM_EXTRA_BACKENDS = os.getenv("LLM_EXTRA_BACKENDS", "")
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+# Ограничение нагрузки на каждый LLM-бэкенд в пределах процесса (0 - без лимита);
+# при нескольких воркерах - доля квоты провайдера на воркер
+LLM_RPM_LIMIT = float(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = float(os.getenv("LLM_TPM_LIMIT", "0"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "20"))
+# Повторный (hedged) запрос, если первый дольше p95 задержки бэкенда
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Цены моделей для учета стоимости (USD за 1M токенов: вход, выход, вход из кеша), JSON:
+# {"my-azure-deployment": [2.5, 10, 1.25]}; встроенные цены - в services/usage.py
+LLM_PRICES = os.getenv("LLM_PRICES", "")
+
+# JSON-режим ответов модели (response_format=json_object): "auto" - по имени модели, "on", "off"
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "auto")
+
+# Администраторы (email через запятую): доступ к /admin/*
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+# Очередь писем (email_outbox): адрес API Brevo (для тестов - локальный stub), размер пачки, число попыток
+EMAIL_API_HOST = os.getenv("EMAIL_API_HOST")
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
 
 # Frontend URL
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -30,9 +65,60 @@ SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_urlsafe(32))
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 часа вместо 30 минут
 
+# Пароли: стоимость bcrypt (2^rounds итераций; при смене хеш пересчитывается при входе)
+# и потоки для хеширования вне event loop (0 - прямо в event loop, только для сравнения в бенчмарке)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Лимиты попыток входа/регистрации/подтверждения email: хранилище memory (в процессе) или redis (общее),
+# THROTTLE_TRUST_FORWARDED - брать IP из X-Forwarded-For (только за своим прокси)
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "memory")
+THROTTLE_REDIS_URL = os.getenv("THROTTLE_REDIS_URL")
+THROTTLE_TRUST_FORWARDED = os.getenv("THROTTLE_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+
+# Снимок профиля для GET /users/me в памяти воркера, секунды (0 - без кеша)
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "30"))
+
+# Общая HTTP-сессия сервисов (Clerk, Google, Riffusion): соединений в пуле на хост и время жизни кеша JWKS Clerk, секунды
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+CLERK_JWKS_TTL = float(os.getenv("CLERK_JWKS_TTL", "3600"))
+
+# Сервисы с тяжелыми SDK, которые создаются в фоне после старта (через запятую; пусто - только по первому запросу)
+SERVICE_WARMUP = [name.strip() for name in os.getenv("SERVICE_WARMUP", "auth_service,chat_context_service").split(",") if name.strip()]
+
 # File upload settings
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.mp4', '.mov', '.avi'}
+# Пакетный анализ (/chat/analyze-media/batch): максимум изображений в одном запросе
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "6"))
+# Повторное использование анализа для визуально того же изображения: максимальное
+# расстояние Хэмминга между 64-битными dHash (0 - только точное совпадение хеша, -1 - выключено)
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", "5"))
+
+# Audio cache settings
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "audio_cache")
+# Количество уровней шардирования (каждый уровень - 2 hex-символа хеша, т.е. 256 подпапок)
+AUDIO_CACHE_SHARD_DEPTH = int(os.getenv("AUDIO_CACHE_SHARD_DEPTH", "2"))
+
+# Хранилище аудио: "local" (диск) или "s3" (S3-совместимое: AWS, MinIO и т.п.)
+AUDIO_STORAGE_BACKEND = os.getenv("AUDIO_STORAGE_BACKEND", "local")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # например http://localhost:9000 для MinIO
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY")
+S3_KEY_PREFIX = os.getenv("S3_KEY_PREFIX", "audio_cache")
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "3600"))  # секунды
+S3_MULTIPART_CHUNK_SIZE = int(os.getenv("S3_MULTIPART_CHUNK_SIZE", str(8 * 1024 * 1024)))
+
+# Эмбеддинги настроений: "local" (детерминированное хеширование, без сети) или "openai"
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "local")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Для Azure OpenAI - имя deployment модели эмбеддингов
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+EMBEDDING_LOCAL_DIM = int(os.getenv("EMBEDDING_LOCAL_DIM", "256"))
+# Каталог для снимков индекса (memory-mapped .npy); пусто - индекс только в памяти
+EMBEDDING_INDEX_DIR = os.getenv("EMBEDDING_INDEX_DIR", "")
 
 # Check Azure OpenAI configuration
 if AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT_NAME:
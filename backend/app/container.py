@@ -0,0 +1,147 @@
+# backend/app/container.py
+"""
+Контейнер сервисов приложения.
+
+Каждый сервис создается при первом обращении (container.auth_service и т.п.)
+и дальше один на процесс. Модули сервисов с тяжелыми SDK (openai, Brevo,
+Clerk, boto3) импортируются внутри фабрик, поэтому импорт app.main не создает
+клиентов и не загружает SDK, которые этому воркеру еще не понадобились.
+
+Контейнер владеет и HTTP-клиентами: сервисы получают общую requests.Session
+(container.http) с пулом соединений. Жизненным циклом управляет lifespan
+приложения (app/main.py): при остановке aclose() закрывает клиенты всех
+созданных сервисов.
+"""
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .config import HTTP_POOL_SIZE
+
+
+def _service(factory: Callable[["Container"], Any]) -> property:
+    """Свойство контейнера: фабрика вызывается один раз, при первом обращении"""
+    name = factory.__name__
+
+    @wraps(factory)
+    def get(self: "Container"):
+        instance = self._instances.get(name)
+        if instance is None:
+            # RLock: фабрика может запросить другие сервисы контейнера
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    start = time.perf_counter()
+                    instance = self._instances[name] = factory(self)
+                    print(f"[DI] {name} создан за {(time.perf_counter() - start) * 1000:.0f}ms")
+        return instance
+
+    return property(get)
+
+
+class Container:
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    @_service
+    def http(self):
+        # Keep-alive соединения к Clerk, Google и Riffusion вместо нового TCP/TLS на каждый запрос
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @_service
+    def email_service(self):
+        from .services.email_service import EmailService
+        return EmailService()
+
+    @_service
+    def clerk_service(self):
+        from .services.clerk_service import ClerkService
+        return ClerkService(http=self.http)
+
+    @_service
+    def auth_service(self):
+        from .services.auth_service import AuthService
+        return AuthService(container=self)
+
+    @_service
+    def openai_service(self):
+        from .services.openai_service import OpenAIService
+        return OpenAIService()
+
+    @_service
+    def chat_context_service(self):
+        from .services.chat_context import ChatContextService
+        return ChatContextService(self.openai_service)
+
+    @_service
+    def taste_profile_service(self):
+        from .services.taste_profile import TasteProfileService
+        return TasteProfileService()
+
+    @_service
+    def catalog_service(self):
+        from .services.catalog_service import CatalogService
+        return CatalogService()
+
+    @_service
+    def audio_storage(self):
+        # В режиме S3 - импорт boto3 и создание клиента, поэтому тоже при первом обращении
+        from .services.storage import get_audio_storage
+        return get_audio_storage()
+
+    @_service
+    def saved_songs_service(self):
+        from .services.saved_songs_service import SavedSongsService
+        return SavedSongsService(taste_profile_service=self.taste_profile_service,
+                                 catalog_service=self.catalog_service)
+
+    def warm_up(self, names: Iterable[str]) -> Optional[threading.Thread]:
+        """Создает сервисы в фоновом потоке - воркер уже принимает запросы,
+        а первый запрос к чату не ждет импорта SDK"""
+        names = [name for name in names if name not in self._instances]
+        if not names:
+            return None
+
+        def run():
+            for name in names:
+                try:
+                    getattr(self, name)
+                except Exception as e:
+                    # Сервис попробует создаться снова при первом запросе
+                    print(f"⚠️ [DI] Не удалось прогреть {name}: {e}")
+
+        thread = threading.Thread(target=run, name="container-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    async def aclose(self) -> None:
+        """Закрывает клиенты созданных сервисов (остановка приложения).
+        Следующее обращение к сервису создаст его заново"""
+        with self._lock:
+            instances, self._instances = self._instances, {}
+        # В обратном порядке: сервисы закрываются раньше клиентов, которые им переданы
+        for name, instance in reversed(list(instances.items())):
+            try:
+                if hasattr(instance, "aclose"):
+                    await instance.aclose()
+                elif hasattr(instance, "close"):
+                    instance.close()
+            except Exception as e:
+                print(f"⚠️ [DI] Ошибка при закрытии {name}: {e}")
+        if instances:
+            print(f"[DI] Закрыто сервисов: {len(instances)}")
+
+    def built(self) -> Dict[str, str]:
+        """Уже созданные сервисы (для отладки и бенчмарка старта)"""
+        return {name: type(instance).__name__ for name, instance in self._instances.items()}
+
+
+container = Container()
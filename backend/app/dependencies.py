@@ -1,19 +1,22 @@
 import traceback
 from fastapi import Depends, HTTPException, status
+from typing import Optional
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from .database import get_db
 from .models.user import User
-from .services.auth_service import AuthService
+from .config import ADMIN_EMAILS
+from .container import container
 
-auth_service = AuthService()
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> User:
     token = credentials.credentials
+    auth_service = container.auth_service
     
     # Сначала пробуем проверить как собственный JWT токен
     username = auth_service.verify_token(token)
@@ -95,4 +98,23 @@ def get_current_user(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Недействительный токен",
         headers={"WWW-Authenticate": "Bearer"},
-    ) 
\ No newline at end of file
+    ) 
+
+def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+) -> Optional[User]:
+    """Пользователь, если передан валидный токен; иначе None (эндпоинт доступен анонимно)"""
+    if credentials is None:
+        return None
+    try:
+        return get_current_user(credentials, db)
+    except HTTPException:
+        return None
+
+
+def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    """Только для администраторов (email из ADMIN_EMAILS)"""
+    if (current_user.email or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+    return current_user
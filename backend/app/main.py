@@ -1,23 +1,48 @@
 # VibeMatch/backend/app/main.py
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
-from app.api import auth, media, recommend, chat, users
-from app.config import HOST, PORT
+from app.api import auth, media, recommend, chat, users, audio, admin
+from app.config import HOST, PORT, SERVICE_WARMUP
+from app.container import container
 from app.models.user import Base
 from app.database import engine
+from app.services.usage import usage_recorder
+from app.services.email_outbox import email_outbox
+from app.services.passwords import password_hasher
 from starlette.middleware.sessions import SessionMiddleware
 from dotenv import load_dotenv
 load_dotenv()
 
 
-app = FastAPI(title="VibeMatch API")
-app.mount("/audio_cache", StaticFiles(directory="audio_cache"), name="audio_cache")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схемой управляет Alembic (alembic upgrade head перед запуском).
+    # Цепочка миграций рассчитана на PostgreSQL, поэтому локальная SQLite
+    # по-прежнему создается по моделям - но при старте, а не при импорте модуля
+    if engine.dialect.name == "sqlite":
+        Base.metadata.create_all(bind=engine)
 
-# Создаем таблицы при запуске
-Base.metadata.create_all(bind=engine)
+    # Контейнер сервисов живет вместе с приложением; тяжелые сервисы
+    # создаются в фоне, старт воркера их не ждет
+    app.state.container = container
+    container.warm_up(SERVICE_WARMUP)
+
+    # Досылаем письма, оставшиеся в очереди с прошлого запуска
+    email_outbox.start()
+
+    yield
+
+    # Не теряем накопленный учет вызовов LLM при остановке воркера
+    usage_recorder.flush()
+    password_hasher.shutdown()
+    # Закрываем пулы соединений сервисов (OpenAI, Brevo, общая HTTP-сессия)
+    await container.aclose()
+
+
+app = FastAPI(title="VibeMatch API", lifespan=lifespan)
 
 # Важно: SessionMiddleware должен быть ПЕРЕД CORS middleware
 app.add_middleware(
@@ -41,6 +66,8 @@ app.add_middleware(
     allow_credentials=True,  # Важно для работы с сессиями
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    # Фронтенду нужны заголовки кеширования и пагинации избранного
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 
@@ -54,6 +81,9 @@ app.include_router(media.router, prefix="/media")
 app.include_router(recommend.recommend_router, prefix="/recommend")
 app.include_router(chat.router, prefix="/chat")
 app.include_router(users.router, prefix="/users")
+# Файлы кеша лежат в шардах, поэтому вместо StaticFiles - роут с вычислением пути
+app.include_router(audio.router, prefix="/audio_cache")
+app.include_router(admin.router, prefix="/admin")
 
 if __name__ == "__main__":
     import uvicorn
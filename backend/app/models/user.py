@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, ForeignKey, UniqueConstraint, Index, Float, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -35,6 +35,9 @@ class User(Base):
     daily_usage = Column(Integer, default=0)
     last_usage_date = Column(DateTime, nullable=True)
 
+    # Версия библиотеки избранного: увеличивается при каждом добавлении/удалении (для ETag)
+    library_version = Column(Integer, default=0, server_default="0", nullable=False)
+
 class SavedSong(Base):
     __tablename__ = "saved_songs"
 
@@ -43,10 +46,23 @@ class SavedSong(Base):
     youtube_video_id = Column(String, nullable=False)
     title = Column(String, nullable=False)
     artist = Column(String, nullable=True)
-    date_saved = Column(DateTime, default=datetime.utcnow)
+    date_saved = Column(DateTime, default=datetime.utcnow, nullable=False)  # часть курсора пагинации
+    # Нормализованный ключ "название + исполнитель" для дедупликации (см. catalog_service.normalize_song_key)
+    dedup_key = Column(String, nullable=False)
 
     user = relationship("User", backref="saved_songs")
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "youtube_video_id", name="uq_saved_songs_user_video"),
+        UniqueConstraint("user_id", "dedup_key", name="uq_saved_songs_user_dedup_key"),
+        # Покрывающий индекс для списка избранного: index-only scan в PostgreSQL
+        Index(
+            "ix_saved_songs_user_date_saved",
+            "user_id", date_saved.desc(), id.desc(),
+            postgresql_include=["youtube_video_id", "title", "artist"],
+        ),
+    )
+
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
     id = Column(Integer, primary_key=True, index=True)
@@ -55,4 +71,130 @@ class ChatMessage(Base):
     content = Column(Text, nullable=True)
     media_url = Column(String, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
-    user = relationship("User", backref="chat_messages") 
\ No newline at end of file
+    user = relationship("User", backref="chat_messages")
+
+    __table_args__ = (
+        # Последние сообщения пользователя для контекста чата
+        Index("ix_chat_messages_user_id_id", "user_id", "id"),
+    )
+
+class ChatSummary(Base):
+    """Скользящее резюме старой части переписки пользователя с ИИ"""
+    __tablename__ = "chat_summaries"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    # id последнего сообщения chat_messages, вошедшего в резюме
+    summarized_until_id = Column(Integer, nullable=False, default=0, server_default="0")
+    token_count = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class CatalogTrack(Base):
+    """Общий каталог треков: избранное всех пользователей и прошлые рекомендации"""
+    __tablename__ = "catalog_tracks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    track_key = Column(String, unique=True, nullable=False)  # normalize_song_key(title, artist)
+    title = Column(String, nullable=False)
+    artist = Column(String, nullable=True)
+    youtube_video_id = Column(String, nullable=True)
+    save_count = Column(Integer, default=0, server_default="0", nullable=False)
+    recommend_count = Column(Integer, default=0, server_default="0", nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class CatalogTrackTag(Base):
+    """Теги настроения/жанра трека с весом (сколько раз трек выпадал на такой тег)"""
+    __tablename__ = "catalog_track_tags"
+
+    track_id = Column(Integer, ForeignKey("catalog_tracks.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String, primary_key=True)
+    weight = Column(Float, default=1.0, nullable=False)
+
+class Embedding(Base):
+    """
+    Вектор эмбеддинга (float32) прошлого анализа настроения или трека каталога.
+    kind="mood": ref_key - uuid анализа, payload - JSON со списком подошедших треков.
+    kind="track": ref_key - track_key, vector - сумма векторов настроений, weight - их число.
+    """
+    __tablename__ = "embeddings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(16), nullable=False)
+    ref_key = Column(String, nullable=False)
+    provider = Column(String(64), nullable=False)  # векторы разных провайдеров несовместимы
+    dim = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)
+    weight = Column(Float, default=1.0, nullable=False)
+    payload = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("kind", "provider", "ref_key", name="uq_embeddings_kind_provider_ref"),
+        Index("ix_embeddings_provider_kind_updated", "provider", "kind", "updated_at"),
+    )
+
+class LLMUsage(Base):
+    """
+    Один вызов LLM (или ответ из кеша без вызова): токены, стоимость, задержка.
+    Пишется пачками из usage.UsageRecorder, читается в /admin/usage.
+    """
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    endpoint = Column(String(64), nullable=True)     # /chat/chat, /chat/analyze-media, ...
+    operation = Column(String(32), nullable=False)   # mood_analysis, recommendations, chat, chat_summary
+    backend = Column(String(32), nullable=True)      # имя бэкенда роутера; NULL - ответ из кеша
+    model = Column(String(64), nullable=True)
+    prompt_tokens = Column(Integer, default=0, server_default="0", nullable=False)
+    completion_tokens = Column(Integer, default=0, server_default="0", nullable=False)
+    cached_tokens = Column(Integer, default=0, server_default="0", nullable=False)  # prompt caching провайдера
+    cost_usd = Column(Float, nullable=True)          # NULL - цена модели неизвестна
+    latency_ms = Column(Float, nullable=True)
+    cache_hit = Column(Boolean, default=False, nullable=False)
+    estimated = Column(Boolean, default=False, nullable=False)  # потоковый ответ: токены посчитаны локально
+    ok = Column(Boolean, default=True, nullable=False)
+
+    __table_args__ = (
+        Index("ix_llm_usage_created_at", "created_at"),
+        Index("ix_llm_usage_user_created", "user_id", "created_at"),
+    )
+
+class ImageAnalysis(Base):
+    """
+    Анализ настроения изображения по перцептивному хешу (dHash): повторная загрузка
+    визуально того же изображения (пережатого, уменьшенного, скриншота) берет анализ отсюда.
+    Поиск по расстоянию Хэмминга - в памяти процесса (services/image_hash.py).
+    """
+    __tablename__ = "image_analyses"
+
+    id = Column(Integer, primary_key=True)
+    image_hash = Column(BigInteger, nullable=False)  # 64-битный dHash со знаком
+    language = Column(String(8), nullable=False)
+    analysis = Column(Text, nullable=False)          # JSON ответа /chat/analyze-media
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class EmailOutbox(Base):
+    """
+    Письмо в очереди на отправку (transactional outbox): эндпоинт только добавляет строку,
+    отправляет фоновый EmailOutboxSender (services/email_outbox.py) с повторами.
+    status: pending -> sending (взято воркером до next_attempt_at) -> sent | failed
+    """
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    to_email = Column(String, nullable=False)
+    template = Column(String(32), nullable=False)   # verification
+    params = Column(Text, nullable=True)            # JSON параметров шаблона; очищается после отправки
+    status = Column(String(16), default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(Text, nullable=True)
+    message_id = Column(String, nullable=True)      # id письма у провайдера
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+    )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -77,6 +77,25 @@ class SavedSong(SavedSongBase):
     class Config:
         from_attributes = True
 
+MAX_BULK_SONGS = 500
+
+class SavedSongsBulkCreate(BaseModel):
+    songs: List[SavedSongCreate] = Field(..., min_length=1, max_length=MAX_BULK_SONGS)
+
+class SavedSongsBulkDelete(BaseModel):
+    youtube_video_ids: List[str] = Field(..., min_length=1, max_length=MAX_BULK_SONGS)
+
+class SavedSongBulkItemResult(BaseModel):
+    youtube_video_id: str
+    status: str  # "created", "duplicate", "deleted" или "not_found"
+    id: Optional[int] = None
+
+class SavedSongsBulkResult(BaseModel):
+    results: List[SavedSongBulkItemResult]
+    created: int = 0
+    deleted: int = 0
+    skipped: int = 0
+
 class ChatMessageBase(BaseModel):
     role: str
     content: Optional[str] = None
@@ -104,4 +123,67 @@ class GenerateBeatResponse(BaseModel):
     status: Optional[str] = None
     request_id: Optional[str] = None
     callback_url: Optional[str] = None
-    message: Optional[str] = None 
\ No newline at end of file
+    message: Optional[str] = None 
+
+# Структурированные ответы модели (валидируются в OpenAIService)
+
+def _as_list(value: Any) -> Any:
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    return value if value is not None else []
+
+class MoodAnalysisOutput(BaseModel):
+    mood: str = "neutral"
+    emotions: List[str] = []
+    colors: str = ""
+    music_genre: Optional[str] = None
+    music_style: Optional[str] = None
+    description: str = ""
+    caption: Optional[str] = None
+
+    @field_validator("emotions", mode="before")
+    @classmethod
+    def _emotions_list(cls, value):
+        return _as_list(value)
+
+    @field_validator("colors", mode="before")
+    @classmethod
+    def _colors_text(cls, value):
+        if isinstance(value, list):
+            return ", ".join(str(v) for v in value)
+        return value or ""
+
+class BatchImageMood(MoodAnalysisOutput):
+    index: Optional[int] = None
+
+class BatchMoodAnalysisOutput(BaseModel):
+    images: List[BatchImageMood] = []
+    overall: MoodAnalysisOutput = MoodAnalysisOutput()
+
+    @field_validator("images", mode="before")
+    @classmethod
+    def _images_list(cls, value):
+        return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+class RecommendedTrack(BaseModel):
+    name: str
+    artist: Optional[str] = None
+    reason: str = ""
+
+class RecommendationsOutput(BaseModel):
+    recommended_tracks: List[RecommendedTrack] = []
+    explanation: str = ""
+    alternative_genres: List[str] = []
+
+    @field_validator("recommended_tracks", mode="before")
+    @classmethod
+    def _skip_broken_tracks(cls, value):
+        # Один трек без названия не должен ронять всю подборку
+        if not isinstance(value, list):
+            return []
+        return [t for t in value if isinstance(t, dict) and isinstance(t.get("name"), str) and t["name"].strip()]
+
+    @field_validator("alternative_genres", mode="before")
+    @classmethod
+    def _genres_list(cls, value):
+        return _as_list(value)
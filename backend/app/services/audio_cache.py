@@ -0,0 +1,75 @@
+# backend/app/services/audio_cache.py
+"""
+Шардированная раскладка audio_cache на диске.
+
+Файл `{id}.{ext}` хранится в `audio_cache/ab/cd/{id}.{ext}`, где `abcd` -
+начало sha1 от `{id}`. Все файлы одного id (.m4a, .mp3, .status, .error)
+попадают в одну подпапку, а в каждой папке остается немного записей.
+Публичные ссылки `/audio_cache/{id}.{ext}` не меняются - путь на диске
+вычисляется по имени файла.
+"""
+import hashlib
+import os
+from typing import Optional
+
+from ..config import AUDIO_CACHE_DIR, AUDIO_CACHE_SHARD_DEPTH
+
+AUDIO_EXTENSIONS = ('m4a', 'mp3', 'webm', 'mp4')
+
+
+def is_safe_filename(filename: str) -> bool:
+    """Проверяет, что имя файла не выходит за пределы кеша"""
+    return bool(filename) and ".." not in filename and "/" not in filename and "\\" not in filename
+
+
+def cache_key(filename: str) -> str:
+    """Ключ шардирования - имя файла без расширения"""
+    return os.path.splitext(filename)[0]
+
+
+def shard_prefix(key: str) -> str:
+    """Относительный путь шарда для ключа, например 'ab/cd'"""
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(*[digest[i * 2:i * 2 + 2] for i in range(AUDIO_CACHE_SHARD_DEPTH)]) if AUDIO_CACHE_SHARD_DEPTH > 0 else ""
+
+
+def shard_dir(key: str, create: bool = False) -> str:
+    """Папка шарда для ключа"""
+    directory = os.path.join(AUDIO_CACHE_DIR, shard_prefix(key))
+    if create:
+        os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def cache_path(filename: str, create_dir: bool = False) -> str:
+    """Путь к файлу в шардированной раскладке (файл может еще не существовать)"""
+    return os.path.join(shard_dir(cache_key(filename), create=create_dir), filename)
+
+
+def legacy_cache_path(filename: str) -> str:
+    """Путь к файлу в старой плоской раскладке"""
+    return os.path.join(AUDIO_CACHE_DIR, filename)
+
+
+def resolve_cached_file(filename: str) -> Optional[str]:
+    """Находит файл в кеше: сначала в шарде, потом в плоской папке (до миграции)"""
+    if not is_safe_filename(filename):
+        return None
+    for path in (cache_path(filename), legacy_cache_path(filename)):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def find_cached_audio(key: str) -> Optional[str]:
+    """Ищет аудио для id среди поддерживаемых расширений"""
+    for ext in AUDIO_EXTENSIONS:
+        path = resolve_cached_file(f"{key}.{ext}")
+        if path:
+            return path
+    return None
+
+
+def public_url(filename: str) -> str:
+    """Публичная ссылка на файл кеша (не зависит от раскладки на диске)"""
+    return f"/audio_cache/{filename}"
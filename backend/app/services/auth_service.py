@@ -1,31 +1,45 @@
 import bcrypt
+import re
 from datetime import datetime, timedelta, date
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 from ..models.user import User
 from ..database import get_db
 from ..config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from .email_service import EmailService
-from .clerk_service import ClerkService
+from .email_outbox import email_outbox
+from .passwords import pwd_context, password_hasher
 
-# Настройка хеширования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+USERNAME_CREATE_ATTEMPTS = 5  # попыток подобрать username при одновременных регистрациях
 
 class AuthService:
-    def __init__(self):
+    def __init__(self, container=None):
         self.pwd_context = pwd_context
-        self.email_service = EmailService()
-        self.clerk_service = ClerkService()
+        self._container = container
+    
+    @property
+    def container(self):
+        if self._container is None:
+            from ..container import container
+            self._container = container
+        return self._container
+    
+    @property
+    def email_service(self):
+        return self.container.email_service
+    
+    @property
+    def clerk_service(self):
+        return self.container.clerk_service
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        """Проверяет пароль"""
+        """Проверяет пароль (блокирующий вызов; в эндпоинтах - password_hasher.verify)"""
         return self.pwd_context.verify(plain_password, hashed_password)
     
     def get_password_hash(self, password: str) -> str:
-        """Хеширует пароль"""
+        """Хеширует пароль (блокирующий вызов; в эндпоинтах - password_hasher.hash)"""
         return self.pwd_context.hash(password)
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None):
@@ -50,18 +64,21 @@ class AuthService:
         except JWTError:
             return None
     
-    def authenticate_user(self, db: Session, email: str, password: str) -> Optional[User]:
-        """Аутентифицирует пользователя"""
+    async def authenticate_user(self, db: Session, email: str, password: str) -> Optional[User]:
+        """Аутентифицирует пользователя; bcrypt - в пуле потоков password_hasher"""
         user = db.query(User).filter(User.email == email).first()
-        if not user:
-            return None
         
         # For Google OAuth users, password authentication is not allowed
-        if user.provider == "google":
-            return None
-            
-        if not user.hashed_password or not self.verify_password(password, user.hashed_password):
+        hashed_password = user.hashed_password if user and user.provider != "google" else None
+        ok, new_hash = await password_hasher.verify(password, hashed_password)
+        if not ok:
             return None
+        
+        if new_hash:
+            # Стоимость bcrypt изменилась (BCRYPT_ROUNDS) - сохраняем пересчитанный хеш
+            user.hashed_password = new_hash
+            db.commit()
+            print(f"🔐 [AUTH] Хеш пароля пользователя {user.username} пересчитан с новой стоимостью")
         return user
     
     def get_user_by_email(self, db: Session, email: str) -> Optional[User]:
@@ -83,10 +100,11 @@ class AuthService:
     def create_user(self, db: Session, email: str, username: str, password: str = None, 
                    verification_code: str = None, verification_expiry: datetime = None,
                    google_id: str = None, clerk_id: str = None, avatar_url: str = None, 
-                   name: str = None, provider: str = "email") -> User:
-        """Создает нового пользователя"""
-        hashed_password = None
-        if password:
+                   name: str = None, provider: str = "email", hashed_password: str = None,
+                   commit: bool = True) -> User:
+        """Создает нового пользователя (hashed_password - уже посчитанный хеш password).
+        commit=False - только flush: вызывающий код коммитит вместе со своими изменениями"""
+        if password and not hashed_password:
             hashed_password = self.get_password_hash(password)
             
         db_user = User(
@@ -105,12 +123,53 @@ class AuthService:
             last_usage_date=None  # Не устанавливаем дату до первого использования
         )
         db.add(db_user)
+        if not commit:
+            db.flush()
+            return db_user
         db.commit()
         db.refresh(db_user)
         return db_user
     
-    def create_user_with_verification(self, db: Session, email: str, username: str, password: str) -> tuple[User, str]:
+    def taken_usernames(self, db: Session, base: str) -> set:
+        """Занятые имена вида base и base + цифры (base1, base12, ...) - одним запросом.
+        LIKE по префиксу использует индекс username, регулярное выражение отсекает
+        остальные имена с тем же префиксом (baseball, base_x)"""
+        prefix = base.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return {
+            name for (name,) in db.query(User.username).filter(
+                User.username.like(prefix, escape="\\"),
+                User.username.regexp_match(f"^{re.escape(base)}[0-9]*$"),
+            )
+        }
+    
+    def next_free_username(self, db: Session, base: str) -> str:
+        """base, если имя свободно, иначе base + наименьший свободный номер (base1, base2, ...)"""
+        taken = self.taken_usernames(db, base)
+        if base not in taken:
+            return base
+        counter = 1
+        while f"{base}{counter}" in taken:
+            counter += 1
+        return f"{base}{counter}"
+    
+    def create_user_with_unique_username(self, db: Session, base_username: str, **fields) -> User:
+        """Создает пользователя со свободным username на основе base_username.
+        Если имя заняли параллельной регистрацией (unique violation) - подбирает заново"""
+        for attempt in range(USERNAME_CREATE_ATTEMPTS):
+            username = self.next_free_username(db, base_username)
+            try:
+                return self.create_user(db=db, username=username, **fields)
+            except IntegrityError:
+                db.rollback()
+                # Конфликт не по username (например, email) повтором не исправить
+                if attempt == USERNAME_CREATE_ATTEMPTS - 1 or not self.get_user_by_username(db, username):
+                    raise
+                print(f"[AUTH] Имя {username} занято параллельной регистрацией, подбираем другое")
+    
+    async def create_user_with_verification(self, db: Session, email: str, username: str, password: str) -> tuple[User, str]:
         """Создает пользователя с email verification"""
+        hashed_password = await password_hasher.hash(password)
+        
         # Generate verification code
         verification_code = self.email_service.generate_verification_code()
         verification_expiry = self.email_service.get_verification_expiry()
@@ -120,13 +179,17 @@ class AuthService:
             db=db,
             email=email,
             username=username,
-            password=password,
+            hashed_password=hashed_password,
             verification_code=verification_code,
-            verification_expiry=verification_expiry
+            verification_expiry=verification_expiry,
+            commit=False
         )
         
-        # Send verification email
-        self.email_service.send_verification_email(email, verification_code)
+        # Письмо в очереди - в той же транзакции, что и пользователь; отправляет фоновый воркер
+        email_outbox.enqueue(db, email, "verification", {"code": verification_code})
+        db.commit()
+        db.refresh(user)
+        email_outbox.notify()
         
         return user, verification_code
     
@@ -160,13 +223,12 @@ class AuthService:
         verification_code = self.email_service.generate_verification_code()
         verification_expiry = self.email_service.get_verification_expiry()
         
-        # Update user
+        # Update user, письмо - в той же транзакции (через очередь)
         user.verification_code = verification_code
         user.verification_code_expires = verification_expiry
+        email_outbox.enqueue(db, email, "verification", {"code": verification_code})
         db.commit()
-        
-        # Send verification email
-        self.email_service.send_verification_email(email, verification_code)
+        email_outbox.notify()
         
         return True
     
@@ -201,17 +263,10 @@ class AuthService:
         
         # Create new Google user
         # Generate unique username from email
-        username = email.split('@')[0]
-        counter = 1
-        original_username = username
-        while self.get_user_by_username(db, username):
-            username = f"{original_username}{counter}"
-            counter += 1
-        
-        user = self.create_user(
+        user = self.create_user_with_unique_username(
             db=db,
+            base_username=email.split('@')[0],
             email=email,
-            username=username,
             google_id=google_id,
             avatar_url=avatar_url,
             name=name,
@@ -255,19 +310,10 @@ class AuthService:
         
         # Создаем нового пользователя Clerk
         # Генерируем уникальное имя пользователя
-        if not username:
-            username = email.split('@')[0]
-        
-        counter = 1
-        original_username = username
-        while self.get_user_by_username(db, username):
-            username = f"{original_username}{counter}"
-            counter += 1
-        
-        user = self.create_user(
+        user = self.create_user_with_unique_username(
             db=db,
+            base_username=username or email.split('@')[0],
             email=email,
-            username=username,
             clerk_id=clerk_id,
             avatar_url=avatar_url,
             name=name,
@@ -289,17 +335,21 @@ class AuthService:
             db.commit()
             print(f"🔄 Сброшены лимиты для пользователя {user.username}: daily_usage=0, новая дата={today}")
     
+    def get_daily_usage(self, user: User) -> int:
+        """Анализов за сегодня без записи в БД: в новый день счетчик считается нулевым
+        (сам сброс в БД делает check_usage_limit при следующем анализе)"""
+        if not user.last_usage_date or user.last_usage_date.date() != date.today():
+            return 0
+        return user.daily_usage or 0
+    
     def get_remaining_analyses(self, db: Session, user: User) -> int:
-        """Возвращает количество оставшихся анализов для пользователя"""
+        """Возвращает количество оставшихся анализов для пользователя (только чтение)"""
         # PRO пользователи имеют безлимитный доступ
         if user.account_type == "pro":
             return -1  # Безлимитный
         
-        # Сбрасываем лимиты если нужно
-        self.reset_daily_limits_if_needed(db, user)
-        
         # Возвращаем оставшиеся анализы
-        return max(0, 3 - user.daily_usage)
+        return max(0, 3 - self.get_daily_usage(user))
     
     def check_usage_limit(self, db: Session, user: User) -> bool:
         """Проверяет и обновляет лимит использования для пользователя"""
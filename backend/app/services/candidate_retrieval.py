@@ -0,0 +1,228 @@
+# backend/app/services/candidate_retrieval.py
+"""
+Векторизованный отбор кандидатов из локального каталога треков.
+
+Каталог загружается в память как набор массивов NumPy: теги треков хранятся
+в разреженном виде (строка, тег, вес), поэтому оценка всех треков - это
+один np.bincount по ненулевым элементам, без циклов Python по трекам.
+
+score = W_TAG * косинус(теги трека, теги настроения)
+      + W_ARTIST * близость к исполнителям из профиля вкуса
+      + W_POPULARITY * нормированная популярность
+
+Если в пуле (LOCAL_POOL_SIZE лучших) хватает кандидатов с высоким
+совпадением по тегам, рекомендации собираются локально и запрос к модели
+не нужен; иначе первые CANDIDATES_FOR_LLM кандидатов пула уходят в промпт
+для переранжирования.
+"""
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..models.user import CatalogTrack, CatalogTrackTag
+from .catalog_service import mood_tags, normalize_song_key
+from .taste_profile import artist_key
+
+W_TAG = 1.0
+W_ARTIST = 0.5
+W_POPULARITY = 0.15
+
+CATALOG_REFRESH_SECONDS = 300
+CANDIDATES_FOR_LLM = 10
+# Минимальное совпадение (косинус по тегам или по эмбеддингу настроения),
+# при котором трек считается уверенным кандидатом
+LOCAL_CONFIDENCE_TAG_SCORE = 0.6
+# Без модели отвечаем, только если уверенных кандидатов хотя бы в столько раз больше n_tracks
+LOCAL_POOL_FACTOR = 2
+# Сколько кандидатов отбирается для решения без модели - больше, чем уходит в промпт,
+# иначе порог LOCAL_POOL_FACTOR * n_tracks достижим, только если уверенны все кандидаты
+LOCAL_POOL_SIZE = 30
+
+LOCAL_EXPLANATIONS = {
+    "en": "Tracks picked from the music library that matched similar moods before.",
+    "kk": "Бұрын осындай көңіл-күйге сәйкес келген кітапханадағы тректер.",
+    "ru": "Треки из библиотеки, которые уже подходили к похожему настроению.",
+}
+LOCAL_REASONS = {
+    "en": "Matches the mood: {tags}",
+    "kk": "Көңіл-күйге сәйкес: {tags}",
+    "ru": "Подходит под настроение: {tags}",
+}
+
+
+class CandidateIndex:
+    """Неизменяемый снимок каталога в виде массивов NumPy"""
+
+    def __init__(self, tracks: List, tags: List):
+        self.size = len(tracks)
+        row_of = {}
+        self.titles, self.artists, self.video_ids = [], [], []
+        artist_vocab: Dict[str, int] = {}
+        artist_codes = np.full(self.size, -1, dtype=np.int32)
+        popularity = np.zeros(self.size, dtype=np.float32)
+
+        for row, track in enumerate(tracks):
+            row_of[track.id] = row
+            self.titles.append(track.title)
+            self.artists.append(track.artist)
+            self.video_ids.append(track.youtube_video_id)
+            if track.artist:
+                artist_codes[row] = artist_vocab.setdefault(artist_key(track.artist), len(artist_vocab))
+            # Сохранение в избранное - более сильный сигнал, чем попадание в ответ модели
+            popularity[row] = 2 * track.save_count + track.recommend_count
+
+        tag_vocab: Dict[str, int] = {}
+        tag_rows, tag_cols, tag_weights = [], [], []
+        for tag in tags:
+            row = row_of.get(tag.track_id)
+            if row is None:
+                continue
+            tag_rows.append(row)
+            tag_cols.append(tag_vocab.setdefault(tag.tag, len(tag_vocab)))
+            tag_weights.append(tag.weight)
+
+        self.artist_vocab = artist_vocab
+        self.artist_codes = artist_codes
+        self.tag_vocab = tag_vocab
+        self.tag_rows = np.asarray(tag_rows, dtype=np.int64)
+        self.tag_cols = np.asarray(tag_cols, dtype=np.int64)
+        self.tag_weights = np.log1p(np.asarray(tag_weights, dtype=np.float32))
+        # L2-норма вектора тегов каждого трека - для косинусной близости
+        self.row_norms = np.sqrt(
+            np.bincount(self.tag_rows, weights=self.tag_weights ** 2, minlength=self.size)
+        ).astype(np.float32)
+        pop = np.log1p(popularity)
+        self.popularity = pop / pop.max() if self.size and pop.max() > 0 else pop
+
+    def score(self, tags: List[str], artist_weights: Optional[Dict[str, float]] = None):
+        """Возвращает (итоговый score, косинус по тегам) для всех треков"""
+        tag_scores = np.zeros(self.size, dtype=np.float32)
+        query_cols = [self.tag_vocab[t] for t in tags if t in self.tag_vocab]
+        if query_cols and self.tag_cols.size:
+            query = np.zeros(len(self.tag_vocab), dtype=np.float32)
+            query[query_cols] = 1.0
+            dots = np.bincount(self.tag_rows, weights=self.tag_weights * query[self.tag_cols], minlength=self.size)
+            # Норма запроса - корень из числа тегов (учитываем и теги, которых нет в каталоге)
+            denom = self.row_norms * np.sqrt(len(tags))
+            np.divide(dots, denom, out=tag_scores, where=denom > 0)
+
+        artist_scores = np.zeros(self.size, dtype=np.float32)
+        if artist_weights and self.artist_vocab:
+            affinity = np.zeros(len(self.artist_vocab) + 1, dtype=np.float32)  # последний элемент - "нет исполнителя"
+            max_weight = max(artist_weights.values()) or 1.0
+            for name, weight in artist_weights.items():
+                code = self.artist_vocab.get(artist_key(name))
+                if code is not None:
+                    affinity[code] = weight / max_weight
+            artist_scores = affinity[self.artist_codes]  # -1 -> последний элемент
+
+        total = W_TAG * tag_scores + W_ARTIST * artist_scores + W_POPULARITY * self.popularity
+        # Трек без совпадений ни по тегам, ни по исполнителю кандидатом не считается
+        total[(tag_scores <= 0) & (artist_scores <= 0)] = 0
+        return total, tag_scores
+
+    def top_k(self, tags: List[str], artist_weights: Optional[Dict[str, float]], k: int) -> List[Dict[str, Any]]:
+        if not self.size or k <= 0:
+            return []
+        total, tag_scores = self.score(tags, artist_weights)
+        k = min(k, self.size)
+        top = np.argpartition(-total, k - 1)[:k]
+        top = top[np.argsort(-total[top])]
+        return [
+            {
+                "name": self.titles[i],
+                "artist": self.artists[i],
+                "youtube_video_id": self.video_ids[i],
+                "score": round(float(total[i]), 4),
+                "match": round(float(tag_scores[i]), 4),
+            }
+            for i in top if total[i] > 0
+        ]
+
+
+def merge_candidates(*sources: List[Dict[str, Any]], k: int = CANDIDATES_FOR_LLM) -> List[Dict[str, Any]]:
+    """Объединяет списки кандидатов без повторов (берется лучшее совпадение) и оставляет top-k"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for candidates in sources:
+        for candidate in candidates:
+            key = normalize_song_key(candidate["name"], candidate.get("artist"))
+            current = merged.get(key)
+            if current is None or candidate["match"] > current["match"]:
+                merged[key] = candidate
+    return sorted(merged.values(), key=lambda c: (c["match"], c["score"]), reverse=True)[:k]
+
+
+class CandidateRetrievalEngine:
+    """Держит актуальный снимок каталога и отбирает кандидатов"""
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+        self._index: Optional[CandidateIndex] = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _build(self) -> CandidateIndex:
+        if self._session_factory is None:
+            from ..database import SessionLocal
+            self._session_factory = SessionLocal
+        db = self._session_factory()
+        try:
+            tracks = db.query(
+                CatalogTrack.id, CatalogTrack.title, CatalogTrack.artist, CatalogTrack.youtube_video_id,
+                CatalogTrack.save_count, CatalogTrack.recommend_count,
+            ).all()
+            tags = db.query(CatalogTrackTag.track_id, CatalogTrackTag.tag, CatalogTrackTag.weight).all()
+        finally:
+            db.close()
+        return CandidateIndex(tracks, tags)
+
+    def ensure_fresh(self) -> None:
+        """Перестраивает снимок, если он устарел (блокирующий вызов - запускать в потоке)"""
+        if self._index is not None and time.time() - self._built_at < CATALOG_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if self._index is not None and time.time() - self._built_at < CATALOG_REFRESH_SECONDS:
+                return
+            start = time.perf_counter()
+            self._index = self._build()
+            self._built_at = time.time()
+            print(f"[CATALOG] Индекс кандидатов: {self._index.size} треков, "
+                  f"{len(self._index.tag_vocab)} тегов, {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    def retrieve(self, mood_analysis: Dict[str, Any], preferences: Optional[Dict[str, Any]] = None,
+                 k: int = LOCAL_POOL_SIZE) -> List[Dict[str, Any]]:
+        """Лучшие кандидаты под настроение и (опционально) профиль вкуса"""
+        if self._index is None:
+            return []
+        artist_weights = (preferences or {}).get("artist_weights")
+        return self._index.top_k(mood_tags(mood_analysis), artist_weights, k)
+
+    def local_recommendations(self, mood_analysis: Dict[str, Any], pool: List[Dict[str, Any]],
+                              n_tracks: int, language: str = "ru") -> Optional[Dict[str, Any]]:
+        """
+        Рекомендации без модели, если в пуле (до LOCAL_POOL_SIZE кандидатов, не
+        только те, что ушли бы в промпт) не меньше LOCAL_POOL_FACTOR * n_tracks
+        треков с совпадением от LOCAL_CONFIDENCE_TAG_SCORE.
+        Из пула берется случайная выборка, чтобы подборки не повторялись.
+        """
+        confident = [c for c in pool if c["match"] >= LOCAL_CONFIDENCE_TAG_SCORE]
+        if len(confident) < LOCAL_POOL_FACTOR * n_tracks:
+            return None
+        picked = sorted(random.sample(range(len(confident)), n_tracks))
+        confident = [confident[i] for i in picked]
+        tags = ", ".join(mood_tags(mood_analysis)[:3])
+        reason = LOCAL_REASONS.get(language, LOCAL_REASONS["ru"]).format(tags=tags)
+        return {
+            "recommended_tracks": [
+                {"name": c["name"], "artist": c["artist"], "reason": reason} for c in confident[:n_tracks]
+            ],
+            "explanation": LOCAL_EXPLANATIONS.get(language, LOCAL_EXPLANATIONS["ru"]),
+            "alternative_genres": [],
+            "source": "local",
+        }
+
+
+retrieval_engine = CandidateRetrievalEngine()
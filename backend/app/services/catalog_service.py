@@ -0,0 +1,131 @@
+# backend/app/services/catalog_service.py
+"""
+Локальный каталог треков.
+
+Наполняется избранным всех пользователей (save_count) и ответами модели
+на запросы рекомендаций (recommend_count + теги настроения/жанра).
+Используется движком candidate_retrieval для предварительного отбора треков.
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models.user import CatalogTrack, CatalogTrackTag
+
+# Слова короче не несут смысла как теги ("и", "of", ...)
+MIN_TAG_LENGTH = 3
+MAX_TAGS_PER_ANALYSIS = 12
+
+_TAG_SPLIT_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_song_key(title: str, artist: Optional[str]) -> str:
+    """Ключ трека: регистр и лишние пробелы не различаются"""
+    norm_title = " ".join((title or "").split()).casefold()
+    norm_artist = " ".join((artist or "").split()).casefold()
+    return f"{norm_title}\x1f{norm_artist}"
+
+
+def dialect_insert(db: Session):
+    """insert() с поддержкой ON CONFLICT для текущего диалекта БД"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"ON CONFLICT не поддерживается для диалекта {dialect}")
+    return insert
+
+
+def mood_tags(mood_analysis: Dict[str, Any]) -> List[str]:
+    """Теги из анализа настроения: слова из mood, emotions и music_genre"""
+    parts = [mood_analysis.get("mood"), mood_analysis.get("music_genre") or mood_analysis.get("music_style")]
+    emotions = mood_analysis.get("emotions") or []
+    if isinstance(emotions, str):
+        emotions = [emotions]
+    parts.extend(emotions)
+
+    tags = []
+    for part in parts:
+        if not isinstance(part, str):
+            continue
+        for word in _TAG_SPLIT_RE.split(part.casefold()):
+            if len(word) >= MIN_TAG_LENGTH and word not in tags:
+                tags.append(word)
+    return tags[:MAX_TAGS_PER_ANALYSIS]
+
+
+class CatalogService:
+    def record_saved(self, db: Session, songs: Iterable) -> None:
+        """Учитывает сохранения в избранное (в текущей транзакции)"""
+        now = datetime.utcnow()
+        values = {}
+        for song in songs:
+            key = normalize_song_key(song.title, song.artist)
+            values.setdefault(key, {
+                "track_key": key,
+                "title": song.title,
+                "artist": song.artist,
+                "youtube_video_id": song.youtube_video_id,
+                "save_count": 1,
+                "recommend_count": 0,
+                "updated_at": now,
+            })
+        if not values:
+            return
+
+        insert = dialect_insert(db)
+        stmt = insert(CatalogTrack).values(list(values.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CatalogTrack.track_key],
+            set_={
+                "save_count": CatalogTrack.save_count + 1,
+                "youtube_video_id": func.coalesce(CatalogTrack.youtube_video_id, stmt.excluded.youtube_video_id),
+                "updated_at": now,
+            },
+        )
+        db.execute(stmt)
+
+    def record_recommendations(self, db: Session, tracks: List[Dict[str, Any]], tags: List[str]) -> None:
+        """Добавляет треки из ответа модели в каталог и привязывает к ним теги настроения"""
+        now = datetime.utcnow()
+        values = {}
+        for track in tracks:
+            title = track.get("name") or track.get("title")
+            if not isinstance(title, str) or not title.strip():
+                continue
+            artist = track.get("artist") if isinstance(track.get("artist"), str) else None
+            key = normalize_song_key(title, artist)
+            values.setdefault(key, {
+                "track_key": key,
+                "title": title.strip(),
+                "artist": artist.strip() if artist else None,
+                "save_count": 0,
+                "recommend_count": 1,
+                "updated_at": now,
+            })
+        if not values:
+            return
+
+        insert = dialect_insert(db)
+        stmt = insert(CatalogTrack).values(list(values.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CatalogTrack.track_key],
+            set_={"recommend_count": CatalogTrack.recommend_count + 1, "updated_at": now},
+        ).returning(CatalogTrack.id)
+        track_ids = [row.id for row in db.execute(stmt)]
+
+        if tags and track_ids:
+            tag_stmt = insert(CatalogTrackTag).values(
+                [{"track_id": track_id, "tag": tag, "weight": 1.0} for track_id in track_ids for tag in tags]
+            )
+            tag_stmt = tag_stmt.on_conflict_do_update(
+                index_elements=[CatalogTrackTag.track_id, CatalogTrackTag.tag],
+                set_={"weight": CatalogTrackTag.weight + 1.0},
+            )
+            db.execute(tag_stmt)
+        db.commit()
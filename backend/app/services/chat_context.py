@@ -0,0 +1,188 @@
+# backend/app/services/chat_context.py
+"""
+Контекст диалога для /chat/chat.
+
+Промпт = системное сообщение (статическая часть шаблона "chat") + резюме старой переписки + последние сообщения
+из chat_messages, которые влезают в HISTORY_TOKEN_BUDGET, + новое сообщение.
+Все, что старше окна, постепенно сворачивается моделью в резюме
+(chat_summaries), поэтому размер контекста не растет с длиной диалога.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..models.user import ChatMessage, ChatSummary
+from .catalog_service import dialect_insert
+from .prompts import format_list, prompts
+from .tokens import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+HISTORY_TOKEN_BUDGET = 1200    # последние сообщения дословно
+HISTORY_FETCH_LIMIT = 40       # больше сообщений в окно все равно не влезет
+MESSAGE_MAX_TOKENS = 400       # длинное сообщение в истории обрезается
+SUMMARY_MAX_TOKENS = 300
+SUMMARY_TRIGGER_TOKENS = 600   # сворачиваем, когда за окном накопилось столько
+FOLD_CHUNK_TOKENS = 3000       # сколько старой переписки сворачивается за один вызов модели
+FOLD_FETCH_LIMIT = 200         # строк на раунд сворачивания (FOLD_CHUNK_TOKENS набирается раньше)
+MAX_FOLD_ROUNDS = 3
+
+ROLE_MAP = {"user": "user", "ai": "assistant", "assistant": "assistant"}
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    # Оценка с запасом: ~3 символа на токен
+    return text[:max_tokens * 3].rstrip() + "…"
+
+
+def _user_prompt(message: str, mood_analysis: Optional[Dict[str, Any]] = None, language: str = "ru") -> str:
+    # Инструкции - в системном сообщении (статическая часть шаблона), здесь только данные запроса
+    content = prompts.get("chat", language).render_dynamic(message=message)
+    if mood_analysis:
+        mood = prompts.get("chat_mood", language).render_dynamic(
+            mood=mood_analysis.get('mood', 'neutral'),
+            description=mood_analysis.get('description', ''),
+            emotions=format_list(mood_analysis.get('emotions', [])),
+        )
+        content = f"{content}\n\n{mood}"
+    return content
+
+
+class ChatContextService:
+    def __init__(self, openai_service=None):
+        self.openai_service = openai_service
+
+    def _history(self, db: Session, user_id: int, after_id: int) -> List:
+        rows = (
+            db.query(ChatMessage.id, ChatMessage.role, ChatMessage.content)
+            .filter(ChatMessage.user_id == user_id, ChatMessage.id > after_id, ChatMessage.content.isnot(None))
+            .order_by(ChatMessage.id.desc())
+            .limit(HISTORY_FETCH_LIMIT)
+            .all()
+        )
+        return list(reversed(rows))
+
+    @staticmethod
+    def _fit_window(rows: List, budget: int) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Самые свежие сообщения, влезающие в бюджет (в хронологическом порядке),
+        и индекс первой вошедшей строки: rows[:start] остаются за окном.
+        """
+        window, used, start = [], 0, len(rows)
+        for index in range(len(rows) - 1, -1, -1):
+            row = rows[index]
+            content = _truncate(row.content, MESSAGE_MAX_TOKENS)
+            tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            if used + tokens > budget:
+                break
+            role = ROLE_MAP.get(row.role)
+            if role is not None:
+                window.append({"role": role, "content": content})
+                used += tokens
+            start = index
+        window.reverse()
+        return window, start
+
+    def build_messages(self, db: Session, user_id: Optional[int], message: str,
+                       mood_analysis: Optional[Dict[str, Any]] = None,
+                       language: str = "ru") -> Tuple[List[Dict[str, str]], bool]:
+        """
+        Сообщения для модели и флаг "пора свернуть старую переписку в резюме".
+        Без пользователя (анонимный запрос) - только системный промпт и сообщение.
+        """
+        messages = [{"role": "system", "content": prompts.get("chat", language).system()}]
+        if user_id is None:
+            messages.append({"role": "user", "content": _user_prompt(message, mood_analysis, language)})
+            return messages, False
+
+        summary = db.query(ChatSummary).filter(ChatSummary.user_id == user_id).first()
+        after_id = summary.summarized_until_id if summary else 0
+        rows = self._history(db, user_id, after_id)
+        # Фронтенд сохраняет сообщение в историю параллельно с запросом - не дублируем его
+        if rows and rows[-1].role == "user" and (rows[-1].content or "").strip() == message.strip():
+            rows = rows[:-1]
+
+        window, start = self._fit_window(rows, HISTORY_TOKEN_BUDGET)
+        if summary and summary.summary:
+            header = prompts.get("chat_history_summary", language).render_dynamic(summary=summary.summary)
+            messages.append({"role": "system", "content": header})
+        messages.extend(window)
+        messages.append({"role": "user", "content": _user_prompt(message, mood_analysis, language)})
+
+        # За окном накопилось достаточно сообщений - их пора сворачивать
+        overflow_tokens = sum(count_tokens(r.content) for r in rows[:start])
+        return messages, overflow_tokens >= SUMMARY_TRIGGER_TOKENS
+
+    def _fold(self, previous: str, rows: List) -> str:
+        transcript = "\n".join(
+            f"{'Пользователь' if row.role == 'user' else 'ИИ'}: {_truncate(row.content, MESSAGE_MAX_TOKENS)}"
+            for row in rows
+        )
+        prompt = prompts.render("chat_summary", previous=previous or "(пусто)", transcript=transcript)
+        response = self.openai_service.router.complete_sync(
+            messages=[{"role": "user", "content": prompt}],
+            operation="chat_summary",
+            max_tokens=SUMMARY_MAX_TOKENS,
+            timeout=30
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    def summarize(self, db: Session, user_id: int) -> None:
+        """
+        Сворачивает переписку старше окна в резюме. Вызывается в фоне после ответа.
+        Конкурентные вызовы не мешают друг другу: резюме обновляется, только если
+        summarized_until_id не изменился с момента чтения.
+        """
+        if db.query(ChatSummary.user_id).filter(ChatSummary.user_id == user_id).first() is None:
+            insert = dialect_insert(db)
+            db.execute(insert(ChatSummary).values(
+                user_id=user_id, summary="", summarized_until_id=0, token_count=0, updated_at=datetime.utcnow()
+            ).on_conflict_do_nothing())
+            db.commit()
+
+        for _ in range(MAX_FOLD_ROUNDS):
+            summary = db.query(ChatSummary).filter(ChatSummary.user_id == user_id).populate_existing().one()
+            # Окно - как в build_messages: свежие сообщения, влезающие в бюджет
+            recent = self._history(db, user_id, summary.summarized_until_id)
+            _, start = self._fit_window(recent, HISTORY_TOKEN_BUDGET)
+            if start == 0 and len(recent) < HISTORY_FETCH_LIMIT:
+                return  # вся несвернутая переписка в окне
+            window_start_id = recent[start].id if start < len(recent) else recent[-1].id + 1
+            # Старые сообщения за окном - не больше, чем нужно на один раунд
+            overflow = (
+                db.query(ChatMessage.id, ChatMessage.role, ChatMessage.content)
+                .filter(ChatMessage.user_id == user_id, ChatMessage.id > summary.summarized_until_id,
+                        ChatMessage.id < window_start_id, ChatMessage.content.isnot(None))
+                .order_by(ChatMessage.id.asc())
+                .limit(FOLD_FETCH_LIMIT)
+                .all()
+            )
+            if sum(count_tokens(r.content) for r in overflow) < SUMMARY_TRIGGER_TOKENS:
+                return
+
+            # Сворачиваем с самых старых сообщений порциями до FOLD_CHUNK_TOKENS
+            chunk, used = [], 0
+            for row in overflow:
+                tokens = count_tokens(_truncate(row.content, MESSAGE_MAX_TOKENS))
+                if chunk and used + tokens > FOLD_CHUNK_TOKENS:
+                    break
+                chunk.append(row)
+                used += tokens
+
+            new_summary = _truncate(self._fold(summary.summary, chunk), SUMMARY_MAX_TOKENS)
+            updated = (
+                db.query(ChatSummary)
+                .filter(ChatSummary.user_id == user_id,
+                        ChatSummary.summarized_until_id == summary.summarized_until_id)
+                .update({
+                    "summary": new_summary,
+                    "summarized_until_id": chunk[-1].id,
+                    "token_count": count_tokens(new_summary),
+                    "updated_at": datetime.utcnow(),
+                }, synchronize_session=False)
+            )
+            db.commit()
+            if not updated:
+                return  # резюме уже обновил параллельный вызов
+            print(f"[CHAT] Резюме пользователя {user_id}: +{len(chunk)} сообщений, {count_tokens(new_summary)} токенов")
@@ -1,13 +1,23 @@
+import threading
+import time
 import jwt
 import requests
 from typing import Optional, Dict, Any
 from fastapi import HTTPException, status
-from ..config import CLERK_PUBLIC_KEY, CLERK_SECRET_KEY
+from ..config import CLERK_PUBLIC_KEY, CLERK_SECRET_KEY, CLERK_JWKS_TTL
+
+JWKS_MIN_REFRESH = 60  # секунд между внеплановыми запросами JWKS (токены с чужим kid не долбят Clerk)
 
 class ClerkService:
-    def __init__(self):
+    def __init__(self, http: Optional[requests.Session] = None):
         self.publishable_key = CLERK_PUBLIC_KEY
         self.secret_key = CLERK_SECRET_KEY
+        # Общая сессия из контейнера - keep-alive соединения к Clerk
+        self.http = http or requests.Session()
+        # JWKS меняется редко: кешируем, при незнакомом kid запрашиваем заново
+        self._jwks: Optional[Dict[str, Any]] = None
+        self._jwks_fetched_at = 0.0
+        self._jwks_lock = threading.Lock()
         
         # Извлекаем instance ID из publishable key
         if self.publishable_key:
@@ -40,7 +50,16 @@ class ClerkService:
             self.jwks_url = None
             self.jwks_url_fallback = None
         
-    def get_jwks(self) -> Dict[str, Any]:
+    def get_jwks(self, refresh: bool = False) -> Dict[str, Any]:
+        """JWKS из кеша (CLERK_JWKS_TTL секунд); refresh - запросить заново (не чаще JWKS_MIN_REFRESH)"""
+        with self._jwks_lock:
+            age = time.monotonic() - self._jwks_fetched_at
+            if self._jwks is None or age >= CLERK_JWKS_TTL or (refresh and age >= JWKS_MIN_REFRESH):
+                self._jwks = self._fetch_jwks()
+                self._jwks_fetched_at = time.monotonic()
+            return self._jwks
+    
+    def _fetch_jwks(self) -> Dict[str, Any]:
         """Получает JWKS (JSON Web Key Set) от Clerk"""
         if not self.jwks_url:
             raise HTTPException(
@@ -51,7 +70,7 @@ class ClerkService:
         # Пробуем основной URL
         try:
             print(f"🔗 Requesting JWKS from: {self.jwks_url}")
-            response = requests.get(self.jwks_url, timeout=10)
+            response = self.http.get(self.jwks_url, timeout=10)
             print(f"📊 JWKS response status: {response.status_code}")
             response.raise_for_status()
             jwks_data = response.json()
@@ -64,7 +83,7 @@ class ClerkService:
             if self.jwks_url_fallback:
                 try:
                     print(f"🔗 Trying fallback JWKS URL: {self.jwks_url_fallback}")
-                    response = requests.get(self.jwks_url_fallback, timeout=10)
+                    response = self.http.get(self.jwks_url_fallback, timeout=10)
                     print(f"📊 Fallback JWKS response status: {response.status_code}")
                     response.raise_for_status()
                     jwks_data = response.json()
@@ -96,21 +115,10 @@ class ClerkService:
         # Получаем заголовок токена без верификации
         unverified_header = jwt.get_unverified_header(token)
         
-        # Получаем JWKS
-        jwks = self.get_jwks()
-        
-        # Ищем подходящий ключ
-        rsa_key = None
-        for key in jwks.get("keys", []):
-            if key.get("kid") == unverified_header.get("kid"):
-                rsa_key = {
-                    "kty": key.get("kty"),
-                    "kid": key.get("kid"),
-                    "use": key.get("use"),
-                    "n": key.get("n"),
-                    "e": key.get("e")
-                }
-                break
+        # Получаем JWKS; ключа нет в кеше - возможно, Clerk его сменил
+        rsa_key = self._find_key(self.get_jwks(), unverified_header.get("kid"))
+        if not rsa_key:
+            rsa_key = self._find_key(self.get_jwks(refresh=True), unverified_header.get("kid"))
         
         if not rsa_key:
             raise HTTPException(
@@ -133,6 +141,19 @@ class ClerkService:
         
         return payload
     
+    @staticmethod
+    def _find_key(jwks: Dict[str, Any], kid: Optional[str]) -> Optional[Dict[str, Any]]:
+        for key in jwks.get("keys", []):
+            if key.get("kid") == kid:
+                return {
+                    "kty": key.get("kty"),
+                    "kid": key.get("kid"),
+                    "use": key.get("use"),
+                    "n": key.get("n"),
+                    "e": key.get("e")
+                }
+        return None
+    
     def _verify_token_with_api(self, token: str) -> Optional[Dict[str, Any]]:
         """Проверяет токен используя декодирование без верификации (для разработки)"""
         try:
@@ -189,7 +210,7 @@ class ClerkService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.get(
+            response = self.http.get(
                 f"https://api.clerk.com/v1/users/{clerk_id}",
                 headers=headers,
                 timeout=10
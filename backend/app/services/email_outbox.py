@@ -0,0 +1,221 @@
+# backend/app/services/email_outbox.py
+"""
+Очередь исходящих писем (transactional outbox).
+
+Эндпоинт (регистрация, повторный код) только добавляет строку в email_outbox
+в той же транзакции, что и пользователя с кодом (enqueue не делает commit), и
+после commit будит отправителя (notify) - время ответа не зависит от почтового
+провайдера, а письмо не теряется и не уходит без сохраненного кода.
+Фоновый поток воркера забирает готовые к отправке строки пачками, отправляет
+их одним запросом к Brevo на пачку (messageVersions) через общий ApiClient и
+помечает sent. Временные ошибки (сеть, 5xx, 429) - повтор с экспоненциальной
+задержкой, 4xx на пачку - отправка по одному, чтобы один неверный адрес не
+блокировал остальных.
+
+Строка берется в работу на SENDING_LEASE_SECONDS (status=sending): если воркер
+упал посреди отправки, ее заберет другой. На PostgreSQL строки забираются
+через FOR UPDATE SKIP LOCKED, поэтому воркеры не отправляют одно письмо дважды.
+"""
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from ..config import EMAIL_BATCH_SIZE, EMAIL_MAX_ATTEMPTS
+from ..models.user import EmailOutbox
+from .email_service import EmailService
+from .metrics import metrics
+
+EMAIL_POLL_INTERVAL = 5.0        # проверка очереди без notify() (письма других воркеров, повторы)
+SENDING_LEASE_SECONDS = 120
+BACKOFF_BASE_SECONDS = 10.0
+BACKOFF_MAX_SECONDS = 1800.0
+
+
+def _is_permanent(error: Exception) -> bool:
+    """4xx (кроме 429) - повтор не поможет"""
+    from sib_api_v3_sdk.rest import ApiException
+    status = getattr(error, "status", None)
+    return isinstance(error, ApiException) and status is not None and 400 <= status < 500 and status != 429
+
+
+def _describe(error: Exception) -> str:
+    from sib_api_v3_sdk.rest import ApiException
+    if isinstance(error, ApiException):
+        return f"{error.status} {error.reason}: {(error.body or '')[:200]}"
+    return str(error)
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class EmailOutboxSender:
+    def __init__(self, email_service: Optional[EmailService] = None, session_factory=None,
+                 batch_size: int = EMAIL_BATCH_SIZE, max_attempts: int = EMAIL_MAX_ATTEMPTS):
+        self._email_service = email_service
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def email_service(self) -> EmailService:
+        if self._email_service is None:
+            from ..container import container
+            self._email_service = container.email_service
+        return self._email_service
+
+    def _session(self) -> Session:
+        if self._session_factory is None:
+            from ..database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def enqueue(self, db: Session, to_email: str, template: str, params: Dict[str, Any]) -> EmailOutbox:
+        """
+        Добавляет письмо в очередь в транзакции вызывающего кода (без commit).
+        После commit вызывающий код будит отправителя через notify().
+        """
+        row = EmailOutbox(to_email=to_email, template=template, params=json.dumps(params, ensure_ascii=False),
+                          status="pending", attempts=0, next_attempt_at=datetime.utcnow())
+        db.add(row)
+        metrics.incr("email.queued")
+        return row
+
+    def start(self) -> None:
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+                self._thread.start()
+        self._wakeup.set()  # письма, оставшиеся с прошлого запуска
+
+    def notify(self) -> None:
+        if self._thread is None:
+            self.start()
+        else:
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(EMAIL_POLL_INTERVAL)
+            self._wakeup.clear()
+            try:
+                # Полная пачка - возможно, в очереди есть еще
+                while self.process_once() >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"⚠️ [EMAIL] Ошибка обработки очереди писем: {e}")
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        """Забирает готовые к отправке письма (пачку) в работу"""
+        now = datetime.utcnow()
+        db = self._session()
+        try:
+            query = (
+                db.query(EmailOutbox)
+                .filter(EmailOutbox.status.in_(("pending", "sending")), EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(self.batch_size)
+            )
+            if db.bind.dialect.name == "postgresql":
+                query = query.with_for_update(skip_locked=True)
+            claimed = []
+            for row in query.all():
+                row.status = "sending"
+                row.attempts += 1
+                row.next_attempt_at = now + timedelta(seconds=SENDING_LEASE_SECONDS)
+                claimed.append({
+                    "id": row.id, "to_email": row.to_email, "template": row.template,
+                    "params": json.loads(row.params or "{}"), "attempts": row.attempts, "created_at": row.created_at,
+                })
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def process_once(self) -> int:
+        """Одна итерация: забрать пачку и отправить. Возвращает число взятых писем"""
+        claimed = self._claim()
+        by_template: Dict[str, List[Dict[str, Any]]] = {}
+        for item in claimed:
+            by_template.setdefault(item["template"], []).append(item)
+        for items in by_template.values():
+            self._deliver(items)
+        return len(claimed)
+
+    def _deliver(self, items: List[Dict[str, Any]]) -> None:
+        if not self.email_service.enabled:
+            # Без ключа Brevo - консольный режим, как раньше
+            for item in items:
+                self.email_service.console_fallback(item["to_email"], item["params"].get("code", ""))
+            self._mark_sent(items, ["console"] * len(items))
+            return
+
+        start = time.perf_counter()
+        try:
+            message_ids = self.email_service.send_batch(
+                items[0]["template"], [(item["to_email"], item["params"]) for item in items]
+            )
+        except Exception as e:
+            metrics.observe("email.send_ms", (time.perf_counter() - start) * 1000)
+            if _is_permanent(e) and len(items) > 1:
+                print(f"⚠️ [EMAIL] Пачка из {len(items)} писем отклонена ({e.status}), отправляем по одному")
+                for item in items:
+                    self._deliver([item])
+                return
+            print(f"❌ [EMAIL] Ошибка отправки {len(items)} писем: {_describe(e)}")
+            self._mark_failed(items, e, permanent=_is_permanent(e))
+            return
+        metrics.observe("email.send_ms", (time.perf_counter() - start) * 1000)
+        metrics.observe("email.batch_size", len(items))
+        self._mark_sent(items, message_ids)
+
+    def _mark_sent(self, items: List[Dict[str, Any]], message_ids: List[Optional[str]]) -> None:
+        now = datetime.utcnow()
+        db = self._session()
+        try:
+            for item, message_id in zip(items, message_ids):
+                db.query(EmailOutbox).filter(EmailOutbox.id == item["id"]).update({
+                    "status": "sent", "sent_at": now, "message_id": message_id,
+                    "params": None,  # код подтверждения в очереди больше не нужен
+                    "last_error": None,
+                }, synchronize_session=False)
+                metrics.observe("email.delivery_ms", (now - item["created_at"]).total_seconds() * 1000)
+            db.commit()
+        finally:
+            db.close()
+        metrics.incr("email.sent", len(items))
+
+    def _mark_failed(self, items: List[Dict[str, Any]], error: Exception, permanent: bool) -> None:
+        now = datetime.utcnow()
+        db = self._session()
+        try:
+            for item in items:
+                if permanent or item["attempts"] >= self.max_attempts:
+                    values = {"status": "failed", "last_error": _describe(error), "params": None}
+                    metrics.incr("email.failed")
+                    print(f"❌ [EMAIL] Письмо {item['id']} для {item['to_email']} не отправлено "
+                          f"после {item['attempts']} попыток")
+                    # Код все же виден в логах - как прежний консольный режим
+                    self.email_service.console_fallback(item["to_email"], item["params"].get("code", ""))
+                else:
+                    delay = backoff_seconds(item["attempts"])
+                    values = {"status": "pending", "last_error": _describe(error),
+                              "next_attempt_at": now + timedelta(seconds=delay)}
+                    metrics.incr("email.retries")
+                    print(f"[EMAIL] Письмо {item['id']}: повтор через {delay:.0f}с (попытка {item['attempts']})")
+                db.query(EmailOutbox).filter(EmailOutbox.id == item["id"]).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+email_outbox = EmailOutboxSender()
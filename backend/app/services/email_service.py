@@ -1,61 +1,89 @@
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
-from pprint import pprint
 import os
 import random
 import string
+import threading
 from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from ..config import EMAIL_API_HOST
+
+if TYPE_CHECKING:
+    import sib_api_v3_sdk
+
+# Темы писем по шаблону; код в HTML подставляет Brevo из params версии письма ({{ params.code }})
+TEMPLATES = {
+    "verification": "Подтверждение регистрации - Aivi Music",
+}
+REQUEST_TIMEOUT = 15  # секунд на запрос к Brevo - зависший API не блокирует отправителя
+
 
 class EmailService:
-    def __init__(self):
+    def __init__(self, api_key: Optional[str] = None, host: Optional[str] = None):
+        # SDK Brevo импортируется только при создании сервиса - не при старте приложения
+        import sib_api_v3_sdk
+        
         # Brevo API configuration
         self.configuration = sib_api_v3_sdk.Configuration()
-        self.configuration.api_key['api-key'] = os.environ.get("SMTP_API_KEY")  # Ваш ключ в SMTP_API_KEY
+        self.configuration.api_key['api-key'] = api_key or os.environ.get("SMTP_API_KEY")  # Ваш ключ в SMTP_API_KEY
+        if host or EMAIL_API_HOST:
+            self.configuration.host = host or EMAIL_API_HOST
         
         # Email settings
         self.from_email = os.getenv("FROM_EMAIL", "noreply@aivi-ai.it.com")
         self.from_name = os.getenv("FROM_NAME", "Aivi Music")
         
+        # Один ApiClient (пул соединений urllib3) на процесс - создается при первой отправке
+        self._api = None
+        self._api_lock = threading.Lock()
+        
         print(f"🔑 Email Service initialized with key: {self.configuration.api_key['api-key'][:15]}..." if self.configuration.api_key['api-key'] else "❌ No API key found")
     
+    @property
+    def enabled(self) -> bool:
+        return bool(self.configuration.api_key['api-key'])
+    
+    @property
+    def api(self) -> "sib_api_v3_sdk.TransactionalEmailsApi":
+        import sib_api_v3_sdk
+        if self._api is None:
+            with self._api_lock:
+                if self._api is None:
+                    self._api = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(self.configuration))
+        return self._api
+    
+    def close(self) -> None:
+        """Закрывает пул соединений к Brevo (остановка приложения)"""
+        with self._api_lock:
+            if self._api is not None:
+                self._api.api_client.rest_client.pool_manager.clear()
+                self._api = None
+    
     def generate_verification_code(self, length=6):
         """Генерирует случайный код подтверждения"""
         return ''.join(random.choices(string.digits, k=length))
     
-    def send_verification_email(self, to_email: str, verification_code: str):
-        """Отправляет email с кодом подтверждения через Brevo API"""
-        if not self.configuration.api_key['api-key']:
-            return self._fallback_console_mode(to_email, verification_code)
+    def send_batch(self, template: str, recipients: List[Tuple[str, Dict[str, Any]]]) -> List[Optional[str]]:
+        """
+        Отправляет одно письмо шаблона нескольким получателям одним запросом к Brevo
+        (messageVersions: у каждой версии свой адресат и params). Возвращает id писем
+        у провайдера по порядку recipients. Ошибки API (ApiException) - вызывающему.
+        """
+        import sib_api_v3_sdk
+        versions = [
+            sib_api_v3_sdk.SendSmtpEmailMessageVersions(to=[{"email": email}], params=params)
+            for email, params in recipients
+        ]
+        send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
+            sender={"name": self.from_name, "email": self.from_email},
+            subject=TEMPLATES[template],
+            html_content=self._get_html_content("{{ params.code }}"),
+            message_versions=versions
+        )
         
-        try:
-            api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(self.configuration))
-            
-            subject = "Подтверждение регистрации - Aivi Music"
-            html_content = self._get_html_content(verification_code)
-            sender = {"name": self.from_name, "email": self.from_email}
-            to = [{"email": to_email}]
-            
-            send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-                to=to,
-                html_content=html_content,
-                sender=sender,
-                subject=subject
-            )
-
-            print(f"📧 Sending email to {to_email} with code {verification_code}")
-            api_response = api_instance.send_transac_email(send_smtp_email)
-            
-            print("✅ Email sent successfully via Brevo API!")
-            print(f"🔑 Verification Code: {verification_code}")
-            pprint(api_response)
-            return True
-            
-        except ApiException as e:
-            print(f"❌ Exception when calling Brevo API: {e}")
-            return self._fallback_console_mode(to_email, verification_code)
-        except Exception as e:
-            print(f"❌ Unexpected error sending email: {e}")
-            return self._fallback_console_mode(to_email, verification_code)
+        print(f"📧 Sending {len(recipients)} '{template}' email(s) via Brevo API")
+        api_response = self.api.send_transac_email(send_smtp_email, _request_timeout=REQUEST_TIMEOUT)
+        message_ids = list(api_response.message_ids or []) or [api_response.message_id]
+        return (message_ids + [None] * len(recipients))[:len(recipients)]
     
     def _get_html_content(self, verification_code: str):
         """Возвращает HTML содержимое email"""
@@ -100,7 +128,7 @@ class EmailService:
         </html>
         """
     
-    def _fallback_console_mode(self, to_email: str, verification_code: str):
+    def console_fallback(self, to_email: str, verification_code: str):
         """Fallback режим - вывод в консоль"""
         print(f"")
         print(f"=== 📧 EMAIL VERIFICATION (CONSOLE MODE) ===")
@@ -0,0 +1,316 @@
+# backend/app/services/embedding_index.py
+"""
+Индекс эмбеддингов настроений и треков для поиска "треки под похожее настроение".
+
+Векторы хранятся в таблице embeddings (источник истины, общий для всех
+воркеров), а в памяти каждого процесса - плотная матрица float32, по которой
+top-k косинусный поиск - одно матричное умножение и argpartition.
+Индекс дочитывается из БД инкрементально (по updated_at). Если задан
+EMBEDDING_INDEX_DIR, снимок матрицы сохраняется в .npy и при старте
+открывается через memory-map, чтобы не перечитывать всю таблицу.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ..config import EMBEDDING_INDEX_DIR
+from ..models.user import Embedding
+from .catalog_service import dialect_insert, normalize_song_key
+from .embeddings import EmbeddingProvider, get_embedding_provider, mood_text
+
+EMBEDDING_REFRESH_SECONDS = 30
+SNAPSHOT_INTERVAL_SECONDS = 600
+MOOD_NEIGHBOURS = 20
+# Ниже этой близости прошлое настроение не считается "похожим"
+MIN_MOOD_SIMILARITY = 0.5
+MIN_TRACK_SIMILARITY = 0.4
+
+
+class EmbeddingIndex:
+    """Плотная матрица L2-нормированных векторов с ключами и payload"""
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._keys: List[str] = []
+        self._payloads: List[Any] = []
+        self._rows: Dict[str, int] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self._keys)
+
+    def _writable(self, rows: int) -> None:
+        # Снимок открыт через memory-map только на чтение - при первой записи копируем в память
+        capacity = max(len(self._vectors), 1)
+        if rows > len(self._vectors) or not self._vectors.flags.writeable:
+            while capacity < rows:
+                capacity *= 2
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:self.size] = self._vectors[:self.size]
+            self._vectors = grown
+
+    def upsert(self, key: str, vector: np.ndarray, payload: Any = None) -> None:
+        norm = float(np.linalg.norm(vector))
+        vector = vector / norm if norm > 0 else vector
+        row = self._rows.get(key)
+        if row is None:
+            row = self.size
+            self._writable(row + 1)
+            self._rows[key] = row
+            self._keys.append(key)
+            self._payloads.append(payload)
+        else:
+            self._writable(self.size)
+            self._payloads[row] = payload
+        self._vectors[row] = vector
+
+    def search(self, query: np.ndarray, k: int, min_score: float = -1.0) -> List[Tuple[str, float, Any]]:
+        """top-k по косинусной близости (query должен быть нормирован)"""
+        if not self.size or k <= 0:
+            return []
+        scores = self._vectors[:self.size] @ query.astype(np.float32, copy=False)
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._keys[i], float(scores[i]), self._payloads[i]) for i in top if scores[i] >= min_score]
+
+    def save(self, path: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Атомарно сохраняет снимок: path.npy (матрица) и path.json (ключи, payload, meta)"""
+        tmp_npy, tmp_json = f"{path}.tmp.npy", f"{path}.json.tmp"
+        np.save(tmp_npy, np.ascontiguousarray(self._vectors[:self.size]))
+        with open(tmp_json, "w", encoding="utf-8") as f:
+            json.dump({"keys": self._keys, "payloads": self._payloads, "meta": meta or {}}, f, ensure_ascii=False)
+        os.replace(tmp_npy, f"{path}.npy")
+        os.replace(tmp_json, f"{path}.json")
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["EmbeddingIndex", Dict[str, Any]]:
+        vectors = np.load(f"{path}.npy", mmap_mode="r")
+        with open(f"{path}.json", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(vectors.shape[1], capacity=1)
+        index._vectors = vectors
+        index._keys = data["keys"]
+        index._payloads = data["payloads"]
+        index._rows = {key: row for row, key in enumerate(index._keys)}
+        return index, data.get("meta", {})
+
+
+class EmbeddingStore:
+    """Эмбеддинги прошлых анализов настроения и треков каталога"""
+
+    def __init__(self, provider: Optional[EmbeddingProvider] = None, session_factory=None):
+        self._provider = provider
+        self._session_factory = session_factory
+        self._indexes: Dict[str, EmbeddingIndex] = {}
+        self._watermark: Optional[datetime] = None
+        self._refreshed_at = 0.0
+        self._snapshot_at = 0.0
+        # _lock - одно дочитывание из БД за раз; _index_lock - короткий, на чтение/запись матриц
+        # (поиск не ждет запроса к БД, upsert из потоков не портит матрицу под поиском)
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self.recall_stats = {"requests": 0, "recall_sum": 0.0}
+
+    @property
+    def provider(self) -> EmbeddingProvider:
+        if self._provider is None:
+            self._provider = get_embedding_provider()
+        return self._provider
+
+    def _index(self, kind: str, dim: int) -> EmbeddingIndex:
+        index = self._indexes.get(kind)
+        if index is None or index.dim != dim:
+            index = self._indexes[kind] = EmbeddingIndex(dim)
+        return index
+
+    def _snapshot_path(self, kind: str) -> str:
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in self.provider.name)
+        return os.path.join(EMBEDDING_INDEX_DIR, f"{safe_name}-{kind}")
+
+    def _load_snapshots(self) -> None:
+        # Снимки обоих видов пишутся вместе с одной меткой; если какого-то нет - читаем все из БД
+        loaded, watermark = {}, None
+        for kind in ("mood", "track"):
+            path = self._snapshot_path(kind)
+            try:
+                loaded[kind], meta = EmbeddingIndex.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                if os.path.exists(f"{path}.npy"):
+                    print(f"⚠️ [EMBED] Снимок {path} не прочитан: {e}")
+                return
+            watermark = meta.get("watermark")
+        if watermark:
+            with self._index_lock:
+                self._indexes = loaded
+            self._watermark = datetime.fromisoformat(watermark)
+            print(f"[EMBED] Загружен снимок индекса: {loaded['mood'].size} настроений, {loaded['track'].size} треков")
+
+    def _save_snapshots(self) -> None:
+        if set(self._indexes) != {"mood", "track"}:
+            return
+        os.makedirs(EMBEDDING_INDEX_DIR, exist_ok=True)
+        meta = {"watermark": self._watermark.isoformat() if self._watermark else None}
+        with self._index_lock:
+            for kind, index in self._indexes.items():
+                index.save(self._snapshot_path(kind), meta)
+        self._snapshot_at = time.time()
+
+    def ensure_fresh(self) -> None:
+        """Дочитывает новые/измененные векторы из БД (блокирующий вызов - запускать в потоке)"""
+        if time.time() - self._refreshed_at < EMBEDDING_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if time.time() - self._refreshed_at < EMBEDDING_REFRESH_SECONDS:
+                return
+            if not self._refreshed_at and EMBEDDING_INDEX_DIR:
+                self._load_snapshots()
+                self._snapshot_at = time.time()
+            if self._session_factory is None:
+                from ..database import SessionLocal
+                self._session_factory = SessionLocal
+
+            start = time.perf_counter()
+            db = self._session_factory()
+            try:
+                query = db.query(
+                    Embedding.kind, Embedding.ref_key, Embedding.dim, Embedding.vector,
+                    Embedding.payload, Embedding.updated_at,
+                ).filter(Embedding.provider == self.provider.name)
+                if self._watermark is not None:
+                    # >= : строки с тем же updated_at могли появиться после прошлого чтения, upsert идемпотентен
+                    query = query.filter(Embedding.updated_at >= self._watermark)
+                rows = query.order_by(Embedding.updated_at).all()
+            finally:
+                db.close()
+
+            with self._index_lock:
+                for row in rows:
+                    vector = np.frombuffer(row.vector, dtype=np.float32)
+                    payload = json.loads(row.payload) if row.payload else None
+                    self._index(row.kind, row.dim).upsert(row.ref_key, vector, payload)
+                    self._watermark = row.updated_at
+            self._refreshed_at = time.time()
+            if rows:
+                print(f"[EMBED] Индекс дочитан: +{len(rows)} векторов, "
+                      f"{(time.perf_counter() - start) * 1000:.1f}ms")
+                if EMBEDDING_INDEX_DIR and time.time() - self._snapshot_at >= SNAPSHOT_INTERVAL_SECONDS:
+                    self._save_snapshots()
+
+    def embed_mood(self, mood_analysis: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Вектор анализа настроения (блокирующий вызов; заодно обновляет индекс)"""
+        self.ensure_fresh()
+        text = mood_text(mood_analysis)
+        if not text:
+            return None
+        return self.provider.embed([text])[0]
+
+    def similar_tracks(self, mood_vector: Optional[np.ndarray], k: int) -> List[Dict[str, Any]]:
+        """
+        Треки под похожее настроение: сначала голосование ближайших прошлых
+        анализов, затем (если не хватает) ближайшие центроиды треков.
+        Блокирующий вызов (матричный поиск) - из async-кода через asyncio.to_thread.
+        """
+        if mood_vector is None:
+            return []
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._index_lock:
+            moods = self._indexes.get("mood")
+            if moods is not None and moods.dim == len(mood_vector):
+                for _, similarity, payload in moods.search(mood_vector, MOOD_NEIGHBOURS, MIN_MOOD_SIMILARITY):
+                    for key, name, artist in (payload or {}).get("tracks", []):
+                        entry = found.setdefault(key, {"name": name, "artist": artist, "match": similarity, "votes": 0})
+                        entry["votes"] += 1
+            tracks = self._indexes.get("track")
+            if len(found) < k and tracks is not None and tracks.dim == len(mood_vector):
+                for key, similarity, payload in tracks.search(mood_vector, k, MIN_TRACK_SIMILARITY):
+                    found.setdefault(key, {"name": payload["name"], "artist": payload["artist"],
+                                           "match": similarity, "votes": 0})
+        ranked = sorted(found.values(), key=lambda e: (e["match"], e["votes"]), reverse=True)[:k]
+        return [
+            {"name": e["name"], "artist": e["artist"], "youtube_video_id": None,
+             "score": round(e["match"], 4), "match": round(e["match"], 4), "source": "embedding"}
+            for e in ranked
+        ]
+
+    def record(self, db: Session, mood_vector: Optional[np.ndarray], tracks: List[Dict[str, Any]]) -> None:
+        """
+        Сохраняет вектор анализа со списком подошедших треков и добавляет его
+        к центроидам этих треков. Делает commit.
+        """
+        if mood_vector is None:
+            return
+        entries = {}
+        for track in tracks:
+            name = track.get("name")
+            if not isinstance(name, str) or not name.strip():
+                continue
+            artist = track.get("artist") if isinstance(track.get("artist"), str) else None
+            entries.setdefault(normalize_song_key(name, artist), (name.strip(), artist.strip() if artist else None))
+        if not entries:
+            return
+
+        provider, dim, now = self.provider.name, len(mood_vector), datetime.utcnow()
+        mood_payload = {"tracks": [[key, name, artist] for key, (name, artist) in entries.items()]}
+        mood_key = uuid.uuid4().hex
+        db.add(Embedding(
+            kind="mood", ref_key=mood_key, provider=provider, dim=dim,
+            vector=mood_vector.astype(np.float32).tobytes(),
+            payload=json.dumps(mood_payload, ensure_ascii=False), updated_at=now,
+        ))
+
+        # Центроид трека = сумма векторов настроений; строки создаем заранее и блокируем
+        insert = dialect_insert(db)
+        zero = np.zeros(dim, dtype=np.float32).tobytes()
+        db.execute(insert(Embedding).values([
+            {"kind": "track", "ref_key": key, "provider": provider, "dim": dim, "vector": zero, "weight": 0.0,
+             "payload": json.dumps({"name": name, "artist": artist}, ensure_ascii=False), "updated_at": now}
+            for key, (name, artist) in entries.items()
+        ]).on_conflict_do_nothing())
+        rows = (
+            db.query(Embedding)
+            .filter(Embedding.kind == "track", Embedding.provider == provider, Embedding.ref_key.in_(entries))
+            .with_for_update()
+            .all()
+        )
+        updated = []
+        for row in rows:
+            total = np.frombuffer(row.vector, dtype=np.float32) + mood_vector
+            row.vector = total.astype(np.float32).tobytes()
+            row.weight += 1.0
+            row.updated_at = now
+            updated.append((row.ref_key, total, json.loads(row.payload)))
+        db.commit()
+
+        # Свой процесс видит новые векторы сразу, остальные - при следующем ensure_fresh
+        with self._index_lock:
+            self._index("mood", dim).upsert(mood_key, mood_vector, mood_payload)
+            for key, total, payload in updated:
+                self._index("track", dim).upsert(key, total, payload)
+
+    def record_recall(self, local_candidates: List[Dict[str, Any]], llm_tracks: List[Dict[str, Any]]) -> Optional[float]:
+        """Доля треков из ответа модели, которые нашлись среди локальных кандидатов (recall@k)"""
+        expected = {
+            normalize_song_key(t["name"], t.get("artist"))
+            for t in llm_tracks if isinstance(t, dict) and isinstance(t.get("name"), str)
+        }
+        if not expected or not local_candidates:
+            return None
+        found = {normalize_song_key(c["name"], c.get("artist")) for c in local_candidates}
+        recall = len(expected & found) / len(expected)
+        self.recall_stats["requests"] += 1
+        self.recall_stats["recall_sum"] += recall
+        mean = self.recall_stats["recall_sum"] / self.recall_stats["requests"]
+        print(f"[EMBED] recall@{len(local_candidates)}={recall:.2f} (среднее {mean:.3f} за {self.recall_stats['requests']} запросов)")
+        return recall
+
+
+embedding_store = EmbeddingStore()
@@ -0,0 +1,120 @@
+# backend/app/services/embeddings.py
+"""
+Провайдеры эмбеддингов для текстового описания настроения.
+
+Все провайдеры возвращают матрицу float32 (n, dim) с L2-нормированными
+строками, поэтому косинусная близость - это просто скалярное произведение.
+HashingEmbeddingProvider детерминирован и не ходит в сеть - используется
+по умолчанию и в тестах; OpenAIEmbeddingProvider - для продакшена.
+"""
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import numpy as np
+
+from ..config import (
+    AZURE_OPENAI_API_KEY,
+    AZURE_OPENAI_API_VERSION,
+    AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+    AZURE_OPENAI_ENDPOINT,
+    EMBEDDING_LOCAL_DIM,
+    EMBEDDING_MODEL,
+    EMBEDDING_PROVIDER,
+    OPENAI_API_KEY,
+)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+WORD_WEIGHT = 1.0
+TRIGRAM_WEIGHT = 0.5  # триграммы сближают словоформы: "грустный" / "грустная"
+
+
+def mood_text(mood_analysis: Dict[str, Any]) -> str:
+    """Текст для эмбеддинга: mood, emotions, music_genre и description"""
+    emotions = mood_analysis.get("emotions") or []
+    if isinstance(emotions, str):
+        emotions = [emotions]
+    parts = [
+        mood_analysis.get("mood"),
+        ", ".join(e for e in emotions if isinstance(e, str)),
+        mood_analysis.get("music_genre") or mood_analysis.get("music_style"),
+        mood_analysis.get("description"),
+    ]
+    return ". ".join(p.strip() for p in parts if isinstance(p, str) and p.strip())
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class EmbeddingProvider(ABC):
+    """Базовый провайдер: name идентифицирует пространство векторов"""
+    name: str = ""
+    dim: int = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Матрица (len(texts), dim) с L2-нормированными строками"""
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Feature hashing слов и символьных триграмм - детерминированно и без сети"""
+
+    def __init__(self, dim: int = EMBEDDING_LOCAL_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str):
+        for word in _WORD_RE.findall(text.casefold()):
+            yield word, WORD_WEIGHT
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], TRIGRAM_WEIGHT
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                # Старший бит хеша задает знак, чтобы коллизии в среднем гасили друг друга
+                vectors[row, h % self.dim] += weight if h >> 63 else -weight
+        return _normalize(vectors)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Эмбеддинги через OpenAI / Azure OpenAI (блокирующий вызов)"""
+
+    def __init__(self):
+        import openai
+        if AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_EMBEDDING_DEPLOYMENT:
+            self.client = openai.AzureOpenAI(
+                api_key=AZURE_OPENAI_API_KEY,
+                api_version=AZURE_OPENAI_API_VERSION,
+                azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            )
+            self.model = AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+        elif OPENAI_API_KEY:
+            self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+            self.model = EMBEDDING_MODEL
+        else:
+            raise ValueError("Для EMBEDDING_PROVIDER=openai не настроен ни Azure OpenAI, ни OpenAI API")
+        self.name = f"openai:{self.model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self.client.embeddings.create(model=self.model, input=texts, timeout=15)
+        vectors = np.asarray([item.embedding for item in response.data], dtype=np.float32)
+        self.dim = vectors.shape[1]
+        return _normalize(vectors)
+
+
+@lru_cache(maxsize=1)
+def get_embedding_provider() -> EmbeddingProvider:
+    """Провайдер по EMBEDDING_PROVIDER (один экземпляр на процесс)"""
+    if EMBEDDING_PROVIDER == "openai":
+        return OpenAIEmbeddingProvider()
+    if EMBEDDING_PROVIDER == "local":
+        return HashingEmbeddingProvider()
+    raise ValueError(f"Неизвестный EMBEDDING_PROVIDER: {EMBEDDING_PROVIDER}")
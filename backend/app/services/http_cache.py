@@ -0,0 +1,19 @@
+# backend/app/services/http_cache.py
+"""Условные GET-запросы: ETag / If-None-Match"""
+import hashlib
+import json
+from typing import Any, Optional
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match может содержать список ETag через запятую или *"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def content_etag(prefix: str, content: Any) -> str:
+    """Слабый ETag по содержимому (JSON-совместимые данные)"""
+    raw = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return f'W/"{prefix}-{hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]}"'
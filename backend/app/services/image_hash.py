@@ -0,0 +1,245 @@
+# backend/app/services/image_hash.py
+"""
+Поиск ранее проанализированных изображений по перцептивному хешу.
+
+dHash (64 бита) устойчив к пережатию, изменению размера и скриншотам: у копий
+одного фото расстояние Хэмминга между хешами - единицы бит, у разных фото - около 32.
+Для поиска по расстоянию - multi-index hashing: хеш делится на 4 части по 16 бит,
+и при расстоянии <= r хотя бы одна часть отличается не больше чем на r // 4 бит
+(принцип Дирихле). Поэтому достаточно проверить несколько корзин в каждой из
+4 таблиц, а не весь индекс.
+
+Анализы хранятся в image_analyses (общая таблица для всех воркеров), в памяти
+процесса - только хеши, id строк и язык; индекс дочитывается из БД по id.
+"""
+import io
+import json
+import threading
+import time
+from array import array
+from functools import lru_cache
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import IMAGE_DEDUP_MAX_DISTANCE
+from ..models.user import ImageAnalysis
+from .metrics import metrics
+
+HASH_SIZE = 8                   # 8x8 сравнений - 64 бита
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MIN_HASH_BITS = 4               # почти однотонные изображения (dHash ~ 0) не дедуплицируем
+DEDUP_REFRESH_SECONDS = 30
+
+
+def dhash(file_content: bytes, size: int = HASH_SIZE) -> Optional[int]:
+    """64-битный dHash изображения или None (Pillow не установлен, файл не читается)"""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(file_content)) as image:
+            # JPEG декодируется сразу в уменьшенном масштабе - в разы быстрее полного декодирования
+            image.draft("L", (size * 8, size * 8))
+            image = ImageOps.exif_transpose(image)
+            gray = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    except Exception as e:
+        print(f"⚠️ [DEDUP] Не удалось посчитать хеш изображения: {e}")
+        return None
+    pixels = gray.tobytes()
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_signed(value: int) -> int:
+    """64-битный хеш -> BIGINT со знаком"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_signed(value: int) -> int:
+    return value & 0xFFFFFFFFFFFFFFFF
+
+
+@lru_cache(maxsize=8)
+def _flip_masks(radius: int) -> Tuple[int, ...]:
+    """Все маски части хеша с не более чем radius единичными битами"""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        for positions in combinations(range(CHUNK_BITS), bits):
+            mask = 0
+            for position in positions:
+                mask |= 1 << position
+            masks.append(mask)
+    return tuple(masks)
+
+
+class HammingIndex:
+    """Multi-index hashing для 64-битных хешей: add() и поиск всех хешей в радиусе"""
+
+    def __init__(self):
+        self._hashes = array("Q")
+        self._values: List[Any] = []
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(CHUNKS)]
+
+    @property
+    def size(self) -> int:
+        return len(self._hashes)
+
+    def add(self, value_hash: int, value: Any) -> None:
+        row = len(self._hashes)
+        self._hashes.append(value_hash)
+        self._values.append(value)
+        for chunk, table in enumerate(self._tables):
+            table.setdefault((value_hash >> (chunk * CHUNK_BITS)) & CHUNK_MASK, []).append(row)
+
+    def search(self, value_hash: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """(расстояние, value) всех хешей на расстоянии <= max_distance, ближайшие первыми"""
+        if max_distance < 0:
+            return []
+        masks = _flip_masks(max_distance // CHUNKS)
+        rows = set()
+        for chunk, table in enumerate(self._tables):
+            part = (value_hash >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+            for mask in masks:
+                bucket = table.get(part ^ mask)
+                if bucket:
+                    rows.update(bucket)
+        found = []
+        for row in rows:
+            distance = (self._hashes[row] ^ value_hash).bit_count()
+            if distance <= max_distance:
+                found.append((distance, self._values[row]))
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class ImageAnalysisCache:
+    """Анализы изображений по dHash: lookup() перед запросом к Vision, store() после"""
+
+    def __init__(self, max_distance: int = IMAGE_DEDUP_MAX_DISTANCE, session_factory=None):
+        self.max_distance = max_distance
+        self._session_factory = session_factory
+        self._index = HammingIndex()
+        self._watermark = 0
+        self._own_rows = set()  # id строк, уже добавленных в индекс при store()
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_distance >= 0
+
+    def _session(self):
+        if self._session_factory is None:
+            from ..database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def _add_rows(self, rows) -> None:
+        for row in rows:
+            if row.id <= self._watermark:
+                continue
+            if row.id in self._own_rows:
+                self._own_rows.discard(row.id)
+            else:
+                self._index.add(from_signed(row.image_hash), (row.id, row.language))
+            self._watermark = row.id
+
+    def ensure_fresh(self) -> None:
+        """Дочитывает новые анализы из БД (блокирующий вызов - запускать в потоке)"""
+        if time.time() - self._refreshed_at < DEDUP_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if time.time() - self._refreshed_at < DEDUP_REFRESH_SECONDS:
+                return
+            start = time.perf_counter()
+            db = self._session()
+            try:
+                rows = (
+                    db.query(ImageAnalysis.id, ImageAnalysis.image_hash, ImageAnalysis.language)
+                    .filter(ImageAnalysis.id > self._watermark)
+                    .order_by(ImageAnalysis.id)
+                    .all()
+                )
+            finally:
+                db.close()
+            self._add_rows(rows)
+            self._refreshed_at = time.time()
+            if rows:
+                print(f"[DEDUP] Индекс хешей дочитан: +{len(rows)}, всего {self._index.size}, "
+                      f"{(time.perf_counter() - start) * 1000:.1f}ms")
+
+    def lookup(self, image_hash: Optional[int], language: str) -> Optional[Dict[str, Any]]:
+        """Анализ визуально того же изображения на том же языке или None (блокирующий вызов)"""
+        if image_hash is None or not self.enabled or image_hash.bit_count() < MIN_HASH_BITS:
+            return None
+        self.ensure_fresh()
+        start = time.perf_counter()
+        matches = [(distance, row_id) for distance, (row_id, lang) in self._index.search(image_hash, self.max_distance)
+                   if lang == language]
+        metrics.observe("image_dedup.lookup_ms", (time.perf_counter() - start) * 1000)
+        if not matches:
+            metrics.incr("image_dedup.miss")
+            return None
+
+        distance, row_id = matches[0]
+        db = self._session()
+        try:
+            row = db.query(ImageAnalysis.analysis).filter(ImageAnalysis.id == row_id).first()
+        finally:
+            db.close()
+        if row is None:
+            return None
+        metrics.incr("image_dedup.hit")
+        metrics.observe("image_dedup.distance", distance)
+        print(f"[DEDUP] Изображение совпало с анализом #{row_id} (расстояние {distance})")
+        return json.loads(row.analysis)
+
+    def store(self, image_hash: Optional[int], language: str, analysis: Dict[str, Any]) -> None:
+        """Сохраняет анализ (блокирующий вызов); другие воркеры увидят его при ensure_fresh"""
+        if image_hash is None or not self.enabled or image_hash.bit_count() < MIN_HASH_BITS:
+            return
+        db = self._session()
+        try:
+            row = ImageAnalysis(
+                image_hash=to_signed(image_hash), language=language,
+                analysis=json.dumps(analysis, ensure_ascii=False)
+            )
+            db.add(row)
+            db.flush()
+            with self._lock:
+                # Свой анализ - сразу в индекс, до commit: ensure_fresh еще не видит строку
+                # и при дочитывании пропустит ее по _own_rows; более ранние чужие строки дочитает сам
+                self._index.add(image_hash, (row.id, language))
+                self._own_rows.add(row.id)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ [DEDUP] Не удалось сохранить анализ изображения: {e}")
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        counters = metrics.snapshot()["counters"]
+        hit, miss = counters.get("image_dedup.hit", 0), counters.get("image_dedup.miss", 0)
+        return {
+            "entries": self._index.size,
+            "max_distance": self.max_distance,
+            "hits": int(hit),
+            "misses": int(miss),
+            "hit_rate": round(hit / (hit + miss), 3) if hit + miss else None,
+            "lookup_p95_ms": metrics.percentile("image_dedup.lookup_ms", 95),
+        }
+
+
+image_analysis_cache = ImageAnalysisCache()
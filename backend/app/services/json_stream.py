@@ -0,0 +1,80 @@
+# backend/app/services/json_stream.py
+"""
+Инкрементальный разбор потокового JSON-ответа модели.
+
+ArrayItemStreamParser получает текст кусками и отдает элементы массива
+по заданному ключу (например, "recommended_tracks") сразу, как только
+закрывается очередной объект - не дожидаясь конца ответа. Каждый символ
+просматривается ровно один раз, поэтому разбор линейный по длине ответа.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+
+class ArrayItemStreamParser:
+    def __init__(self, key: str):
+        self.key = key
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._array_depth: Optional[int] = None  # глубина внутри нужного массива
+        self._item_start: Optional[int] = None
+        self.items: List[Dict[str, Any]] = []
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Добавляет фрагмент текста и возвращает элементы, завершенные в нем"""
+        self.text += chunk
+        completed = []
+        text = self.text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:pos]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char == ":":
+                self._pending_key = self._last_string
+            elif char in "{[":
+                if char == "[" and self._array_depth is None and self._pending_key == self.key:
+                    self._array_depth = self._depth + 1
+                elif char == "{" and self._depth == self._array_depth:
+                    self._item_start = pos
+                self._depth += 1
+                self._pending_key = None
+            elif char in "}]":
+                self._depth -= 1
+                if char == "}" and self._item_start is not None and self._depth == self._array_depth:
+                    item = self._decode(text[self._item_start:pos + 1])
+                    if item is not None:
+                        completed.append(item)
+                    self._item_start = None
+                elif char == "]" and self._array_depth is not None and self._depth == self._array_depth - 1:
+                    self._array_depth = -1  # массив закрыт, дальнейшие "[" по этому ключу не ищем
+                self._pending_key = None
+            elif char == ",":
+                self._pending_key = None
+        self._pos = len(text)
+        self.items.extend(completed)
+        return completed
+
+    @staticmethod
+    def _decode(raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            return None
+        return item if isinstance(item, dict) else None
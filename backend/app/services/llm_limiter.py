@@ -0,0 +1,259 @@
+# backend/app/services/llm_limiter.py
+"""
+Клиентское ограничение нагрузки на LLM-бэкенд.
+
+Перед запросом к провайдеру нужно получить слот:
+- token bucket по запросам (RPM) и по токенам (TPM): оценка = промпт + max_tokens,
+  после ответа разница с фактическим usage возвращается в бакет или досписывается;
+- не больше max_concurrency запросов одновременно;
+- ожидающие стоят в очереди с приоритетом: PRO, затем basic, затем фоновые задачи.
+  Внутри приоритета - по порядку прихода; более низкий приоритет не обгоняет.
+
+Вместо 429 от провайдера запросы ждут в очереди; дольше queue_timeout -
+LLMQueueTimeout. Ответ 429 все же пришел - бакеты обнуляются, чтобы следующие
+запросы подождали пополнения. Слоты выдаются и корутинам, и потокам
+(фоновые задачи FastAPI), поэтому состояние под threading.Lock.
+Лимиты действуют в пределах процесса: при нескольких воркерах задавайте
+долю квоты провайдера на воркер.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+from .metrics import metrics
+
+PRIORITY_PRO = 0
+PRIORITY_BASIC = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_PRO: "pro", PRIORITY_BASIC: "basic", PRIORITY_BACKGROUND: "background"}
+
+BURST_SECONDS = 10.0  # емкость бакета - квота за 10 секунд (так считает и Azure)
+
+
+class LLMQueueTimeout(Exception):
+    """Слот не освободился за queue_timeout"""
+
+
+def priority_for(user) -> int:
+    return PRIORITY_PRO if user is not None and user.account_type == "pro" else PRIORITY_BASIC
+
+
+class _Bucket:
+    """Token bucket: per_minute единиц в минуту, емкость - запас на BURST_SECONDS; 0 - без ограничения"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute * BURST_SECONDS / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Через сколько секунд в бакете будет amount (запрос больше емкости ждет полного бакета)"""
+        if self.unlimited:
+            return 0.0
+        need = min(amount, self.capacity) - self.level
+        return max(0.0, need / self.rate)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "granted", "cancelled", "_wake")
+
+    def __init__(self, priority: int, seq: int, tokens: int, wake):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.granted = False
+        self.cancelled = False
+        self._wake = wake
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wake(self) -> None:
+        self._wake()
+
+
+class Ticket:
+    """Выданный слот; used - фактический расход токенов (из response.usage), если известен"""
+    __slots__ = ("tokens", "used")
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.used: Optional[int] = None
+
+
+class LLMLimiter:
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_concurrency: int = 16, queue_timeout: float = 20.0):
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+
+    def _dispatch(self) -> Optional[float]:
+        """
+        Выдает слоты ожидающим с головы очереди (вызывается под _lock).
+        Возвращает, через сколько секунд пополнятся бакеты для головы очереди, или None.
+        """
+        now = time.monotonic()
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        while self._heap:
+            head = self._heap[0]
+            if head.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            if self._in_flight >= self.max_concurrency:
+                return None  # освободит release()
+            delay = max(self._requests.wait_time(1), self._tokens.wait_time(head.tokens))
+            if delay > 0:
+                return delay
+            heapq.heappop(self._heap)
+            if not self._requests.unlimited:
+                self._requests.level -= 1
+            if not self._tokens.unlimited:
+                self._tokens.level -= head.tokens
+            self._in_flight += 1
+            head.granted = True
+            head.wake()
+        return None
+
+    def _enqueue(self, tokens: int, priority: int, wake) -> _Waiter:
+        waiter = _Waiter(priority, next(self._seq), tokens, wake)
+        with self._lock:
+            heapq.heappush(self._heap, waiter)
+            metrics.observe("llm.queue_depth", len(self._heap))
+        return waiter
+
+    def _finish_wait(self, waiter: _Waiter, start: float, ok: bool) -> Optional[Ticket]:
+        if not ok:
+            # Таймаут или отмена ожидающего (например, клиент отключился)
+            with self._lock:
+                waiter.cancelled = True
+                if waiter.granted:
+                    self._release_locked(waiter.tokens, waiter.tokens)
+                    self._dispatch()
+            return None
+        waited_ms = (time.perf_counter() - start) * 1000
+        name = PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+        metrics.observe("llm.queue_ms", waited_ms)
+        metrics.observe(f"llm.queue_ms.{name}", waited_ms)
+        return Ticket(waiter.tokens)
+
+    def _timeout(self) -> LLMQueueTimeout:
+        metrics.incr("llm.queue_timeouts")
+        return LLMQueueTimeout(f"Очередь к LLM: слот не получен за {self.queue_timeout:g}с")
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_BASIC) -> Ticket:
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = self._enqueue(tokens, priority, lambda: loop.call_soon_threadsafe(event.set))
+        start = time.perf_counter()
+        deadline = start + self.queue_timeout
+        ok = False
+        try:
+            while True:
+                with self._lock:
+                    delay = self._dispatch()
+                if waiter.granted:
+                    ok = True
+                    return self._finish_wait(waiter, start, True)
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise self._timeout()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(delay or remaining, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            if not ok:
+                self._finish_wait(waiter, start, False)
+
+    def acquire_sync(self, tokens: int, priority: int = PRIORITY_BACKGROUND) -> Ticket:
+        event = threading.Event()
+        waiter = self._enqueue(tokens, priority, event.set)
+        start = time.perf_counter()
+        deadline = start + self.queue_timeout
+        ok = False
+        try:
+            while True:
+                with self._lock:
+                    delay = self._dispatch()
+                if waiter.granted:
+                    ok = True
+                    return self._finish_wait(waiter, start, True)
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise self._timeout()
+                event.wait(min(delay or remaining, remaining))
+                event.clear()
+        finally:
+            if not ok:
+                self._finish_wait(waiter, start, False)
+
+    def _release_locked(self, estimated: int, used: int) -> None:
+        self._in_flight -= 1
+        if not self._tokens.unlimited:
+            # Оценка была с запасом (max_tokens) - возвращаем неиспользованное, перерасход досписываем
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level + estimated - used)
+
+    def release(self, ticket: Ticket) -> None:
+        used = ticket.used if ticket.used is not None else ticket.tokens
+        with self._lock:
+            self._release_locked(ticket.tokens, used)
+            self._dispatch()
+
+    @property
+    def saturated(self) -> bool:
+        """Все слоты заняты или есть очередь"""
+        with self._lock:
+            return self._in_flight >= self.max_concurrency or any(not w.cancelled for w in self._heap)
+
+    def penalize(self) -> None:
+        """Провайдер ответил 429 - обнуляем бакеты, следующие запросы ждут пополнения"""
+        metrics.incr("llm.rate_limited")
+        with self._lock:
+            self._requests.level = min(self._requests.level, 0.0)
+            self._tokens.level = min(self._tokens.level, 0.0)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int, priority: int = PRIORITY_BASIC):
+        ticket = await self.acquire(tokens, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @contextmanager
+    def slot_sync(self, tokens: int, priority: int = PRIORITY_BACKGROUND):
+        ticket = self.acquire_sync(tokens, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._dispatch()
+            return {
+                "in_flight": self._in_flight,
+                "queued": sum(1 for w in self._heap if not w.cancelled),
+                "requests_available": None if self._requests.unlimited else round(self._requests.level, 1),
+                "tokens_available": None if self._tokens.unlimited else round(self._tokens.level),
+            }
@@ -0,0 +1,437 @@
+# backend/app/services/llm_router.py
+"""
+Роутер LLM-провайдеров (Azure OpenAI, OpenAI и любые OpenAI-совместимые API).
+
+Каждый бэкенд хранит свою статистику: задержки (окно в metrics,
+llm.<backend>.<task>.ms) и последние исходы запросов. Порядок выбора -
+как в конфиге, но бэкенд после LLM_CIRCUIT_FAILURES ошибок подряд выводится
+из ротации на LLM_CIRCUIT_COOLDOWN секунд.
+
+complete(): если ответ дольше p95 задержки бэкенда, отправляется второй
+(hedged) запрос на следующий здоровый бэкенд; побеждает первый ответ, второй
+запрос отменяется. Ошибка бэкенда - переход (failover) на следующий. Только
+когда не ответил ни один, вызывающий код получает LLMUnavailableError и
+переходит на офлайн-заглушку.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import openai
+
+from ..config import (
+    AZURE_OPENAI_API_KEY,
+    AZURE_OPENAI_API_VERSION,
+    AZURE_OPENAI_DEPLOYMENT_NAME,
+    AZURE_OPENAI_ENDPOINT,
+    AZURE_OPENAI_VISION_DEPLOYMENT,
+    LLM_EXTRA_BACKENDS,
+    LLM_HEDGE_ENABLED,
+    LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_TIMEOUT,
+    LLM_REQUEST_TIMEOUT,
+    LLM_RPM_LIMIT,
+    LLM_TPM_LIMIT,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_CHAT_MODEL,
+    OPENAI_VISION_MODEL,
+)
+from .llm_limiter import PRIORITY_BACKGROUND, PRIORITY_BASIC, LLMLimiter, LLMQueueTimeout
+from .metrics import metrics
+from .structured_output import supports_json_mode
+from .tokens import count_message_tokens, count_tokens
+from .usage import usage_recorder
+
+LLM_CIRCUIT_FAILURES = 3      # ошибок подряд до вывода бэкенда из ротации
+LLM_CIRCUIT_COOLDOWN = 30.0   # секунд вне ротации
+HEALTH_WINDOW = 50            # последних исходов для error rate
+HEDGE_MIN_SAMPLES = 20        # p95 по меньшему числу замеров не считаем
+HEDGE_MIN_DELAY = 0.3         # секунды
+HEDGE_MAX_DELAY = 10.0        # без статистики hedge уходит только после этой задержки
+HEDGE_BUDGET = 0.1            # доля запросов, которые можно дублировать
+DEFAULT_COMPLETION_TOKENS = 500  # оценка ответа для лимитера, если max_tokens не задан
+
+
+class LLMUnavailableError(Exception):
+    """Ни один бэкенд не ответил"""
+
+
+def _is_client_error(e: Exception) -> bool:
+    # Ошибка в самом запросе: другой бэкенд ответит так же, failover бессмыслен
+    return isinstance(e, (openai.BadRequestError, openai.UnprocessableEntityError))
+
+
+class LLMBackend:
+    def __init__(self, name: str, kind: str, api_key: str, chat_model: str, vision_model: Optional[str] = None,
+                 endpoint: Optional[str] = None, base_url: Optional[str] = None,
+                 api_version: Optional[str] = None, max_retries: int = 1,
+                 rpm: float = LLM_RPM_LIMIT, tpm: float = LLM_TPM_LIMIT, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.name = name
+        self.kind = kind
+        self.models = {"chat": chat_model, "vision": vision_model or chat_model}
+        if kind == "azure":
+            params = dict(api_key=api_key, api_version=api_version or AZURE_OPENAI_API_VERSION,
+                          azure_endpoint=endpoint, max_retries=max_retries)
+            self.client = openai.AzureOpenAI(**params)
+            self.async_client = openai.AsyncAzureOpenAI(**params)
+        else:
+            params = dict(api_key=api_key, base_url=base_url, max_retries=max_retries)
+            self.client = openai.OpenAI(**params)
+            self.async_client = openai.AsyncOpenAI(**params)
+        # Квоты RPM/TPM у провайдера свои для каждого deployment/ключа - и лимитер у каждого бэкенда свой
+        self.limiter = LLMLimiter(rpm, tpm, max_concurrency, LLM_QUEUE_TIMEOUT)
+        # Бэкенд отклонил response_format (старая модель или версия API) - больше не передаем
+        self.json_mode_rejected = False
+        self._outcomes: deque = deque(maxlen=HEALTH_WINDOW)
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+
+    def model(self, task: str) -> str:
+        return self.models.get(task) or self.models["chat"]
+
+    def json_kwargs(self, task: str, json_mode: bool) -> Dict[str, Any]:
+        if not json_mode or self.json_mode_rejected or not supports_json_mode(self.model(task)):
+            return {}
+        return {"response_format": {"type": "json_object"}}
+
+    def is_json_mode_rejection(self, e: Exception) -> bool:
+        if isinstance(e, openai.BadRequestError) and "response_format" in str(e):
+            print(f"⚠️ [LLM] {self.name}: JSON-режим не поддерживается, отключаем: {e}")
+            self.json_mode_rejected = True
+            return True
+        return False
+
+    # --- статистика ---
+
+    def record(self, task: str, ok: bool, elapsed_ms: Optional[float] = None) -> None:
+        self._outcomes.append(ok)
+        if ok:
+            self._consecutive_failures = 0
+            if elapsed_ms is not None:
+                metrics.observe(f"llm.{self.name}.{task}.ms", elapsed_ms)
+            return
+        metrics.incr(f"llm.{self.name}.errors")
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= LLM_CIRCUIT_FAILURES:
+            self._open_until = time.monotonic() + LLM_CIRCUIT_COOLDOWN
+            print(f"⚠️ [LLM] {self.name}: {self._consecutive_failures} ошибок подряд, "
+                  f"выводим из ротации на {LLM_CIRCUIT_COOLDOWN:.0f}с")
+
+    @property
+    def available(self) -> bool:
+        # После паузы бэкенд снова пробуется; следующая ошибка опять выведет его из ротации
+        return time.monotonic() >= self._open_until
+
+    @property
+    def error_rate(self) -> float:
+        return 1 - sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    def hedge_delay(self, task: str) -> float:
+        name = f"llm.{self.name}.{task}.ms"
+        if metrics.count(name) < HEDGE_MIN_SAMPLES:
+            return HEDGE_MAX_DELAY
+        p95 = metrics.percentile(name, 95) / 1000
+        return min(max(p95, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    async def aclose(self) -> None:
+        # Пулы соединений httpx у синхронного и асинхронного клиентов
+        await self.async_client.close()
+        self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "models": self.models,
+            "available": self.available,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self._consecutive_failures,
+            "limiter": self.limiter.stats(),
+        }
+
+
+class LLMRouter:
+    def __init__(self, backends: List[LLMBackend], hedge: bool = LLM_HEDGE_ENABLED,
+                 timeout: float = LLM_REQUEST_TIMEOUT):
+        self.backends = backends
+        self.hedge = hedge
+        self.timeout = timeout
+        self._requests = 0
+        self._hedges = 0
+
+    @classmethod
+    def from_config(cls) -> "LLMRouter":
+        backends = []
+        if AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT_NAME:
+            backends.append(LLMBackend(
+                "azure", "azure", AZURE_OPENAI_API_KEY,
+                chat_model=AZURE_OPENAI_DEPLOYMENT_NAME,
+                vision_model=AZURE_OPENAI_VISION_DEPLOYMENT or AZURE_OPENAI_DEPLOYMENT_NAME,
+                endpoint=AZURE_OPENAI_ENDPOINT
+            ))
+        if OPENAI_API_KEY:
+            backends.append(LLMBackend(
+                "openai", "openai", OPENAI_API_KEY,
+                chat_model=OPENAI_CHAT_MODEL, vision_model=OPENAI_VISION_MODEL, base_url=OPENAI_BASE_URL
+            ))
+        if LLM_EXTRA_BACKENDS:
+            try:
+                extra = json.loads(LLM_EXTRA_BACKENDS)
+            except ValueError as e:
+                raise ValueError(f"LLM_EXTRA_BACKENDS: некорректный JSON: {e}")
+            for index, spec in enumerate(extra):
+                backends.append(LLMBackend(
+                    spec.get("name") or f"extra{index}", spec.get("kind", "openai"), spec["api_key"],
+                    chat_model=spec["chat_model"], vision_model=spec.get("vision_model"),
+                    endpoint=spec.get("endpoint"), base_url=spec.get("base_url"),
+                    api_version=spec.get("api_version"),
+                    rpm=spec.get("rpm", LLM_RPM_LIMIT), tpm=spec.get("tpm", LLM_TPM_LIMIT),
+                    max_concurrency=spec.get("max_concurrency", LLM_MAX_CONCURRENCY)
+                ))
+        return cls(backends)
+
+    @property
+    def primary(self) -> LLMBackend:
+        return self.backends[0]
+
+    def candidates(self) -> List[LLMBackend]:
+        """Бэкенды в порядке попыток: доступные по конфигу; если из ротации выведены все - все"""
+        available = [b for b in self.backends if b.available]
+        return available or list(self.backends)
+
+    def _may_hedge(self) -> bool:
+        return self.hedge and self._hedges < HEDGE_BUDGET * self._requests + 1
+
+    def _failed(self, backend: LLMBackend, task: str, e: Exception) -> None:
+        if isinstance(e, openai.RateLimitError):
+            backend.limiter.penalize()
+        backend.record(task, False)
+        print(f"⚠️ [LLM] {backend.name} ({backend.model(task)}): {type(e).__name__}: {e}")
+
+    async def _call(self, backend: LLMBackend, task: str, messages: List[Dict[str, Any]],
+                    json_mode: bool, kwargs: Dict[str, Any], priority: int, operation: str):
+        json_kwargs = backend.json_kwargs(task, json_mode)
+        model = backend.model(task)
+        tokens = count_message_tokens(messages, model) + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+        # LLMQueueTimeout из очереди - не ошибка бэкенда, complete() просто перейдет к следующему
+        async with backend.limiter.slot(tokens, priority) as ticket:
+            start = time.perf_counter()
+            try:
+                try:
+                    response = await backend.async_client.chat.completions.create(
+                        model=model, messages=messages, **json_kwargs, **kwargs
+                    )
+                except openai.BadRequestError as e:
+                    if not json_kwargs or not backend.is_json_mode_rejection(e):
+                        raise
+                    response = await backend.async_client.chat.completions.create(
+                        model=model, messages=messages, **kwargs
+                    )
+            except asyncio.CancelledError:
+                raise  # проигравший hedged-запрос - не ошибка бэкенда
+            except Exception as e:
+                if not _is_client_error(e):
+                    self._failed(backend, task, e)
+                usage_recorder.record(operation, backend.name, model, ok=False,
+                                      latency_ms=(time.perf_counter() - start) * 1000)
+                raise
+            if response.usage:
+                ticket.used = response.usage.total_tokens
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        backend.record(task, True, elapsed_ms)
+        usage_recorder.record_response(operation, backend.name, model, response, elapsed_ms)
+        return response
+
+    async def complete(self, messages: List[Dict[str, Any]], task: str = "chat", json_mode: bool = False,
+                       priority: int = PRIORITY_BASIC, operation: Optional[str] = None, **kwargs):
+        """
+        chat.completions.create с hedging и failover. task - "chat" или "vision"
+        (у бэкенда могут быть разные модели/deployment для них), priority - место в очереди лимитера,
+        operation - имя вызова в учете токенов (llm_usage).
+        """
+        operation = operation or task
+        kwargs.setdefault("timeout", self.timeout)
+        queue = self.candidates()
+        if not queue:
+            raise LLMUnavailableError("LLM-бэкенды не настроены")
+        self._requests += 1
+        pending: Dict[asyncio.Task, LLMBackend] = {}
+        hedge_task = None
+        hedge_checked = False
+        last_error: Optional[Exception] = None
+
+        def launch(backend: LLMBackend) -> asyncio.Task:
+            task_ = asyncio.ensure_future(self._call(backend, task, messages, json_mode, kwargs, priority, operation))
+            pending[task_] = backend
+            return task_
+
+        launch(queue.pop(0))
+        try:
+            while pending:
+                timeout = None
+                if not hedge_checked and len(pending) == 1 and self._may_hedge():
+                    timeout = next(iter(pending.values())).hedge_delay(task)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_checked = True
+                    # Первый запрос дольше p95 - дублируем на следующий бэкенд (или на тот же, если он один).
+                    # Бэкенд, у которого уже очередь, дублями не нагружаем
+                    target = queue[0] if queue else next(iter(pending.values()))
+                    if target.limiter.saturated:
+                        continue
+                    if queue:
+                        queue.pop(0)
+                    self._hedges += 1
+                    metrics.incr("llm.hedge.sent")
+                    hedge_task = launch(target)
+                    continue
+                for finished in done:
+                    pending.pop(finished)
+                    try:
+                        response = finished.result()
+                    except Exception as e:
+                        if _is_client_error(e):
+                            raise
+                        last_error = e
+                        continue
+                    if finished is hedge_task:
+                        metrics.incr("llm.hedge.won")
+                    return response
+                if not pending and queue:
+                    backend = queue.pop(0)
+                    metrics.incr("llm.failover")
+                    print(f"🔄 [LLM] Переключаемся на {backend.name}")
+                    launch(backend)
+            raise LLMUnavailableError(f"Ни один LLM-бэкенд не ответил: {last_error}")
+        finally:
+            for task_ in pending:
+                task_.cancel()
+
+    def complete_sync(self, messages: List[Dict[str, Any]], task: str = "chat", json_mode: bool = False,
+                      priority: int = PRIORITY_BACKGROUND, operation: Optional[str] = None, **kwargs):
+        """Синхронный вариант для фоновых задач: только failover, без hedging"""
+        kwargs.setdefault("timeout", self.timeout)
+        operation = operation or task
+        last_error: Optional[Exception] = None
+        for backend in self.candidates():
+            json_kwargs = backend.json_kwargs(task, json_mode)
+            model = backend.model(task)
+            tokens = count_message_tokens(messages, model) + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+            try:
+                with backend.limiter.slot_sync(tokens, priority) as ticket:
+                    start = time.perf_counter()
+                    try:
+                        try:
+                            response = backend.client.chat.completions.create(
+                                model=model, messages=messages, **json_kwargs, **kwargs
+                            )
+                        except openai.BadRequestError as e:
+                            if not json_kwargs or not backend.is_json_mode_rejection(e):
+                                raise
+                            response = backend.client.chat.completions.create(
+                                model=model, messages=messages, **kwargs
+                            )
+                    except Exception as e:
+                        if not _is_client_error(e):
+                            self._failed(backend, task, e)
+                        usage_recorder.record(operation, backend.name, model, ok=False,
+                                              latency_ms=(time.perf_counter() - start) * 1000)
+                        raise
+                    if response.usage:
+                        ticket.used = response.usage.total_tokens
+            except Exception as e:
+                if _is_client_error(e):
+                    raise
+                last_error = e
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            backend.record(task, True, elapsed_ms)
+            usage_recorder.record_response(operation, backend.name, model, response, elapsed_ms)
+            return response
+        raise LLMUnavailableError(f"Ни один LLM-бэкенд не ответил: {last_error}")
+
+    async def stream(self, messages: List[Dict[str, Any]], task: str = "chat", json_mode: bool = False,
+                     priority: int = PRIORITY_BASIC, operation: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        Потоковый ответ. Failover возможен только до первого фрагмента: то, что уже
+        ушло клиенту, другой бэкенд не продолжит. Закрытие генератора обрывает запрос.
+        Слот лимитера занят до конца потока. usage в потоке не приходит - токены
+        для учета считаются локально (estimated).
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        operation = operation or task
+        stream = None
+        ticket = None
+        last_error: Optional[Exception] = None
+        for backend in self.candidates():
+            json_kwargs = backend.json_kwargs(task, json_mode)
+            model = backend.model(task)
+            tokens = count_message_tokens(messages, model) + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+            try:
+                ticket = await backend.limiter.acquire(tokens, priority)
+            except LLMQueueTimeout as e:
+                last_error = e
+                continue
+            start = time.perf_counter()
+            try:
+                try:
+                    stream = await backend.async_client.chat.completions.create(
+                        model=model, messages=messages, stream=True, **json_kwargs, **kwargs
+                    )
+                except openai.BadRequestError as e:
+                    if not json_kwargs or not backend.is_json_mode_rejection(e):
+                        raise
+                    stream = await backend.async_client.chat.completions.create(
+                        model=model, messages=messages, stream=True, **kwargs
+                    )
+            except BaseException as e:
+                backend.limiter.release(ticket)
+                if not isinstance(e, Exception) or _is_client_error(e):
+                    raise
+                self._failed(backend, task, e)
+                usage_recorder.record(operation, backend.name, model, ok=False,
+                                      latency_ms=(time.perf_counter() - start) * 1000)
+                last_error = e
+                metrics.incr("llm.failover")
+                continue
+            # Время до заголовков ответа - отдельная серия, чтобы не смешивать с полными ответами
+            backend.record(f"{task}_stream", True, (time.perf_counter() - start) * 1000)
+            break
+        if stream is None:
+            raise LLMUnavailableError(f"Ни один LLM-бэкенд не ответил: {last_error}")
+        completion = []
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    completion.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            try:
+                await stream.response.aclose()
+            finally:
+                prompt_tokens = count_message_tokens(messages, model)
+                completion_tokens = count_tokens("".join(completion), model)
+                ticket.used = prompt_tokens + completion_tokens
+                backend.limiter.release(ticket)
+                usage_recorder.record(operation, backend.name, model, prompt_tokens=prompt_tokens,
+                                      completion_tokens=completion_tokens, estimated=True,
+                                      latency_ms=(time.perf_counter() - start) * 1000)
+
+    async def aclose(self) -> None:
+        for backend in self.backends:
+            await backend.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        histograms = metrics.snapshot()["histograms"]
+        result = {"requests": self._requests, "hedges": self._hedges, "backends": {}}
+        for backend in self.backends:
+            info = backend.stats()
+            prefix = f"llm.{backend.name}."
+            info["latency_ms"] = {
+                name[len(prefix):-3]: values for name, values in histograms.items()
+                if name.startswith(prefix) and name.endswith(".ms")
+            }
+            result["backends"][backend.name] = info
+        return result
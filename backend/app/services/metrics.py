@@ -0,0 +1,70 @@
+# backend/app/services/metrics.py
+"""
+Простые метрики процесса: счетчики и окна последних значений для перцентилей.
+
+Без внешних зависимостей - значения живут в памяти воркера и отдаются
+через snapshot() (например, в админском эндпоинте или в логах).
+"""
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict
+
+WINDOW_SIZE = 1024  # сколько последних наблюдений хранится для перцентилей
+
+
+def _percentile(ordered, pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Metrics:
+    def __init__(self, window: int = WINDOW_SIZE):
+        self._window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._values: Dict[str, deque] = {}
+        self._totals: Dict[str, list] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        """Добавляет наблюдение (обычно задержку в мс)"""
+        with self._lock:
+            values = self._values.get(name)
+            if values is None:
+                values = self._values[name] = deque(maxlen=self._window)
+                self._totals[name] = [0, 0.0]
+            values.append(value)
+            self._totals[name][0] += 1
+            self._totals[name][1] += value
+
+    def count(self, name: str) -> int:
+        """Сколько наблюдений сейчас в окне"""
+        with self._lock:
+            return len(self._values.get(name) or ())
+
+    def percentile(self, name: str, pct: float):
+        with self._lock:
+            values = sorted(self._values.get(name) or ())
+        return _percentile(values, pct) if values else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            series = {name: (sorted(values), list(self._totals[name])) for name, values in self._values.items()}
+        result = {"counters": counters, "histograms": {}}
+        for name, (ordered, (count, total)) in series.items():
+            if not ordered:
+                continue
+            result["histograms"][name] = {
+                "count": count,
+                "mean": round(total / count, 2),
+                "p50": round(_percentile(ordered, 50), 2),
+                "p95": round(_percentile(ordered, 95), 2),
+                "p99": round(_percentile(ordered, 99), 2),
+            }
+        return result
+
+
+metrics = Metrics()
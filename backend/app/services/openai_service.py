@@ -1,40 +1,80 @@
+import asyncio
 import base64
 import io
 import mimetypes
-from typing import Optional, Dict, Any
-import openai
+from collections import Counter
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
 from fastapi import UploadFile
-from ..config import (
-    AZURE_OPENAI_API_KEY, 
-    AZURE_OPENAI_ENDPOINT, 
-    AZURE_OPENAI_API_VERSION, 
-    AZURE_OPENAI_DEPLOYMENT_NAME,
-    OPENAI_API_KEY
-)
+from .json_stream import ArrayItemStreamParser
+from .llm_limiter import PRIORITY_BASIC
+from .image_hash import dhash, image_analysis_cache
+from .llm_router import LLMRouter, LLMUnavailableError
+from .metrics import metrics
+from .prompts import DEFAULT_LANGUAGE, format_list, prompts
+from .structured_output import parse_structured
+from .usage import usage_recorder
+from ..schemas import BatchMoodAnalysisOutput, MoodAnalysisOutput, RecommendationsOutput
+
+# Пакетный анализ: ответ модели на каждое изображение + общий вайб
+BATCH_BASE_TOKENS = 250
+BATCH_TOKENS_PER_IMAGE = 200
+# Изображения, пропущенные в пакетном ответе, дозапрашиваются по одному - не больше стольких одновременно
+BATCH_FANOUT_CONCURRENCY = 3
+
+# Базовый анализ видео (кадры пока не анализируются моделью) на языке запроса
+VIDEO_STUB_TEXT = {
+    "ru": {
+        "dynamics": "Видео содержит движение",
+        "emotions": ["энергичность", "динамичность"],
+        "description": "Динамичное видео с энергичным настроением",
+        "note": "Полный анализ видео будет доступен в следующих версиях",
+    },
+    "en": {
+        "dynamics": "The video contains movement",
+        "emotions": ["energy", "dynamism"],
+        "description": "A dynamic video with an energetic mood",
+        "note": "Full video analysis will be available in future versions",
+    },
+    "kk": {
+        "dynamics": "Бейнеде қозғалыс бар",
+        "emotions": ["энергия", "серпін"],
+        "description": "Жігерлі көңіл-күйі бар серпінді бейне",
+        "note": "Бейнені толық талдау келесі нұсқаларда қолжетімді болады",
+    },
+}
+
+
+def image_data_url(file_content: bytes, filename: Optional[str]) -> str:
+    """Изображение -> data URL для Vision-запроса"""
+    mime_type = mimetypes.guess_type(filename or "")[0] or "image/jpeg"
+    return f"data:{mime_type};base64,{base64.b64encode(file_content).decode('utf-8')}"
+
 
 class OpenAIService:
-    def __init__(self):
-        # Проверяем, настроен ли Azure OpenAI
-        if AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT_NAME:
-            # Используем Azure OpenAI
-            self.client = openai.AzureOpenAI(
-                api_key=AZURE_OPENAI_API_KEY,
-                api_version=AZURE_OPENAI_API_VERSION,
-                azure_endpoint=AZURE_OPENAI_ENDPOINT
-            )
-            self.deployment_name = AZURE_OPENAI_DEPLOYMENT_NAME
-            self.use_azure = True
-            print("🔵 Используется Azure OpenAI")
-        elif OPENAI_API_KEY:
-            # Используем обычный OpenAI
-            self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
-            self.deployment_name = None
-            self.use_azure = False
-            print("🟢 Используется OpenAI API")
-        else:
+    def __init__(self, router: Optional[LLMRouter] = None):
+        # Все настроенные бэкенды (Azure, OpenAI, дополнительные) - через роутер с failover
+        self.router = router or LLMRouter.from_config()
+        if not self.router.backends:
             raise ValueError("Не настроен ни Azure OpenAI, ни OpenAI API")
+        backends = ", ".join(f"{b.name} ({b.model('chat')})" for b in self.router.backends)
+        print(f"🔵 LLM-бэкенды: {backends}")
     
-    async def analyze_media_mood(self, file: UploadFile, language: str = "ru") -> Dict[str, Any]:
+    async def aclose(self) -> None:
+        """Закрывает HTTP-клиенты бэкендов (остановка приложения)"""
+        await self.router.aclose()
+
+    @property
+    def chat_model(self) -> str:
+        return self.router.primary.model("chat")
+
+    def stream_chat_completion(self, messages: List[Dict[str, str]], max_tokens: int = 300, json_mode: bool = False, priority: int = PRIORITY_BASIC, operation: str = "chat") -> AsyncIterator[str]:
+        """
+        Потоковый ответ модели: отдает текстовые фрагменты по мере генерации.
+        Закрытие генератора (например, при отключении клиента) обрывает запрос к провайдеру.
+        """
+        return self.router.stream(messages, max_tokens=max_tokens, json_mode=json_mode, priority=priority, operation=operation)
+
+    async def analyze_media_mood(self, file: UploadFile, language: str = "ru", priority: int = PRIORITY_BASIC) -> Dict[str, Any]:
         """
         Анализирует медиафайл и определяет настроение/вайб
         """
@@ -43,10 +83,10 @@ class OpenAIService:
             file_content = await file.read()
             
             # Определяем тип файла
-            file_type = self._get_file_type(file.filename)
+            file_type = self.get_file_type(file.filename)
             
             if file_type == "image":
-                return await self._analyze_image(file_content, file.filename, language)
+                return await self._analyze_image(file_content, file.filename, language, priority)
             elif file_type == "video":
                 return await self._analyze_video(file_content, file.filename, language)
             else:
@@ -59,103 +99,42 @@ class OpenAIService:
                 "description": "Не удалось проанализировать файл"
             }
     
-    async def _analyze_image(self, file_content: bytes, filename: str, language: str) -> Dict[str, Any]:
+    async def _cached_analysis(self, file_content: bytes, language: str) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        """dHash изображения и анализ визуально того же изображения из image_analysis_cache (или None)"""
+        if not image_analysis_cache.enabled:
+            return None, None
+        image_hash = await asyncio.to_thread(dhash, file_content)
+        cached = await asyncio.to_thread(image_analysis_cache.lookup, image_hash, language)
+        if cached is None:
+            return image_hash, None
+        usage_recorder.record("mood_analysis", cache_hit=True)
+        return image_hash, {**cached, "cache_hit": True}
+
+    async def _analyze_image(self, file_content: bytes, filename: str, language: str, priority: int = PRIORITY_BASIC,
+                             data_url: Optional[str] = None, image_hash: Optional[int] = None) -> Dict[str, Any]:
         """
-        Анализирует изображение с помощью GPT-4 Vision
+        Анализирует изображение с помощью GPT-4 Vision.
+        image_hash - уже посчитанный dHash, поиск в кэше по нему уже был (пакетный анализ)
         """
-        # Кодируем изображение в base64
-        base64_image = base64.b64encode(file_content).decode('utf-8')
+        # Визуально то же изображение (пережатое, уменьшенное, скриншот) уже анализировали - без запроса к модели
+        if image_hash is None:
+            image_hash, cached = await self._cached_analysis(file_content, language)
+            if cached is not None:
+                return cached
+
+        # Кодируем изображение в base64 (пакетный анализ передает уже готовый data URL)
+        data_url = data_url or image_data_url(file_content, filename)
         
-        # Создаем промпт в зависимости от языка
-        if language == "en":
-            prompt = """
-            Analyze this image and determine:
-            1. Overall mood and atmosphere (e.g.: joyful, melancholic, energetic, calm)
-            2. Color palette and its influence on mood
-            3. Emotions conveyed by the image
-            4. Music genre or style that would suit this mood
-            5. Create a short beautiful caption for a social media post reflecting the vibe of the image (1-2 sentences, no hashtags)
-            
-            Respond in JSON format:
-            {
-                "mood": "main mood",
-                "emotions": ["list of emotions"],
-                "colors": "color description",
-                "music_genre": "suitable music genre",
-                "description": "brief vibe description",
-                "caption": "short beautiful post caption"
-            }
-            """
-        elif language == "kk":
-            prompt = """
-            Бұл суретті талдап, мынаны анықтаңыз:
-            1. Жалпы көңіл-күй мен атмосфера (мысалы: қуанышты, меланхоликалық, энергиялы, тыныш)
-            2. Түс палитрасы және оның көңіл-күйге әсері
-            3. Суреттің беретін эмоциялары
-            4. Осы көңіл-күйге сәйкес келетін музыка жанры немесе стилі
-            5. Суреттің вибін көрсететін әлеуметтік желі постына арналған қысқа әдемі сипаттама ойлап табыңыз (1-2 сөйлем, хэштегсіз)
-            
-            JSON форматында жауап беріңіз:
-            {
-                "mood": "негізгі көңіл-күй",
-                "emotions": ["эмоциялар тізімі"],
-                "colors": "түстер сипаттамасы",
-                "music_genre": "сәйкес музыка жанры",
-                "description": "қысқа вайб сипаттамасы",
-                "caption": "пост үшін қысқа әдемі сипаттама"
-            }
-            """
-        else:  # ru - default
-            prompt = """
-            Проанализируй это изображение и определи:
-            1. Общее настроение и атмосферу (например: радостная, меланхоличная, энергичная, спокойная)
-            2. Цветовую палитру и её влияние на настроение
-            3. Эмоции, которые передаёт изображение
-            4. Музыкальный жанр или стиль, который подошёл бы к этому настроению
-            5. Придумай короткое красивое описание (caption) для поста в соцсетях, отражающее вайб изображения (1-2 предложения, без хэштегов)
-            
-            Ответь в формате JSON:
-            {
-                "mood": "основное настроение",
-                "emotions": ["список эмоций"],
-                "colors": "описание цветов",
-                "music_genre": "подходящий музыкальный жанр",
-                "description": "краткое описание вайба",
-                "caption": "краткое красивое описание для поста"
-            }
-            """
+        # Промпт на нужном языке (реестр шаблонов, services/prompts.py)
+        prompt = prompts.render("mood_analysis", language)
         
-        # Для Azure OpenAI используем модель с поддержкой Vision
-        if self.use_azure:
-            # Пробуем использовать gpt-4o для Vision (если доступен в Azure)
-            try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o",  # Используем gpt-4o для Vision
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{base64_image}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens=500
-                )
-            except Exception as e:
-                # Если gpt-4o недоступен, используем простую заглушку
-                print(f"Azure OpenAI Vision недоступен: {e}")
-                print("🔄 Используется простой анализ изображения...")
-                return self._get_simple_image_analysis(filename)
-        else:
-            # Обычный OpenAI
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
+        # Vision-модель своя у каждого бэкенда (AZURE_OPENAI_VISION_DEPLOYMENT, OPENAI_VISION_MODEL)
+        try:
+            response = await self.router.complete(
+                task="vision",
+                json_mode=True,
+                priority=priority,
+                operation="mood_analysis",
                 messages=[
                     {
                         "role": "user",
@@ -164,7 +143,7 @@ class OpenAIService:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                    "url": data_url
                                 }
                             }
                         ]
@@ -172,79 +151,155 @@ class OpenAIService:
                 ],
                 max_tokens=500
             )
+        except LLMUnavailableError as e:
+            # Ни один бэкенд не ответил - офлайн-анализ, помеченный как fallback
+            print(f"Vision недоступен: {e}")
+            print("🔄 Используется простой анализ изображения...")
+            return self._get_simple_image_analysis(filename)
         
         # Парсим ответ
         content = response.choices[0].message.content
-        try:
-            import json
-            result = json.loads(content)
-        except Exception:
-            # Если ответ не JSON, пробуем найти JSON внутри строки
-            import re, json
-            match = re.search(r'\{[\s\S]*\}', content)
-            if match:
-                try:
-                    result = json.loads(match.group(0))
-                except Exception:
-                    result = {}
-            else:
-                result = {}
-        
+        parsed = parse_structured(content, MoodAnalysisOutput, "mood_analysis")
+        result = self._mood_result(parsed or MoodAnalysisOutput(), content, parse_error=parsed is None)
+        if parsed is not None and image_hash is not None:
+            await asyncio.to_thread(image_analysis_cache.store, image_hash, language, result)
+        return result
+
+    @staticmethod
+    def _mood_result(result: MoodAnalysisOutput, content: Optional[str], parse_error: bool = False) -> Dict[str, Any]:
+        """Ответ API по разобранному анализу настроения"""
         # Формируем финальный ответ с отдельными полями
-        mood = result.get("mood", "neutral")
-        emotions = result.get("emotions", [])
-        colors = result.get("colors", "")
-        music_genre = result.get("music_genre", result.get("music_style", "pop"))
-        description = result.get("description", "")
-        caption = result.get("caption")
+        description = result.description
+        caption = result.caption
         if not caption and description:
             # Если нет caption, делаем его из description
             caption = description[:100] + ("..." if len(description) > 100 else "")
         
-        return {
+        analysis = {
             "success": True,
-            "mood": mood,
-            "emotions": emotions,
-            "colors": colors,
-            "music_genre": music_genre,
+            "mood": result.mood,
+            "emotions": result.emotions,
+            "colors": result.colors,
+            "music_genre": result.music_genre or result.music_style or "pop",
             "description": description,
             "caption": caption,
-            "analysis": content
+            "parse_error": parse_error
         }
-    
-    async def _analyze_video(self, file_content: bytes, filename: str, language: str) -> Dict[str, Any]:
+        if content is not None:
+            analysis["analysis"] = content
+        return analysis
+
+    @staticmethod
+    def _combine_moods(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Общий вайб подборки без модели: самое частое настроение и жанр, эмоции всех изображений"""
+        moods = Counter(r.get("mood") for r in results if r.get("mood"))
+        genres = Counter(r.get("music_genre") for r in results if r.get("music_genre"))
+        emotions = list(dict.fromkeys(e for r in results for e in r.get("emotions") or []))
+        first = results[0] if results else {}
+        return {
+            "success": True,
+            "mood": moods.most_common(1)[0][0] if moods else "neutral",
+            "emotions": emotions[:6],
+            "colors": first.get("colors", ""),
+            "music_genre": genres.most_common(1)[0][0] if genres else "pop",
+            "description": first.get("description", ""),
+            "caption": first.get("caption", ""),
+            "combined": True
+        }
+
+    async def analyze_images_batch(self, images: List[Tuple[bytes, str]], language: str = "ru",
+                                   priority: int = PRIORITY_BASIC) -> Dict[str, Any]:
         """
-        Анализирует видео (пока используем первый кадр)
+        Несколько изображений (карусель) одним Vision-запросом: анализ каждого и общий вайб.
+        images - список (содержимое, имя файла). Уже анализированные изображения берутся из
+        image_analysis_cache, в запрос уходят только остальные. Изображения, которых нет в ответе
+        модели, анализируются по одному (не больше BATCH_FANOUT_CONCURRENCY запросов одновременно).
         """
-        # Для видео пока анализируем только первый кадр
-        # В будущем можно добавить анализ аудио и движения
-        
-        prompt = """
-        Проанализируй этот видеокадр и определи:
-        1. Общее настроение и атмосферу
-        2. Динамику и движение в кадре
-        3. Эмоции и вайб
-        4. Подходящий музыкальный стиль
-        
-        Ответь в формате JSON:
-        {
-            "mood": "основное настроение",
-            "dynamics": "описание динамики",
-            "emotions": ["список эмоций"],
-            "music_style": "подходящий музыкальный стиль",
-            "description": "краткое описание вайба"
+        # dHash и поиск в кэше - для каждого изображения до пакетного запроса
+        lookups = await asyncio.gather(*(self._cached_analysis(content, language) for content, _ in images))
+        hashes = [image_hash for image_hash, _ in lookups]
+        by_index: Dict[int, Dict[str, Any]] = {
+            index: cached for index, (_, cached) in enumerate(lookups) if cached is not None
         }
+        pending = [index for index in range(len(images)) if index not in by_index]
+        if not pending:
+            results = [by_index[index] for index in range(len(images))]
+            return {"success": True, "images": results, "overall": self._combine_moods(results)}
+
+        # base64 нескольких файлов по 10MB - в потоках, параллельно
+        data_urls = dict(zip(pending, await asyncio.gather(*(
+            asyncio.to_thread(image_data_url, *images[index]) for index in pending
+        ))))
+        prompt = prompts.render("mood_analysis_batch", language, count=len(pending))
+        message_content = [{"type": "text", "text": prompt}]
+        message_content.extend({"type": "image_url", "image_url": {"url": data_urls[index]}} for index in pending)
+
+        try:
+            response = await self.router.complete(
+                task="vision",
+                json_mode=True,
+                priority=priority,
+                operation="mood_analysis_batch",
+                messages=[{"role": "user", "content": message_content}],
+                max_tokens=BATCH_BASE_TOKENS + BATCH_TOKENS_PER_IMAGE * len(pending)
+            )
+        except LLMUnavailableError as e:
+            print(f"Vision недоступен: {e}")
+            for index in pending:
+                by_index[index] = self._get_simple_image_analysis(images[index][1])
+            results = [by_index[index] for index in range(len(images))]
+            return {"success": True, "images": results, "overall": self._combine_moods(results), "fallback": True}
+
+        content = response.choices[0].message.content
+        parsed = parse_structured(content, BatchMoodAnalysisOutput, "mood_analysis_batch")
+        answered: Dict[int, Dict[str, Any]] = {}
+        for position, item in enumerate(parsed.images if parsed else []):
+            # Номера в ответе - позиции в запросе, а не в исходном списке
+            position = item.index if item.index is not None else position
+            if 0 <= position < len(pending) and pending[position] not in answered:
+                answered[pending[position]] = self._mood_result(item, None)
+        by_index.update(answered)
+        # Каждый разобранный анализ - в кэш отдельно, как при анализе по одному
+        await asyncio.gather(*(
+            asyncio.to_thread(image_analysis_cache.store, hashes[index], language, result)
+            for index, result in answered.items() if hashes[index] is not None
+        ))
+
+        missing = [index for index in pending if index not in by_index]
+        if missing:
+            metrics.incr("analyze_batch.fanout", len(missing))
+            print(f"[ANALYZE] Пакетный ответ без изображений {missing} - анализируем по одному")
+            semaphore = asyncio.Semaphore(BATCH_FANOUT_CONCURRENCY)
+
+            async def analyze_one(index: int) -> None:
+                async with semaphore:
+                    file_content, filename = images[index]
+                    by_index[index] = await self._analyze_image(file_content, filename, language, priority,
+                                                                data_url=data_urls[index], image_hash=hashes[index])
+
+            await asyncio.gather(*(analyze_one(index) for index in missing))
+
+        results = [by_index[index] for index in range(len(images))]
+        if parsed and "overall" in parsed.model_fields_set:
+            overall = self._mood_result(parsed.overall, None)
+        else:
+            overall = self._combine_moods(results)
+        return {"success": True, "images": results, "overall": overall, "analysis": content}
+
+    async def _analyze_video(self, file_content: bytes, filename: str, language: str) -> Dict[str, Any]:
         """
-        
-        # Пока возвращаем базовый анализ
+        Анализирует видео (пока без модели - базовый анализ на языке запроса)
+        """
+        # В будущем можно добавить анализ кадров, аудио и движения
+        text = VIDEO_STUB_TEXT.get(language) or VIDEO_STUB_TEXT[DEFAULT_LANGUAGE]
         return {
             "success": True,
             "mood": "dynamic",
-            "dynamics": "Видео содержит движение",
-            "emotions": ["энергичность", "динамичность"],
+            "dynamics": text["dynamics"],
+            "emotions": list(text["emotions"]),
             "music_style": "electronic",
-            "description": "Динамичное видео с энергичным настроением",
-            "note": "Полный анализ видео будет доступен в следующих версиях"
+            "description": text["description"],
+            "note": text["note"]
         }
     
     def _get_simple_image_analysis(self, filename: str) -> Dict[str, Any]:
@@ -308,10 +363,11 @@ class OpenAIService:
             "description": descriptions[idx % len(descriptions)],
             "caption": captions[idx % len(captions)],
             "analysis": "Анализ выполнен без AI (базовый режим)",
-            "note": "Используется упрощённый анализ. Для полного анализа настройте Vision API."
+            "note": "Используется упрощённый анализ. Для полного анализа настройте Vision API.",
+            "fallback": True
         }
     
-    def _get_file_type(self, filename: str) -> str:
+    def get_file_type(self, filename: str) -> str:
         """
         Определяет тип файла по расширению
         """
@@ -327,119 +383,71 @@ class OpenAIService:
         else:
             return "unknown"
     
-    async def get_music_recommendations(self, mood_analysis: Dict[str, Any], user_preferences: Dict[str, Any], n_tracks: int = 5, language: str = "ru") -> Dict[str, Any]:
-        """
-        Генерирует рекомендации музыки на основе анализа настроения и предпочтений пользователя (с учётом его лайкнутых треков)
-        """
-        # Создаем промпт в зависимости от языка
-        if language == "en":
-            prompt = f"""
-            Based on the mood "{mood_analysis.get('mood', 'neutral')}" and emotions {mood_analysis.get('emotions', [])} suggest {n_tracks} music tracks.
-            
-            User preferences: {user_preferences.get('top_artists', [])}
-            
-            Respond in JSON format:
-            {{
-                "recommended_tracks": [
-                    {{"name": "track name", "artist": "artist name", "reason": "why it fits"}}
-                ],
-                "explanation": "brief explanation",
-                "alternative_genres": ["genre1", "genre2"]
-            }}
-            """
-        elif language == "kk":
-            prompt = f"""
-            "{mood_analysis.get('mood', 'neutral')}" көңіл-күйі мен {mood_analysis.get('emotions', [])} эмоцияларына негізделіп {n_tracks} музыкалық трек ұсыныңыз.
-            
-            Пайдаланушы таңдаулылары: {user_preferences.get('top_artists', [])}
-            
-            JSON форматында жауап беріңіз:
-            {{
-                "recommended_tracks": [
-                    {{"name": "трек атауы", "artist": "орындаушы атауы", "reason": "неліктен сәйкес келеді"}}
-                ],
-                "explanation": "қысқаша түсіндірме",
-                "alternative_genres": ["жанр1", "жанр2"]
-            }}
-            """
-        else:  # ru - default
-            prompt = f"""
-            На основе настроения "{mood_analysis.get('mood', 'neutral')}" и эмоций {mood_analysis.get('emotions', [])} предложи {n_tracks} музыкальных треков.
-            
-            Предпочтения пользователя: {user_preferences.get('top_artists', [])}
-            
-            Ответь в формате JSON:
-            {{
+    def _recommendations_prompt(self, mood_analysis: Dict[str, Any], user_preferences: Dict[str, Any], n_tracks: int, language: str, candidates: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Промпт рекомендаций на нужном языке"""
+        candidate_list = "; ".join(
+            f"{c['name']} - {c['artist']}" if c.get("artist") else c["name"] for c in candidates or []
+        )
+        # Статика шаблона (инструкции и формат ответа) идет первой - данные запроса в конце промпта
+        return prompts.render(
+            "recommendations", language,
+            mood=mood_analysis.get('mood', 'neutral'),
+            emotions=format_list(mood_analysis.get('emotions', [])),
+            n_tracks=n_tracks,
+            top_artists=format_list(user_preferences.get('top_artists', [])) or "—",
+            candidates=candidate_list or "—",
+        )
+
+    def _parse_recommendations(self, content: str) -> Dict[str, Any]:
+        """Разбирает JSON рекомендаций из ответа модели"""
+        parsed = parse_structured(content, RecommendationsOutput, "recommendations")
+        if parsed is None:
+            return {
+                "explanation": content,
+                "recommended_tracks": [],
+                "alternative_genres": [],
+                "parse_error": True
+            }
+        return parsed.model_dump()
+
+    def _fallback_recommendations(self, e: Exception) -> Dict[str, Any]:
+        """Базовые рекомендации в случае ошибки"""
+        return {
+            "success": True,
+            "recommendations": {
+                "explanation": f"Не удалось получить персонализированные рекомендации: {str(e)}",
                 "recommended_tracks": [
-                    {{"name": "название", "artist": "исполнитель", "reason": "почему подходит"}}
+                    {"name": "Blinding Lights", "artist": "The Weeknd", "reason": "Энергичный поп-трек"},
+                    {"name": "Levitating", "artist": "Dua Lipa", "reason": "Летний вайб"},
+                    {"name": "Circles", "artist": "Post Malone", "reason": "Мелодичный трек"}
                 ],
-                "explanation": "краткое объяснение",
-                "alternative_genres": ["жанр1", "жанр2"]
-            }}
-            """
-        
-        # Выбираем модель и клиент в зависимости от провайдера
-        if self.use_azure:
-            # Для Azure OpenAI используем deployment_name (gpt-4o)
-            model = self.deployment_name
-            client = self.client
-            print(f"[RECOMMEND] Используем Azure OpenAI с моделью: {model}")
-        else:
-            # Для обычного OpenAI используем gpt-4
-            model = "gpt-4"
-            client = self.client
-            print(f"[RECOMMEND] Используем OpenAI API с моделью: {model}")
+                "alternative_genres": ["pop", "electronic", "indie"],
+                "fallback": True
+            }
+        }
+
+    async def get_music_recommendations(self, mood_analysis: Dict[str, Any], user_preferences: Dict[str, Any], n_tracks: int = 5, language: str = "ru", candidates: Optional[List[Dict[str, Any]]] = None, priority: int = PRIORITY_BASIC) -> Dict[str, Any]:
+        """
+        Генерирует рекомендации музыки на основе анализа настроения и предпочтений пользователя (с учётом его лайкнутых треков).
+        candidates - треки, заранее отобранные из локального каталога: модель их переранжирует и объясняет
+        """
+        prompt = self._recommendations_prompt(mood_analysis, user_preferences, n_tracks, language, candidates)
         
         try:
-            print(f"[RECOMMEND] Отправляем запрос к модели {model}...")
-            response = client.chat.completions.create(
-                model=model,
+            print(f"[RECOMMEND] Отправляем запрос к модели {self.chat_model}...")
+            response = await self.router.complete(
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
+                json_mode=True,
+                priority=priority,
+                operation="recommendations",
                 max_tokens=800,
                 timeout=30  # Увеличиваем timeout
             )
             content = response.choices[0].message.content
-            print(f"[RECOMMEND] Получен ответ от {model}: {content}")
-            try:
-                import json
-                # Сначала пробуем парсить как обычный JSON
-                result = json.loads(content)
-            except json.JSONDecodeError:
-                # Если не получилось, ищем JSON в markdown блоке
-                import re
-                json_match = re.search(r'```json\s*(\{[\s\S]*?\})\s*```', content)
-                if json_match:
-                    try:
-                        result = json.loads(json_match.group(1))
-                    except json.JSONDecodeError:
-                        print(f"[RECOMMEND] Ошибка парсинга JSON из markdown: {json_match.group(1)}")
-                        result = {
-                            "explanation": content,
-                            "recommended_tracks": [],
-                            "alternative_genres": []
-                        }
-                else:
-                    # Если markdown блок не найден, ищем любой JSON в тексте
-                    json_match = re.search(r'\{[\s\S]*\}', content)
-                    if json_match:
-                        try:
-                            result = json.loads(json_match.group(0))
-                        except json.JSONDecodeError:
-                            print(f"[RECOMMEND] Ошибка парсинга найденного JSON: {json_match.group(0)}")
-                            result = {
-                                "explanation": content,
-                                "recommended_tracks": [],
-                                "alternative_genres": []
-                            }
-                    else:
-                        print(f"[RECOMMEND] JSON не найден в ответе: {content}")
-                        result = {
-                            "explanation": content,
-                            "recommended_tracks": [],
-                            "alternative_genres": []
-                        }
+            print(f"[RECOMMEND] Получен ответ от {response.model}: {content}")
+            result = self._parse_recommendations(content)
             
             return {
                 "success": True,
@@ -448,15 +456,30 @@ class OpenAIService:
         except Exception as e:
             print(f"[RECOMMEND] Ошибка при получении рекомендаций: {e}")
             # Возвращаем базовые рекомендации в случае ошибки
-            return {
-                "success": True,
-                "recommendations": {
-                    "explanation": f"Не удалось получить персонализированные рекомендации: {str(e)}",
-                    "recommended_tracks": [
-                        {"name": "Blinding Lights", "artist": "The Weeknd", "reason": "Энергичный поп-трек"},
-                        {"name": "Levitating", "artist": "Dua Lipa", "reason": "Летний вайб"},
-                        {"name": "Circles", "artist": "Post Malone", "reason": "Мелодичный трек"}
-                    ],
-                    "alternative_genres": ["pop", "electronic", "indie"]
-                }
-            } 
\ No newline at end of file
+            return self._fallback_recommendations(e)
+
+    async def stream_music_recommendations(self, mood_analysis: Dict[str, Any], user_preferences: Dict[str, Any], n_tracks: int = 5, language: str = "ru", candidates: Optional[List[Dict[str, Any]]] = None, priority: int = PRIORITY_BASIC) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковые рекомендации: {"track": {...}} для каждого трека сразу после его генерации,
+        в конце {"recommendations": {...}} - полный результат, как у get_music_recommendations
+        """
+        prompt = self._recommendations_prompt(mood_analysis, user_preferences, n_tracks, language, candidates)
+        parser = ArrayItemStreamParser("recommended_tracks")
+        try:
+            print(f"[RECOMMEND] Потоковый запрос к модели {self.chat_model}...")
+            async for delta in self.stream_chat_completion([{"role": "user", "content": prompt}], max_tokens=800, json_mode=True, priority=priority, operation="recommendations"):
+                for track in parser.feed(delta):
+                    yield {"track": track}
+            result = self._parse_recommendations(parser.text)
+            if not result.get("recommended_tracks") and parser.items:
+                result["recommended_tracks"] = parser.items
+        except Exception as e:
+            print(f"[RECOMMEND] Ошибка при потоковом получении рекомендаций: {e}")
+            result = self._fallback_recommendations(e)["recommendations"]
+            if parser.items:
+                # Уже отправленные клиенту треки остаются в подборке
+                result["recommended_tracks"] = parser.items
+            else:
+                for track in result["recommended_tracks"]:
+                    yield {"track": track}
+        yield {"recommendations": result}
@@ -0,0 +1,91 @@
+# backend/app/services/passwords.py
+"""
+Хеширование и проверка паролей (bcrypt) вне event loop.
+
+Один вызов bcrypt - 100-300ms CPU. В async-эндпоинте он останавливает весь
+воркер: пачка входов задерживает все остальные запросы. Поэтому хеширование
+идет в отдельном ограниченном пуле потоков (bcrypt отпускает GIL), а event loop
+только ждет результат. Размер пула ограничен, чтобы поток входов не забирал
+все ядра у остального приложения; лишние запросы ждут в очереди пула.
+
+Стоимость задается BCRYPT_ROUNDS. Хеши с другой стоимостью остаются
+валидными и пересчитываются при следующем успешном входе (verify_and_update).
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from ..config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
+from .metrics import metrics
+
+# min = max = default: хеш с любой другой стоимостью считается устаревшим
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasher:
+    """hash()/verify() в пуле из workers потоков; workers=0 - прямо в event loop"""
+
+    def __init__(self, context: CryptContext = pwd_context, workers: int = PASSWORD_HASH_WORKERS):
+        self.context = context
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dummy_hash: Optional[str] = None
+
+    @property
+    def executor(self) -> Optional[ThreadPoolExecutor]:
+        if self._executor is None and self.workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, func, *args):
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            metrics.observe("password.queue_ms", (started - submitted) * 1000)
+            try:
+                return func(*args)
+            finally:
+                metrics.observe("password.hash_ms", (time.perf_counter() - started) * 1000)
+
+        if self.executor is None:
+            return timed()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """(пароль верный, новый хеш или None). Новый хеш - если стоимость хеша устарела"""
+        if not hashed_password:
+            # Пользователя нет или у него нет пароля: тратим столько же времени,
+            # чтобы по времени ответа нельзя было перебирать существующие email
+            await self._run(self._verify_dummy, password)
+            return False, None
+        try:
+            return await self._run(self.context.verify_and_update, password, hashed_password)
+        except (ValueError, TypeError) as e:
+            print(f"⚠️ [AUTH] Некорректный хеш пароля: {e}")
+            return False, None
+
+    def _verify_dummy(self, password: str) -> None:
+        if self._dummy_hash is None:
+            self._dummy_hash = self.context.hash("dummy-password")
+        self.context.verify(password, self._dummy_hash)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,128 @@
+# backend/app/services/profile_cache.py
+"""
+Снимки профиля для GET /users/me.
+
+Фронтенд запрашивает /users/me на каждой странице. Снимок (готовый JSON
+профиля и его ETag) хранится в памяти воркера PROFILE_CACHE_TTL секунд и
+находится по хешу токена, который уже прошел полную проверку (собственный
+JWT или Clerk) - в частом случае ответ не проверяет подпись, не делает ни
+одного запроса к БД и ничего в нее не пишет. Токен действует в кеше не
+дольше своего exp.
+
+Снимок сбрасывается при любом изменении строки users через ORM (профиль,
+счетчик анализов, подтверждение email, привязка Google/Clerk) - слушатель
+after_update, так что новые места записи не нужно помнить отдельно.
+Изменения из других воркеров видны не позже чем через TTL.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+
+from ..config import PROFILE_CACHE_TTL
+from ..models.user import User
+from .http_cache import content_etag
+from .metrics import metrics
+
+PROFILE_CACHE_MAX_USERS = 10000
+PROFILE_CACHE_TOKENS_PER_USER = 8  # токены разных устройств одного пользователя
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ProfileSnapshot:
+    user_id: int
+    content: Dict[str, Any]  # уже JSON-совместимый
+    etag: str
+    day: date                # в новый день меняется remaining_analyses
+    expires_at: float
+
+
+class ProfileCache:
+    def __init__(self, ttl: float = PROFILE_CACHE_TTL, max_users: int = PROFILE_CACHE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._snapshots: "OrderedDict[int, ProfileSnapshot]" = OrderedDict()
+        # хеш проверенного токена -> (user_id, exp токена)
+        self._by_token: Dict[str, Tuple[int, float]] = {}
+        self._tokens_by_user: Dict[int, Dict[str, None]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[ProfileSnapshot]:
+        key = token_key(token)
+        now = time.time()
+        with self._lock:
+            user_id, token_expires_at = self._by_token.get(key, (None, 0.0))
+            snapshot = self._snapshots.get(user_id) if user_id is not None else None
+            if snapshot is not None and token_expires_at < now:
+                # Токен истек - снова полная проверка (401)
+                self._forget_token(key)
+                snapshot = None
+            elif snapshot is not None and (snapshot.expires_at < now or snapshot.day != date.today()):
+                self._drop(user_id)
+                snapshot = None
+            if snapshot is not None:
+                self._snapshots.move_to_end(user_id)
+        metrics.incr("profile_cache.hit" if snapshot else "profile_cache.miss")
+        return snapshot
+
+    def put(self, user: User, content: Dict[str, Any], token: str,
+            token_expires_at: Optional[float] = None) -> ProfileSnapshot:
+        """token должен быть уже проверен; token_expires_at - его exp (unix time)"""
+        content = jsonable_encoder(content)
+        snapshot = ProfileSnapshot(
+            user_id=user.id, content=content, etag=content_etag(f"me-{user.id}", content),
+            day=date.today(), expires_at=time.time() + self.ttl,
+        )
+        if self.ttl <= 0:
+            return snapshot
+        key = token_key(token)
+        with self._lock:
+            self._snapshots.pop(user.id, None)
+            self._snapshots[user.id] = snapshot
+            self._forget_token(key)
+            self._by_token[key] = (user.id, token_expires_at if token_expires_at is not None else float("inf"))
+            tokens = self._tokens_by_user.setdefault(user.id, {})
+            tokens[key] = None
+            while len(tokens) > PROFILE_CACHE_TOKENS_PER_USER:
+                self._forget_token(next(iter(tokens)))
+            while len(self._snapshots) > self.max_users:
+                self._drop(next(iter(self._snapshots)))
+        return snapshot
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._drop(user_id)
+
+    def _drop(self, user_id: int) -> None:
+        self._snapshots.pop(user_id, None)
+        for key in self._tokens_by_user.pop(user_id, {}):
+            self._by_token.pop(key, None)
+
+    def _forget_token(self, key: str) -> None:
+        user_id, _ = self._by_token.pop(key, (None, 0.0))
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.pop(key, None)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+    def size(self) -> int:
+        return len(self._snapshots)
+
+
+profile_cache = ProfileCache()
+
+
+@event.listens_for(User, "after_update")
+def _invalidate_profile(mapper, connection, target: User) -> None:
+    profile_cache.invalidate(target.id)
@@ -0,0 +1,315 @@
+# backend/app/services/prompts.py
+"""
+Реестр шаблонов промптов: (задача, язык) -> PromptTemplate.
+
+Шаблон = статическая часть (инструкции, формат ответа) + динамическая
+(данные запроса: настроение, сообщение пользователя и т.п.). Статика всегда
+идет первой и не меняется между вызовами - так у провайдера срабатывает
+кеширование префикса промпта. Шаблоны собираются один раз при импорте,
+токены статической части считаются один раз - при первом использовании
+шаблона (импорт не загружает словарь tiktoken).
+
+Если шаблона для языка нет, берется DEFAULT_LANGUAGE.
+"""
+import textwrap
+from functools import cached_property
+from string import Formatter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .tokens import count_tokens
+
+DEFAULT_LANGUAGE = "ru"
+LANGUAGES = ("ru", "en", "kk")
+
+
+class RenderedPrompt(str):
+    """Готовый текст промпта с уже посчитанным числом токенов (см. tokens.count_tokens)"""
+    token_count: int
+
+    def __new__(cls, text: str, token_count: int):
+        value = super().__new__(cls, text)
+        value.token_count = token_count
+        return value
+
+
+class PromptTemplate:
+    def __init__(self, task: str, language: str, static: str = "", dynamic: str = ""):
+        self.task = task
+        self.language = language
+        self.static = textwrap.dedent(static).strip()
+        self.dynamic = textwrap.dedent(dynamic).strip()
+        # Статика не форматируется (фигурные скобки JSON в ней - как есть), поля только в динамике
+        self.fields = tuple(name for _, name, _, _ in Formatter().parse(self.dynamic) if name)
+
+    @cached_property
+    def static_tokens(self) -> int:
+        return count_tokens(self.static)
+
+    def system(self) -> RenderedPrompt:
+        """Только статическая часть (например, как системное сообщение)"""
+        return RenderedPrompt(self.static, self.static_tokens)
+
+    def render_dynamic(self, **values) -> RenderedPrompt:
+        text = self.dynamic.format(**values)
+        return RenderedPrompt(text, count_tokens(text))
+
+    def render(self, **values) -> RenderedPrompt:
+        """Статика + динамика одним текстом"""
+        if not self.dynamic:
+            return self.system()
+        dynamic = self.render_dynamic(**values)
+        if not self.static:
+            return dynamic
+        return RenderedPrompt(f"{self.static}\n\n{dynamic}", self.static_tokens + dynamic.token_count + 1)
+
+
+class PromptRegistry:
+    def __init__(self, templates: Iterable[PromptTemplate]):
+        self._templates: Dict[Tuple[str, str], PromptTemplate] = {}
+        for template in templates:
+            key = (template.task, template.language)
+            if key in self._templates:
+                raise ValueError(f"Шаблон {key} объявлен дважды")
+            self._templates[key] = template
+
+    def get(self, task: str, language: Optional[str] = None) -> PromptTemplate:
+        template = self._templates.get((task, language or DEFAULT_LANGUAGE))
+        if template is None:
+            template = self._templates.get((task, DEFAULT_LANGUAGE))
+        if template is None:
+            raise KeyError(f"Нет шаблона промпта для задачи {task!r}")
+        return template
+
+    def render(self, task: str, language: Optional[str] = None, **values) -> RenderedPrompt:
+        return self.get(task, language).render(**values)
+
+    def templates(self) -> List[PromptTemplate]:
+        return list(self._templates.values())
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Токены статической части по задачам и языкам"""
+        result: Dict[str, Dict[str, int]] = {}
+        for (task, language), template in self._templates.items():
+            result.setdefault(task, {})[language] = template.static_tokens
+        return result
+
+
+def format_list(values) -> str:
+    """Список (эмоции, исполнители) -> строка для промпта"""
+    if isinstance(values, (list, tuple)):
+        return ", ".join(str(v) for v in values)
+    return str(values or "")
+
+
+TEMPLATES = [
+    # --- Анализ изображения (текст идет перед картинкой, данных в промпте нет) ---
+    PromptTemplate("mood_analysis", "ru", static="""
+        Проанализируй это изображение и определи:
+        1. Общее настроение и атмосферу (например: радостная, меланхоличная, энергичная, спокойная)
+        2. Цветовую палитру и её влияние на настроение
+        3. Эмоции, которые передаёт изображение
+        4. Музыкальный жанр или стиль, который подошёл бы к этому настроению
+        5. Придумай короткое красивое описание (caption) для поста в соцсетях, отражающее вайб изображения (1-2 предложения, без хэштегов)
+
+        Ответь в формате JSON:
+        {
+            "mood": "основное настроение",
+            "emotions": ["список эмоций"],
+            "colors": "описание цветов",
+            "music_genre": "подходящий музыкальный жанр",
+            "description": "краткое описание вайба",
+            "caption": "краткое красивое описание для поста"
+        }
+    """),
+    PromptTemplate("mood_analysis", "en", static="""
+        Analyze this image and determine:
+        1. Overall mood and atmosphere (e.g.: joyful, melancholic, energetic, calm)
+        2. Color palette and its influence on mood
+        3. Emotions conveyed by the image
+        4. Music genre or style that would suit this mood
+        5. Create a short beautiful caption for a social media post reflecting the vibe of the image (1-2 sentences, no hashtags)
+
+        Respond in JSON format:
+        {
+            "mood": "main mood",
+            "emotions": ["list of emotions"],
+            "colors": "color description",
+            "music_genre": "suitable music genre",
+            "description": "brief vibe description",
+            "caption": "short beautiful post caption"
+        }
+    """),
+    PromptTemplate("mood_analysis", "kk", static="""
+        Бұл суретті талдап, мынаны анықтаңыз:
+        1. Жалпы көңіл-күй мен атмосфера (мысалы: қуанышты, меланхоликалық, энергиялы, тыныш)
+        2. Түс палитрасы және оның көңіл-күйге әсері
+        3. Суреттің беретін эмоциялары
+        4. Осы көңіл-күйге сәйкес келетін музыка жанры немесе стилі
+        5. Суреттің вибін көрсететін әлеуметтік желі постына арналған қысқа әдемі сипаттама ойлап табыңыз (1-2 сөйлем, хэштегсіз)
+
+        JSON форматында жауап беріңіз:
+        {
+            "mood": "негізгі көңіл-күй",
+            "emotions": ["эмоциялар тізімі"],
+            "colors": "түстер сипаттамасы",
+            "music_genre": "сәйкес музыка жанры",
+            "description": "қысқа вайб сипаттамасы",
+            "caption": "пост үшін қысқа әдемі сипаттама"
+        }
+    """),
+
+    # --- Пакетный анализ: несколько изображений в одном запросе ---
+    PromptTemplate("mood_analysis_batch", "ru", static="""
+        Ниже несколько изображений из одной публикации, по порядку начиная с 0.
+        Для каждого изображения определи настроение, эмоции, цвета, подходящий музыкальный жанр,
+        краткое описание вайба и короткое красивое описание для поста (1-2 предложения, без хэштегов).
+        Затем определи общий вайб всей подборки.
+
+        Ответь в формате JSON:
+        {
+            "images": [
+                {"index": 0, "mood": "основное настроение", "emotions": ["список эмоций"], "colors": "описание цветов", "music_genre": "жанр", "description": "краткое описание вайба", "caption": "описание для поста"}
+            ],
+            "overall": {"mood": "общее настроение", "emotions": ["список эмоций"], "colors": "общая палитра", "music_genre": "жанр", "description": "общий вайб подборки", "caption": "описание для поста"}
+        }
+    """, dynamic="Количество изображений: {count}"),
+    PromptTemplate("mood_analysis_batch", "en", static="""
+        Below are several images from one post, in order starting from 0.
+        For each image determine the mood, emotions, colors, a suitable music genre,
+        a brief vibe description and a short beautiful post caption (1-2 sentences, no hashtags).
+        Then determine the overall vibe of the whole set.
+
+        Respond in JSON format:
+        {
+            "images": [
+                {"index": 0, "mood": "main mood", "emotions": ["list of emotions"], "colors": "color description", "music_genre": "genre", "description": "brief vibe description", "caption": "post caption"}
+            ],
+            "overall": {"mood": "overall mood", "emotions": ["list of emotions"], "colors": "overall palette", "music_genre": "genre", "description": "overall vibe of the set", "caption": "post caption"}
+        }
+    """, dynamic="Number of images: {count}"),
+    PromptTemplate("mood_analysis_batch", "kk", static="""
+        Төменде бір жарияланымның бірнеше суреті берілген, 0-ден бастап ретімен.
+        Әр сурет үшін көңіл-күйді, эмоцияларды, түстерді, сәйкес музыка жанрын,
+        қысқа вайб сипаттамасын және пост үшін қысқа әдемі сипаттаманы анықтаңыз (1-2 сөйлем, хэштегсіз).
+        Содан кейін бүкіл топтаманың жалпы вайбын анықтаңыз.
+
+        JSON форматында жауап беріңіз:
+        {
+            "images": [
+                {"index": 0, "mood": "негізгі көңіл-күй", "emotions": ["эмоциялар тізімі"], "colors": "түстер сипаттамасы", "music_genre": "жанр", "description": "қысқа вайб сипаттамасы", "caption": "пост сипаттамасы"}
+            ],
+            "overall": {"mood": "жалпы көңіл-күй", "emotions": ["эмоциялар тізімі"], "colors": "жалпы палитра", "music_genre": "жанр", "description": "топтаманың жалпы вайбы", "caption": "пост сипаттамасы"}
+        }
+    """, dynamic="Суреттер саны: {count}"),
+
+    # --- Рекомендации треков ---
+    PromptTemplate("recommendations", "ru", static="""
+        Ты музыкальный эксперт. Подбери музыкальные треки под настроение и эмоции, указанные ниже, с учетом предпочтений пользователя.
+        Если дан список треков-кандидатов, выбирай в первую очередь из него (неподходящие можно заменить).
+
+        Ответь в формате JSON:
+        {
+            "recommended_tracks": [
+                {"name": "название", "artist": "исполнитель", "reason": "почему подходит"}
+            ],
+            "explanation": "краткое объяснение",
+            "alternative_genres": ["жанр1", "жанр2"]
+        }
+    """, dynamic="""
+        Настроение: "{mood}"
+        Эмоции: {emotions}
+        Количество треков: {n_tracks}
+        Предпочтения пользователя: {top_artists}
+        Треки-кандидаты: {candidates}
+    """),
+    PromptTemplate("recommendations", "en", static="""
+        You are a music expert. Suggest music tracks that fit the mood and emotions given below, taking the user's preferences into account.
+        If a list of candidate tracks is given, prefer tracks from it (you may replace the ones that do not fit).
+
+        Respond in JSON format:
+        {
+            "recommended_tracks": [
+                {"name": "track name", "artist": "artist name", "reason": "why it fits"}
+            ],
+            "explanation": "brief explanation",
+            "alternative_genres": ["genre1", "genre2"]
+        }
+    """, dynamic="""
+        Mood: "{mood}"
+        Emotions: {emotions}
+        Number of tracks: {n_tracks}
+        User preferences: {top_artists}
+        Candidate tracks: {candidates}
+    """),
+    PromptTemplate("recommendations", "kk", static="""
+        Сіз музыка сарапшысысыз. Төменде көрсетілген көңіл-күй мен эмоцияларға сәйкес музыкалық тректер ұсыныңыз, пайдаланушының таңдауларын ескеріңіз.
+        Үміткер тректер тізімі берілсе, негізінен осы тізімнен таңдаңыз (сәйкес келмейтіндерін ауыстыруға болады).
+
+        JSON форматында жауап беріңіз:
+        {
+            "recommended_tracks": [
+                {"name": "трек атауы", "artist": "орындаушы атауы", "reason": "неліктен сәйкес келеді"}
+            ],
+            "explanation": "қысқаша түсіндірме",
+            "alternative_genres": ["жанр1", "жанр2"]
+        }
+    """, dynamic="""
+        Көңіл-күй: "{mood}"
+        Эмоциялар: {emotions}
+        Тректер саны: {n_tracks}
+        Пайдаланушы таңдаулылары: {top_artists}
+        Үміткер тректер: {candidates}
+    """),
+
+    # --- Чат: статика - системное сообщение, динамика - сообщение пользователя ---
+    PromptTemplate("chat", "ru", static="""
+        Ты дружелюбный музыкальный эксперт, который помогает людям находить музыку по настроению.
+        Отвечай дружелюбно и помогай пользователю с музыкальными рекомендациями.
+        Можешь предложить жанры, исполнителей или обсудить музыкальные предпочтения.
+    """, dynamic="{message}"),
+    PromptTemplate("chat", "en", static="""
+        You are a friendly music expert who helps people find music that matches their mood.
+        Answer in a friendly way and help the user with music recommendations.
+        You can suggest genres and artists or discuss music preferences.
+    """, dynamic="{message}"),
+    PromptTemplate("chat", "kk", static="""
+        Сіз адамдарға көңіл-күйіне сай музыка табуға көмектесетін мейірімді музыка сарапшысысыз.
+        Мейірімді жауап беріп, пайдаланушыға музыкалық ұсыныстармен көмектесіңіз.
+        Жанрлар мен орындаушыларды ұсынуға немесе музыкалық талғамды талқылауға болады.
+    """, dynamic="{message}"),
+    PromptTemplate("chat_mood", "ru", dynamic="""
+        Контекст анализа настроения:
+        - Настроение: {mood}
+        - Описание: {description}
+        - Эмоции: {emotions}
+    """),
+    PromptTemplate("chat_mood", "en", dynamic="""
+        Mood analysis context:
+        - Mood: {mood}
+        - Description: {description}
+        - Emotions: {emotions}
+    """),
+    PromptTemplate("chat_mood", "kk", dynamic="""
+        Көңіл-күй талдауының контексті:
+        - Көңіл-күй: {mood}
+        - Сипаттама: {description}
+        - Эмоциялар: {emotions}
+    """),
+    PromptTemplate("chat_history_summary", "ru", dynamic="Краткое содержание предыдущего разговора: {summary}"),
+    PromptTemplate("chat_history_summary", "en", dynamic="Summary of the previous conversation: {summary}"),
+    PromptTemplate("chat_history_summary", "kk", dynamic="Алдыңғы әңгіменің қысқаша мазмұны: {summary}"),
+
+    # --- Сворачивание переписки в резюме (внутренний промпт, только ru) ---
+    PromptTemplate("chat_summary", "ru", static="""
+        Обнови краткое содержание разговора пользователя с музыкальным помощником.
+        Сохрани музыкальные предпочтения, упомянутых исполнителей, настроение и открытые вопросы.
+        Не больше 150 слов.
+    """, dynamic="""
+        Текущее содержание: {previous}
+
+        Новые сообщения:
+        {transcript}
+    """),
+]
+
+prompts = PromptRegistry(TEMPLATES)
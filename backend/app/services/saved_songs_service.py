@@ -0,0 +1,196 @@
+# backend/app/services/saved_songs_service.py
+import base64
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, update, tuple_
+from sqlalchemy.orm import Session
+
+from ..models.user import SavedSong, User
+from .catalog_service import CatalogService, dialect_insert, normalize_song_key
+from .taste_profile import TasteProfileService
+
+# Колонки, которые отдает список избранного - все они есть в ix_saved_songs_user_date_saved
+LISTING_COLUMNS = (
+    SavedSong.id,
+    SavedSong.user_id,
+    SavedSong.youtube_video_id,
+    SavedSong.title,
+    SavedSong.artist,
+    SavedSong.date_saved,
+)
+
+
+class InvalidCursorError(ValueError):
+    """Курсор пагинации поврежден или подделан"""
+
+
+def encode_cursor(date_saved: datetime, song_id: int) -> str:
+    """Курсор keyset-пагинации: позиция последней отданной строки"""
+    raw = f"{date_saved.isoformat()}|{song_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        date_part, id_part = raw.rsplit("|", 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError(str(e))
+
+
+def library_etag(user: User) -> str:
+    """ETag библиотеки избранного - меняется при каждом добавлении/удалении"""
+    return f'W/"lib-{user.id}-{user.library_version or 0}"'
+
+
+class SavedSongsService:
+    def __init__(self, taste_profile_service: Optional[TasteProfileService] = None,
+                 catalog_service: Optional[CatalogService] = None):
+        self.taste_profile_service = taste_profile_service or TasteProfileService()
+        self.catalog_service = catalog_service or CatalogService()
+
+    def list_songs(self, db: Session, user_id: int, limit: Optional[int] = None,
+                   cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+        """
+        Избранное пользователя, новые сверху. Keyset-пагинация по (date_saved, id):
+        каждая страница - это поиск по индексу, без OFFSET.
+        Возвращает (строки, курсор следующей страницы или None).
+        """
+        stmt = (
+            select(*LISTING_COLUMNS)
+            .where(SavedSong.user_id == user_id)
+            .order_by(SavedSong.date_saved.desc(), SavedSong.id.desc())
+        )
+        if cursor:
+            stmt = stmt.where(tuple_(SavedSong.date_saved, SavedSong.id) < decode_cursor(cursor))
+        if limit is None:
+            return db.execute(stmt).all(), None
+
+        # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+        rows = db.execute(stmt.limit(limit + 1)).all()
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].date_saved, rows[-1].id)
+
+    def bump_library_version(self, db: Session, user_id: int) -> None:
+        """Увеличивает версию библиотеки в той же транзакции, что и изменение"""
+        db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(library_version=User.library_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    def add_song(self, db: Session, user_id: int, youtube_video_id: str,
+                 title: str, artist: Optional[str] = None):
+        """
+        Сохраняет песню одним запросом. Дубликаты (тот же video_id или
+        та же пара название/исполнитель) отсекаются уникальными ограничениями.
+        Возвращает строку или None, если песня уже сохранена.
+        """
+        insert = dialect_insert(db)
+        stmt = insert(SavedSong).values(
+            user_id=user_id,
+            youtube_video_id=youtube_video_id,
+            title=title,
+            artist=artist,
+            dedup_key=normalize_song_key(title, artist),
+            date_saved=datetime.utcnow(),
+        ).on_conflict_do_nothing().returning(*LISTING_COLUMNS)
+        row = db.execute(stmt).first()
+        if row is not None:
+            self.bump_library_version(db, user_id)
+            self.taste_profile_service.record_changes(db, user_id, saved=[row])
+            self.catalog_service.record_saved(db, [row])
+        db.commit()
+        return row
+
+    def delete_song(self, db: Session, user_id: int, youtube_video_id: str) -> bool:
+        """Удаляет песню, возвращает False если ее не было"""
+        rows = db.execute(
+            delete(SavedSong).where(
+                SavedSong.user_id == user_id,
+                SavedSong.youtube_video_id == youtube_video_id,
+            ).returning(SavedSong.title, SavedSong.artist, SavedSong.date_saved)
+        ).all()
+        if rows:
+            self.bump_library_version(db, user_id)
+            self.taste_profile_service.record_changes(db, user_id, deleted=rows)
+        db.commit()
+        return bool(rows)
+
+    def bulk_add(self, db: Session, user_id: int, songs: List[Dict]) -> List[Dict]:
+        """
+        Сохраняет пачку песен одной транзакцией: один многострочный
+        INSERT ... ON CONFLICT DO NOTHING, конфликты пропускаются.
+        Возвращает результат по каждой песне в исходном порядке.
+        """
+        now = datetime.utcnow()
+        seen_videos, seen_keys, values = set(), set(), []
+        for song in songs:
+            key = normalize_song_key(song["title"], song.get("artist"))
+            # Дубликаты внутри самой пачки отсекаем до запроса
+            if song["youtube_video_id"] in seen_videos or key in seen_keys:
+                continue
+            seen_videos.add(song["youtube_video_id"])
+            seen_keys.add(key)
+            values.append({
+                "user_id": user_id,
+                "youtube_video_id": song["youtube_video_id"],
+                "title": song["title"],
+                "artist": song.get("artist"),
+                "dedup_key": key,
+                "date_saved": now,
+            })
+
+        created = {}
+        if values:
+            insert = dialect_insert(db)
+            stmt = insert(SavedSong).values(values).on_conflict_do_nothing().returning(*LISTING_COLUMNS)
+            rows = db.execute(stmt).all()
+            created = {row.youtube_video_id: row.id for row in rows}
+            if rows:
+                self.bump_library_version(db, user_id)
+                self.taste_profile_service.record_changes(db, user_id, saved=rows)
+                self.catalog_service.record_saved(db, rows)
+        db.commit()
+
+        results = []
+        for song in songs:
+            video_id = song["youtube_video_id"]
+            song_id = created.pop(video_id, None)
+            results.append({
+                "youtube_video_id": video_id,
+                "status": "created" if song_id is not None else "duplicate",
+                "id": song_id,
+            })
+        return results
+
+    def bulk_delete(self, db: Session, user_id: int, youtube_video_ids: List[str]) -> List[Dict]:
+        """Удаляет пачку песен одним DELETE ... RETURNING, результат по каждому id"""
+        deleted = set()
+        unique_ids = list(dict.fromkeys(youtube_video_ids))
+        if unique_ids:
+            stmt = delete(SavedSong).where(
+                SavedSong.user_id == user_id,
+                SavedSong.youtube_video_id.in_(unique_ids),
+            ).returning(SavedSong.youtube_video_id, SavedSong.title, SavedSong.artist, SavedSong.date_saved)
+            rows = db.execute(stmt).all()
+            deleted = {row.youtube_video_id for row in rows}
+            if rows:
+                self.bump_library_version(db, user_id)
+                self.taste_profile_service.record_changes(db, user_id, deleted=rows)
+        db.commit()
+
+        results, reported = [], set()
+        for video_id in youtube_video_ids:
+            if video_id in reported:
+                status = "duplicate"
+            else:
+                status = "deleted" if video_id in deleted else "not_found"
+            reported.add(video_id)
+            results.append({"youtube_video_id": video_id, "status": status})
+        return results
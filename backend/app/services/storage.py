@@ -0,0 +1,222 @@
+# backend/app/services/storage.py
+"""
+Хранилище сгенерированного и скачанного аудио.
+
+LocalAudioStorage - шардированный audio_cache на диске (один инстанс бэкенда).
+S3AudioStorage - любое S3-совместимое хранилище (AWS S3, MinIO и т.п.):
+файлы загружаются multipart-потоком, а клиенту отдаются presigned-ссылки,
+так что байты аудио не проходят через воркеры API.
+"""
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import BinaryIO, Optional
+
+from ..config import (
+    AUDIO_STORAGE_BACKEND,
+    S3_BUCKET,
+    S3_ENDPOINT_URL,
+    S3_REGION,
+    S3_ACCESS_KEY_ID,
+    S3_SECRET_ACCESS_KEY,
+    S3_KEY_PREFIX,
+    S3_PRESIGN_EXPIRES,
+    S3_MULTIPART_CHUNK_SIZE,
+)
+from .audio_cache import AUDIO_EXTENSIONS, cache_path, resolve_cached_file, shard_prefix, cache_key
+
+# Размер блока при потоковой записи на диск
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "m4a": "audio/mp4",
+    "mp4": "audio/mp4",
+    "webm": "audio/webm",
+    "wav": "audio/wav",
+    "status": "application/json",
+    "error": "text/plain; charset=utf-8",
+}
+
+
+def content_type_for(filename: str) -> str:
+    """Определяет MIME тип по расширению"""
+    ext = filename.rsplit(".", 1)[-1].lower()
+    return CONTENT_TYPES.get(ext, "application/octet-stream")
+
+
+class AudioStorage(ABC):
+    """Базовый интерфейс хранилища аудио"""
+
+    @abstractmethod
+    def exists(self, filename: str) -> bool:
+        ...
+
+    @abstractmethod
+    def save_stream(self, filename: str, stream: BinaryIO) -> None:
+        """Сохраняет файл из потока, не загружая его целиком в память"""
+
+    @abstractmethod
+    def save_file(self, filename: str, local_path: str) -> None:
+        """Сохраняет локальный файл (например, скачанный yt-dlp)"""
+
+    @abstractmethod
+    def write_text(self, filename: str, text: str) -> None:
+        ...
+
+    @abstractmethod
+    def read_text(self, filename: str) -> Optional[str]:
+        ...
+
+    def local_path(self, filename: str) -> Optional[str]:
+        """Путь на диске, если файл хранится локально"""
+        return None
+
+    def url_for(self, filename: str, download_name: Optional[str] = None) -> Optional[str]:
+        """Прямая ссылка на файл (presigned) или None, если файл отдает сам API"""
+        return None
+
+    def find_audio(self, key: str) -> Optional[str]:
+        """Ищет аудио для id среди поддерживаемых расширений, возвращает имя файла"""
+        for ext in AUDIO_EXTENSIONS:
+            filename = f"{key}.{ext}"
+            if self.exists(filename):
+                return filename
+        return None
+
+
+class LocalAudioStorage(AudioStorage):
+    """Шардированный audio_cache на локальном диске"""
+
+    def exists(self, filename: str) -> bool:
+        return resolve_cached_file(filename) is not None
+
+    def save_stream(self, filename: str, stream: BinaryIO) -> None:
+        target = cache_path(filename, create_dir=True)
+        # Пишем во временный файл рядом и атомарно переименовываем,
+        # чтобы недокачанный файл не был виден как готовый
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def save_file(self, filename: str, local_path: str) -> None:
+        target = cache_path(filename, create_dir=True)
+        if os.path.abspath(local_path) != os.path.abspath(target):
+            os.replace(local_path, target)
+
+    def write_text(self, filename: str, text: str) -> None:
+        with open(cache_path(filename, create_dir=True), "w") as f:
+            f.write(text)
+
+    def read_text(self, filename: str) -> Optional[str]:
+        path = resolve_cached_file(filename)
+        if not path:
+            return None
+        with open(path, "r") as f:
+            return f.read()
+
+    def local_path(self, filename: str) -> Optional[str]:
+        return resolve_cached_file(filename)
+
+
+class S3AudioStorage(AudioStorage):
+    """S3-совместимое хранилище (AWS S3, MinIO и т.п.)"""
+
+    def __init__(self):
+        if not S3_BUCKET:
+            raise ValueError("AUDIO_STORAGE_BACKEND=s3, но S3_BUCKET не задан")
+
+        # boto3 нужен только для этого бэкенда
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+        self.bucket = S3_BUCKET
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=S3_ENDPOINT_URL,
+            region_name=S3_REGION,
+            aws_access_key_id=S3_ACCESS_KEY_ID,
+            aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+            # path-style адресация нужна MinIO и другим локальным S3
+            config=Config(s3={"addressing_style": "path"} if S3_ENDPOINT_URL else {}),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_CHUNK_SIZE,
+            multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+        )
+        print(f"🪣 Аудио хранится в S3: bucket={self.bucket}, endpoint={S3_ENDPOINT_URL or 'AWS'}")
+
+    def _key(self, filename: str) -> str:
+        # Тот же префикс шарда, что и на диске - распределяет ключи по партициям S3
+        parts = [S3_KEY_PREFIX, shard_prefix(cache_key(filename)), filename]
+        return "/".join(p.replace(os.sep, "/") for p in parts if p)
+
+    def exists(self, filename: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(filename))
+            return True
+        except self._client_error:
+            return False
+
+    def save_stream(self, filename: str, stream: BinaryIO) -> None:
+        # upload_fileobj читает поток частями и сам переключается на multipart upload
+        self.client.upload_fileobj(
+            stream,
+            self.bucket,
+            self._key(filename),
+            ExtraArgs={"ContentType": content_type_for(filename)},
+            Config=self.transfer_config,
+        )
+
+    def save_file(self, filename: str, local_path: str) -> None:
+        self.client.upload_file(
+            local_path,
+            self.bucket,
+            self._key(filename),
+            ExtraArgs={"ContentType": content_type_for(filename)},
+            Config=self.transfer_config,
+        )
+        os.remove(local_path)
+
+    def write_text(self, filename: str, text: str) -> None:
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(filename),
+            Body=text.encode("utf-8"),
+            ContentType=content_type_for(filename),
+        )
+
+    def read_text(self, filename: str) -> Optional[str]:
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._key(filename))
+        except self._client_error:
+            return None
+        return obj["Body"].read().decode("utf-8")
+
+    def url_for(self, filename: str, download_name: Optional[str] = None) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": self._key(filename)}
+        if download_name:
+            params["ResponseContentDisposition"] = f"attachment; filename={download_name}"
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=S3_PRESIGN_EXPIRES)
+
+
+@lru_cache(maxsize=1)
+def get_audio_storage() -> AudioStorage:
+    """Возвращает хранилище, выбранное через AUDIO_STORAGE_BACKEND"""
+    if AUDIO_STORAGE_BACKEND == "s3":
+        return S3AudioStorage()
+    return LocalAudioStorage()
@@ -0,0 +1,73 @@
+# backend/app/services/structured_output.py
+"""
+Разбор структурированных (JSON) ответов модели.
+
+Порядок: json.loads всего ответа (JSON-режим), затем один запасной проход -
+raw_decode с первой "{" (покрывает markdown-блок ```json и текст вокруг
+объекта) и валидация в Pydantic-модель. Результат разбора и его время
+пишутся в метрики: llm_parse.<name>.<direct|extracted|not_found|invalid>
+и llm_parse.<name>.ms.
+"""
+import json
+import time
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from ..config import LLM_JSON_MODE
+from .metrics import metrics
+
+T = TypeVar("T", bound=BaseModel)
+
+_decoder = json.JSONDecoder()
+
+# Модели, которые принимают response_format={"type": "json_object"}
+JSON_MODE_MODEL_PREFIXES = ("gpt-4o", "gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-3.5-turbo-1106", "gpt-3.5-turbo-0125")
+
+
+def supports_json_mode(model: str) -> bool:
+    if LLM_JSON_MODE == "on":
+        return True
+    if LLM_JSON_MODE == "off":
+        return False
+    return bool(model) and model.lower().startswith(JSON_MODE_MODEL_PREFIXES)
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Первый JSON-объект в тексте: один raw_decode с первой "{", без regex с откатами"""
+    start = text.find("{")
+    if start < 0:
+        return None
+    try:
+        value, _ = _decoder.raw_decode(text, start)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def parse_structured(content: Optional[str], model_cls: Type[T], name: str) -> Optional[T]:
+    """Ответ модели -> экземпляр model_cls или None (с записью в лог и метрики)"""
+    start = time.perf_counter()
+    content = content or ""
+    try:
+        data = json.loads(content)
+        outcome = "direct"
+    except ValueError:
+        data = extract_json_object(content)
+        outcome = "extracted" if data is not None else "not_found"
+
+    result = None
+    if isinstance(data, dict):
+        try:
+            result = model_cls.model_validate(data)
+        except ValidationError as e:
+            outcome = "invalid"
+            print(f"⚠️ [LLM] {name}: ответ не прошел валидацию: {e.errors()[:3]}")
+    elif outcome != "not_found":
+        outcome = "invalid"
+
+    metrics.incr(f"llm_parse.{name}.{outcome}")
+    metrics.observe(f"llm_parse.{name}.ms", (time.perf_counter() - start) * 1000)
+    if result is None:
+        print(f"⚠️ [LLM] {name}: не удалось разобрать ответ ({outcome}): {content[:200]!r}")
+    return result
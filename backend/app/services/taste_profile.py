@@ -0,0 +1,170 @@
+# backend/app/services/taste_profile.py
+"""
+Материализованный профиль вкуса пользователя.
+
+Хранится JSON-строкой в User.preferences и обновляется инкрементально при
+сохранении/удалении песен, поэтому рекомендациям не нужно перечитывать все
+избранное. Веса исполнителей затухают со временем (период полураспада
+TASTE_HALF_LIFE_DAYS), а список ограничен TASTE_MAX_ARTISTS записями.
+"""
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from ..models.user import SavedSong, User
+
+PROFILE_VERSION = 1
+TASTE_HALF_LIFE_DAYS = 90
+TASTE_MAX_ARTISTS = 50   # сколько исполнителей храним
+TASTE_MAX_TRACKS = 20    # сколько последних треков храним
+PROMPT_TOP_ARTISTS = 10  # сколько исполнителей уходит в промпт
+PROMPT_TOP_TRACKS = 5
+MIN_WEIGHT = 0.01
+
+_HALF_LIFE_SECONDS = TASTE_HALF_LIFE_DAYS * 24 * 3600
+
+
+def artist_key(artist: str) -> str:
+    """Ключ исполнителя в профиле вкуса (его же использует отбор кандидатов)"""
+    return " ".join(artist.split()).casefold()
+
+
+def _decay(weight: float, seconds: float) -> float:
+    """Вес, затухший за указанное время"""
+    if seconds <= 0:
+        return weight
+    return weight * 0.5 ** (seconds / _HALF_LIFE_SECONDS)
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    """Unix-время даты из БД: date_saved пишется как naive datetime.utcnow(), то есть в UTC"""
+    if value is None:
+        return time.time()
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def empty_profile() -> Dict[str, Any]:
+    return {"v": PROFILE_VERSION, "updated_at": time.time(), "song_count": 0, "artists": {}, "tracks": []}
+
+
+class TasteProfileService:
+    def load(self, user: User) -> Optional[Dict[str, Any]]:
+        """Читает профиль из уже загруженного пользователя (без запросов к БД)"""
+        if not user.preferences:
+            return None
+        try:
+            profile = json.loads(user.preferences)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(profile, dict) or profile.get("v") != PROFILE_VERSION:
+            return None
+        return profile
+
+    def _apply(self, profile: Dict[str, Any], saved: Iterable = (), deleted: Iterable = ()) -> Dict[str, Any]:
+        """Применяет изменения к профилю; saved/deleted - строки с title, artist, date_saved"""
+        now = time.time()
+        elapsed = now - profile.get("updated_at", now)
+        artists = profile["artists"]
+        # Приводим все веса к текущему моменту - их не больше TASTE_MAX_ARTISTS
+        for entry in artists.values():
+            entry["w"] = _decay(entry["w"], elapsed)
+
+        tracks = profile["tracks"]
+        for song in saved:
+            profile["song_count"] += 1
+            if song.artist:
+                key = artist_key(song.artist)
+                entry = artists.setdefault(key, {"name": song.artist.strip(), "w": 0.0})
+                entry["w"] += _decay(1.0, now - _timestamp(song.date_saved))
+            tracks.insert(0, [song.title, song.artist])
+
+        for song in deleted:
+            profile["song_count"] = max(0, profile["song_count"] - 1)
+            if song.artist:
+                key = artist_key(song.artist)
+                entry = artists.get(key)
+                if entry:
+                    entry["w"] -= _decay(1.0, now - _timestamp(song.date_saved))
+            track = [song.title, song.artist]
+            if track in tracks:
+                tracks.remove(track)
+
+        # Оставляем только top-K исполнителей с заметным весом
+        top = sorted(
+            ((k, v) for k, v in artists.items() if v["w"] >= MIN_WEIGHT),
+            key=lambda item: item[1]["w"],
+            reverse=True,
+        )[:TASTE_MAX_ARTISTS]
+        profile["artists"] = {k: {"name": v["name"], "w": round(v["w"], 4)} for k, v in top}
+        profile["tracks"] = tracks[:TASTE_MAX_TRACKS]
+        profile["updated_at"] = now
+        return profile
+
+    def _lock_user(self, db: Session, user_id: int) -> User:
+        # FOR UPDATE сериализует параллельные изменения профиля одного пользователя
+        return (
+            db.query(User)
+            .filter(User.id == user_id)
+            .with_for_update()
+            .populate_existing()
+            .one()
+        )
+
+    def record_changes(self, db: Session, user_id: int, saved: List = (), deleted: List = ()) -> None:
+        """
+        Обновляет профиль в текущей транзакции (commit делает вызывающий код).
+        saved/deleted - объекты с полями title, artist, date_saved.
+        """
+        if not saved and not deleted:
+            return
+        user = self._lock_user(db, user_id)
+        profile = self.load(user)
+        if profile is None:
+            # Профиля еще нет - строим по уже сохраненным песням (изменения уже в них учтены)
+            profile = self._build(db, user_id)
+        else:
+            profile = self._apply(profile, saved=saved, deleted=deleted)
+        user.preferences = json.dumps(profile, ensure_ascii=False)
+
+    def _build(self, db: Session, user_id: int) -> Dict[str, Any]:
+        songs = (
+            db.query(SavedSong.title, SavedSong.artist, SavedSong.date_saved)
+            .filter(SavedSong.user_id == user_id)
+            .order_by(SavedSong.date_saved.asc(), SavedSong.id.asc())
+            .all()
+        )
+        return self._apply(empty_profile(), saved=songs)
+
+    def rebuild(self, db: Session, user: User) -> Dict[str, Any]:
+        """Полностью пересчитывает профиль по избранному и сохраняет его"""
+        profile = self._build(db, user.id)
+        user.preferences = json.dumps(profile, ensure_ascii=False)
+        db.commit()
+        return profile
+
+    def get_preferences(self, db: Session, user: User) -> Optional[Dict[str, Any]]:
+        """
+        Компактные предпочтения для промпта рекомендаций или None, если
+        у пользователя нет избранного. Профиль читается из строки пользователя;
+        пересчет по saved_songs нужен только один раз для старых аккаунтов.
+        """
+        profile = self.load(user)
+        if profile is None:
+            profile = self.rebuild(db, user)
+        if not profile["song_count"]:
+            return None
+
+        now = time.time()
+        elapsed = now - profile.get("updated_at", now)
+        artists = sorted(profile["artists"].values(), key=lambda a: a["w"], reverse=True)
+        return {
+            "top_genres": [],
+            "top_artists": [a["name"] for a in artists[:PROMPT_TOP_ARTISTS]],
+            "top_tracks": [title for title, _ in profile["tracks"][:PROMPT_TOP_TRACKS]],
+            "artist_weights": {a["name"]: round(_decay(a["w"], elapsed), 3) for a in artists[:PROMPT_TOP_ARTISTS]},
+        }
@@ -0,0 +1,240 @@
+# backend/app/services/throttle.py
+"""
+Ограничение попыток входа, регистрации и подтверждения email.
+
+Sliding window counter: на ключ хранятся счетчики текущего и предыдущего
+окна, оценка числа попыток за последние window секунд =
+prev * (доля предыдущего окна, еще попадающая в интервал) + curr.
+Память - O(1) на ключ, точность достаточна для защиты от перебора.
+Ключи - IP клиента и email из запроса: перебор паролей одного аккаунта
+с разных IP упирается в лимит по email, перебор многих аккаунтов с одного
+IP - в лимит по IP.
+
+Проверка идет первой строкой эндпоинта: отклоненный запрос не доходит
+до bcrypt, запросов в БД и отправки писем. Лимит по IP считает каждый
+запрос. Лимит по email до проверки только читается, а засчитываются
+неудачные проверки (Throttle.failed - неверный пароль или код) либо, для
+действий с побочным эффектом (повторное письмо), пропущенные запросы.
+Отклоненные запросы счетчик email не увеличивают - чужой email нельзя
+держать заблокированным, просто присылая запросы с ним.
+
+Хранилище: в памяти процесса (по умолчанию; при нескольких воркерах лимит
+действует на каждый воркер отдельно) или общий Redis (THROTTLE_BACKEND=redis).
+Если Redis недоступен, лимиты временно считаются в памяти процесса.
+"""
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from ..config import THROTTLE_BACKEND, THROTTLE_REDIS_URL, THROTTLE_TRUST_FORWARDED
+from .metrics import metrics
+
+SWEEP_INTERVAL = 60.0  # как часто из памяти удаляются ключи с истекшими окнами
+
+
+@dataclass(frozen=True)
+class ThrottleRule:
+    key: str        # "ip" или "email"
+    limit: int      # попыток за окно
+    window: int     # секунды
+    failures_only: bool = False  # считать только неудачные проверки (Throttle.failed)
+
+
+# Лимиты по действию: по IP - с запасом на NAT/офисы, по email - против перебора
+THROTTLE_RULES: Dict[str, Tuple[ThrottleRule, ...]] = {
+    "login": (ThrottleRule("ip", 30, 60), ThrottleRule("email", 10, 900, failures_only=True)),
+    "register": (ThrottleRule("ip", 10, 3600),),
+    # 6-значный код: 10 неверных кодов за 15 минут (код живет 15 минут)
+    "verify_email": (ThrottleRule("ip", 30, 60), ThrottleRule("email", 10, 900, failures_only=True)),
+    # Каждый повтор - письмо через Brevo
+    "resend_verification": (ThrottleRule("ip", 10, 3600), ThrottleRule("email", 3, 900)),
+}
+
+
+def sliding_count(prev: int, curr: int, elapsed: float, window: int) -> float:
+    """Оценка числа попыток за последние window секунд (elapsed - время от начала текущего окна)"""
+    return prev * max(0.0, 1.0 - elapsed / window) + curr
+
+
+class MemoryThrottleStore:
+    """Счетчики в памяти процесса: ключ -> [номер окна, prev, curr]"""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._counters: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._swept_at = clock()
+
+    def hit(self, key: str, window: int) -> Tuple[float, float]:
+        """Засчитывает попытку; возвращает (оценка попыток за окно, секунд до конца текущего окна)"""
+        return self._count(key, window, 1)
+
+    def peek(self, key: str, window: int) -> Tuple[float, float]:
+        """То же, что hit, но без увеличения счетчика"""
+        return self._count(key, window, 0)
+
+    def _count(self, key: str, window: int, increment: int) -> Tuple[float, float]:
+        now = self._clock()
+        index, elapsed = divmod(now, window)
+        index = int(index)
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None and not increment:
+                return 0.0, window - elapsed
+            if entry is None or entry[0] < index - 1:
+                entry = self._counters[key] = [index, 0, 0]
+            elif entry[0] == index - 1:
+                entry[0], entry[1], entry[2] = index, entry[2], 0
+            entry[2] += increment
+            count = sliding_count(entry[1], entry[2], elapsed, window)
+            if now - self._swept_at > SWEEP_INTERVAL:
+                self._sweep(now)
+        return count, window - elapsed
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def _sweep(self, now: float) -> None:
+        # Окно ключа зашито в сам ключ (см. Throttle._key)
+        expired = [key for key, entry in self._counters.items()
+                   if entry[0] < int(now // int(key.rsplit(":", 1)[1])) - 1]
+        for key in expired:
+            del self._counters[key]
+        self._swept_at = now
+
+    def size(self) -> int:
+        return len(self._counters)
+
+
+class RedisThrottleStore:
+    """Общие счетчики в Redis: INCR текущего окна + GET предыдущего одним pipeline"""
+
+    def __init__(self, url: str):
+        # redis нужен только для этого хранилища
+        import redis.asyncio as redis
+        self.client = redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    async def hit(self, key: str, window: int) -> Tuple[float, float]:
+        now = time.time()
+        index, elapsed = divmod(now, window)
+        index = int(index)
+        current = f"throttle:{key}:{index}"
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incr(current)
+            pipe.expire(current, window * 2)
+            pipe.get(f"throttle:{key}:{index - 1}")
+            curr, _, prev = await pipe.execute()
+        return sliding_count(int(prev or 0), int(curr), elapsed, window), window - elapsed
+
+    async def peek(self, key: str, window: int) -> Tuple[float, float]:
+        now = time.time()
+        index, elapsed = divmod(now, window)
+        index = int(index)
+        curr, prev = await self.client.mget(f"throttle:{key}:{index}", f"throttle:{key}:{index - 1}")
+        return sliding_count(int(prev or 0), int(curr or 0), elapsed, window), window - elapsed
+
+    async def reset(self, key: str, window: int) -> None:
+        index = int(time.time() // window)
+        await self.client.delete(f"throttle:{key}:{index}", f"throttle:{key}:{index - 1}")
+
+
+def client_ip(request: Request) -> str:
+    """IP клиента; за прокси (THROTTLE_TRUST_FORWARDED) - последний адрес из X-Forwarded-For"""
+    if THROTTLE_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class Throttle:
+    def __init__(self, backend: str = THROTTLE_BACKEND, redis_url: Optional[str] = THROTTLE_REDIS_URL,
+                 rules: Dict[str, Tuple[ThrottleRule, ...]] = THROTTLE_RULES):
+        self.rules = rules
+        self.memory = MemoryThrottleStore()
+        self.redis: Optional[RedisThrottleStore] = None
+        if backend == "redis":
+            if not redis_url:
+                raise ValueError("THROTTLE_BACKEND=redis, но THROTTLE_REDIS_URL не задан")
+            self.redis = RedisThrottleStore(redis_url)
+
+    @staticmethod
+    def _key(action: str, rule: ThrottleRule, value: str) -> str:
+        # email не храним в открытом виде (ключи видны в Redis и в дампах памяти)
+        digest = hashlib.sha256(value.strip().lower().encode()).hexdigest()[:24]
+        return f"{action}:{rule.key}:{digest}:{rule.window}"
+
+    async def _count(self, key: str, window: int, increment: bool) -> Tuple[float, float]:
+        if self.redis is not None:
+            try:
+                if increment:
+                    return await self.redis.hit(key, window)
+                return await self.redis.peek(key, window)
+            except Exception as e:
+                metrics.incr("throttle.redis_errors")
+                print(f"⚠️ [THROTTLE] Redis недоступен, лимит в памяти процесса: {e}")
+        if increment:
+            return self.memory.hit(key, window)
+        return self.memory.peek(key, window)
+
+    async def check(self, request: Request, action: str, email: Optional[str] = None) -> None:
+        """
+        Проверяет лимиты действия; при превышении любого - 429 с Retry-After.
+        Попытка по IP засчитывается всегда, по email - только если запрос пропущен
+        (и правило не failures_only - тогда считает Throttle.failed)
+        """
+        values = {"ip": client_ip(request), "email": email}
+        retry_after = 0.0
+        counted_later = []
+        for rule in self.rules[action]:
+            value = values.get(rule.key)
+            if not value:
+                continue
+            key = self._key(action, rule, value)
+            if rule.key == "ip":
+                count, window_left = await self._count(key, rule.window, increment=True)
+            else:
+                count, window_left = await self._count(key, rule.window, increment=False)
+                count += 1  # с учетом текущей попытки
+                if not rule.failures_only:
+                    counted_later.append((key, rule.window))
+            if count > rule.limit:
+                retry_after = max(retry_after, window_left)
+        if retry_after:
+            metrics.incr(f"throttle.rejected.{action}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много попыток. Попробуйте позже.",
+                headers={"Retry-After": str(int(retry_after) + 1)},
+            )
+        for key, window in counted_later:
+            await self._count(key, window, increment=True)
+
+    async def failed(self, action: str, email: Optional[str]) -> None:
+        """Засчитывает неудачную проверку (неверный пароль или код) в лимиты failures_only"""
+        if not email:
+            return
+        for rule in self.rules[action]:
+            if rule.key == "email" and rule.failures_only:
+                await self._count(self._key(action, rule, email), rule.window, increment=True)
+
+    async def reset(self, action: str, email: str) -> None:
+        """Сбрасывает лимит по email (например, после успешного входа)"""
+        for rule in self.rules[action]:
+            if rule.key != "email":
+                continue
+            key = self._key(action, rule, email)
+            self.memory.reset(key)
+            if self.redis is not None:
+                try:
+                    await self.redis.reset(key, rule.window)
+                except Exception as e:
+                    print(f"⚠️ [THROTTLE] Не удалось сбросить лимит в Redis: {e}")
+
+
+throttle = Throttle()
@@ -0,0 +1,61 @@
+# backend/app/services/tokens.py
+"""
+Подсчет токенов для бюджетирования промптов.
+
+Используется tiktoken (cl100k_base / o200k_base); если он не установлен или
+словарь не удалось загрузить (нет сети), - грубая оценка по символам.
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+# Служебные токены на каждое сообщение чата (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Изображение в Vision-запросе (detail=auto, до 4 тайлов 512px): 85 + 170 * 4
+IMAGE_TOKENS = 765
+
+
+@lru_cache(maxsize=4)
+def _encoding(name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"⚠️ [TOKENS] tiktoken недоступен ({e}), используем оценку по символам")
+        return None
+
+
+def _encoding_name(model: Optional[str]) -> str:
+    return "o200k_base" if model and "4o" in model else "cl100k_base"
+
+
+def _encoding_for_model(model: Optional[str]):
+    return _encoding(_encoding_name(model))
+
+
+def count_tokens(text: Optional[str], model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    # Промпт из реестра шаблонов (services/prompts.py) уже посчитан в cl100k_base
+    precomputed = getattr(text, "token_count", None)
+    if precomputed is not None and _encoding_name(model) == "cl100k_base":
+        return precomputed
+    encoding = _encoding_for_model(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Кириллица и казахский кодируются плотнее латиницы: ~2.5 символа на токен против ~4
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return int(non_ascii / 2.5 + (len(text) - non_ascii) / 4) + 1
+
+
+def _content_tokens(content: Any, model: Optional[str]) -> int:
+    if isinstance(content, list):
+        # Мультимодальное сообщение: текстовые части + фиксированная оценка на изображение
+        return sum(
+            count_tokens(part.get("text"), model) if part.get("type") == "text" else IMAGE_TOKENS
+            for part in content
+        )
+    return count_tokens(content, model)
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], model: Optional[str] = None) -> int:
+    return sum(_content_tokens(m.get("content"), model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
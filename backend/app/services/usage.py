@@ -0,0 +1,247 @@
+# backend/app/services/usage.py
+"""
+Учет токенов и стоимости вызовов LLM.
+
+Эндпоинт привязывает к текущему запросу пользователя и имя эндпоинта
+(bind_usage) - через contextvar, поэтому роутер LLM и задачи, созданные внутри
+запроса (hedged-запросы, потоковые подборки), пишут учет без передачи этих
+параметров по всей цепочке вызовов.
+
+Записи копятся в памяти и пачкой вставляются в llm_usage фоновым потоком
+(раз в USAGE_FLUSH_INTERVAL секунд или при USAGE_FLUSH_SIZE записях) -
+запрос к модели не ждет INSERT. Агрегаты - usage_summary() для /admin/usage.
+"""
+import json
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, case, cast, func, insert
+from sqlalchemy.orm import Session
+
+from ..config import LLM_PRICES
+from ..models.user import LLMUsage, User
+from .metrics import metrics
+
+USAGE_FLUSH_INTERVAL = 5.0
+USAGE_FLUSH_SIZE = 200
+USAGE_BUFFER_LIMIT = 20000  # если БД недоступна - старые записи отбрасываются
+
+# Цена за 1M токенов, USD: (вход, выход, вход из кеша провайдера). Ключ - префикс имени модели
+# (для Azure - имя deployment), побеждает самый длинный совпавший. Переопределяется LLM_PRICES.
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4-turbo": (10.00, 30.00, 10.00),
+    "gpt-4-1106": (10.00, 30.00, 10.00),
+    "gpt-4-0125": (10.00, 30.00, 10.00),
+    "gpt-4": (30.00, 60.00, 30.00),
+    "gpt-35-turbo": (0.50, 1.50, 0.50),
+    "gpt-3.5-turbo": (0.50, 1.50, 0.50),
+}
+if LLM_PRICES:
+    MODEL_PRICES.update({model: tuple(price) for model, price in json.loads(LLM_PRICES).items()})
+
+GROUP_COLUMNS = {
+    "endpoint": LLMUsage.endpoint,
+    "operation": LLMUsage.operation,
+    "model": LLMUsage.model,
+    "backend": LLMUsage.backend,
+    "user": LLMUsage.user_id,
+    "day": func.date(LLMUsage.created_at),
+}
+
+# (user_id, endpoint) текущего запроса
+_usage_context: ContextVar[Tuple[Optional[int], Optional[str]]] = ContextVar("llm_usage_context", default=(None, None))
+
+
+def bind_usage(user, endpoint: str) -> None:
+    """Привязывает учет вызовов LLM в текущем запросе к пользователю (User, id или None) и эндпоинту"""
+    user_id = user if user is None or isinstance(user, int) else user.id
+    _usage_context.set((user_id, endpoint))
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    if not model:
+        return None
+    name = model.lower()
+    matches = [prefix for prefix in MODEL_PRICES if name.startswith(prefix)]
+    if not matches:
+        return None
+    price_in, price_out, price_cached = MODEL_PRICES[max(matches, key=len)]
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * price_in + cached_tokens * price_cached + completion_tokens * price_out) / 1_000_000
+
+
+class UsageRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, operation: str, backend: Optional[str] = None, model: Optional[str] = None,
+               prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0,
+               latency_ms: Optional[float] = None, cache_hit: bool = False,
+               estimated: bool = False, ok: bool = True) -> None:
+        user_id, endpoint = _usage_context.get()
+        row = {
+            "created_at": datetime.utcnow(),
+            "user_id": user_id,
+            "endpoint": endpoint,
+            "operation": operation,
+            "backend": backend,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "cost_usd": estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens) if ok else None,
+            "latency_ms": latency_ms,
+            "cache_hit": cache_hit,
+            "estimated": estimated,
+            "ok": ok,
+        }
+        if row["cost_usd"]:
+            metrics.incr(f"llm_cost_usd.{endpoint or operation}", row["cost_usd"])
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) > USAGE_BUFFER_LIMIT:
+                dropped = len(self._buffer) - USAGE_BUFFER_LIMIT
+                del self._buffer[:dropped]
+                metrics.incr("llm_usage.dropped", dropped)
+            full = len(self._buffer) >= USAGE_FLUSH_SIZE
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-usage-flush", daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def record_response(self, operation: str, backend: str, model: str, response, latency_ms: float) -> None:
+        """Учет по usage из ответа chat.completions.create"""
+        usage = getattr(response, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        if isinstance(details, dict):
+            cached = details.get("cached_tokens") or 0
+        else:
+            cached = getattr(details, "cached_tokens", 0) or 0
+        self.record(
+            operation, backend, getattr(response, "model", None) or model,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            cached_tokens=cached, latency_ms=latency_ms, estimated=usage is None
+        )
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        from ..database import SessionLocal
+        db = SessionLocal()
+        try:
+            db.execute(insert(LLMUsage), rows)
+            db.commit()
+            return len(rows)
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ [USAGE] Не удалось записать {len(rows)} записей учета LLM: {e}")
+            with self._lock:
+                # Вернем в начало буфера - попробуем при следующем сбросе
+                self._buffer[:0] = rows
+                del self._buffer[:max(0, len(self._buffer) - USAGE_BUFFER_LIMIT)]
+            return 0
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(USAGE_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+
+usage_recorder = UsageRecorder()
+
+
+def _row(values) -> Dict[str, Any]:
+    calls = values.calls or 0
+    return {
+        "calls": calls,
+        "errors": int(values.errors or 0),
+        "cache_hits": int(values.cache_hits or 0),
+        "cache_hit_rate": round((values.cache_hits or 0) / calls, 3) if calls else 0.0,
+        "prompt_tokens": int(values.prompt_tokens or 0),
+        "completion_tokens": int(values.completion_tokens or 0),
+        "cached_tokens": int(values.cached_tokens or 0),
+        "cost_usd": round(values.cost_usd or 0.0, 4),
+        "avg_latency_ms": round(values.avg_latency_ms, 1) if values.avg_latency_ms is not None else None,
+    }
+
+
+def usage_summary(db: Session, days: int = 7, group_by: str = "endpoint", limit: int = 50) -> Dict[str, Any]:
+    """Сводка учета за последние days дней с группировкой по group_by и самые дорогие вызовы"""
+    if group_by not in GROUP_COLUMNS:
+        raise ValueError(f"group_by: одно из {', '.join(GROUP_COLUMNS)}")
+    usage_recorder.flush()
+    since = datetime.utcnow() - timedelta(days=days)
+    aggregates = (
+        func.count(LLMUsage.id).label("calls"),
+        func.sum(case((LLMUsage.ok == False, 1), else_=0)).label("errors"),  # noqa: E712
+        func.sum(cast(LLMUsage.cache_hit, Integer)).label("cache_hits"),
+        func.sum(LLMUsage.prompt_tokens).label("prompt_tokens"),
+        func.sum(LLMUsage.completion_tokens).label("completion_tokens"),
+        func.sum(LLMUsage.cached_tokens).label("cached_tokens"),
+        func.sum(LLMUsage.cost_usd).label("cost_usd"),
+        func.avg(case((LLMUsage.cache_hit == False, LLMUsage.latency_ms))).label("avg_latency_ms"),  # noqa: E712
+    )
+    key = GROUP_COLUMNS[group_by].label("key")
+    grouped = (
+        db.query(key, *aggregates)
+        .filter(LLMUsage.created_at >= since)
+        .group_by(key)
+        .order_by(func.sum(LLMUsage.cost_usd).desc().nullslast(), func.count(LLMUsage.id).desc())
+        .limit(limit)
+        .all()
+    )
+    totals = db.query(*aggregates).filter(LLMUsage.created_at >= since).one()
+
+    usernames = {}
+    if group_by == "user":
+        ids = [row.key for row in grouped if row.key is not None]
+        usernames = dict(db.query(User.id, User.username).filter(User.id.in_(ids)).all()) if ids else {}
+
+    rows = []
+    for row in grouped:
+        item = {group_by: str(row.key) if row.key is not None else None, **_row(row)}
+        if group_by == "user":
+            item["username"] = usernames.get(row.key)
+        rows.append(item)
+
+    top_calls = (
+        db.query(LLMUsage)
+        .filter(LLMUsage.created_at >= since, LLMUsage.cost_usd.isnot(None))
+        .order_by(LLMUsage.cost_usd.desc())
+        .limit(10)
+        .all()
+    )
+    return {
+        "since": since.isoformat(),
+        "group_by": group_by,
+        "totals": _row(totals),
+        "rows": rows,
+        "top_calls": [
+            {
+                "created_at": call.created_at.isoformat(),
+                "user_id": call.user_id,
+                "endpoint": call.endpoint,
+                "operation": call.operation,
+                "model": call.model,
+                "prompt_tokens": call.prompt_tokens,
+                "completion_tokens": call.completion_tokens,
+                "cost_usd": round(call.cost_usd, 5),
+                "latency_ms": round(call.latency_ms, 1) if call.latency_ms is not None else None,
+            }
+            for call in top_calls
+        ],
+    }
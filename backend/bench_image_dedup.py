@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска почти-дубликатов изображений (app/services/image_hash.py).
+
+1. Доля найденных дубликатов: синтетические "фото" и их копии (пережатие JPEG,
+   уменьшение, скриншот с полосами интерфейса, яркость) - расстояние dHash до
+   оригинала против расстояния между разными фото.
+2. Задержка поиска в индексе на миллион записей (случайные хеши + оригиналы)
+   в сравнении с полным перебором на numpy.
+
+Запуск:
+    python bench_image_dedup.py
+    BENCH_INDEX_SIZE=100000 BENCH_IMAGES=100 python bench_image_dedup.py
+"""
+import io
+import os
+import random
+import statistics
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from app.services.image_hash import HammingIndex, dhash, hamming
+
+INDEX_SIZE = int(os.getenv("BENCH_INDEX_SIZE", "1000000"))
+IMAGES = int(os.getenv("BENCH_IMAGES", "200"))
+MAX_DISTANCE = int(os.getenv("BENCH_MAX_DISTANCE", "5"))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, timings):
+    ms = [t * 1000 for t in timings]
+    print(f"  {name:<26} n={len(ms):<6} p50={percentile(ms, 50):7.3f}ms  "
+          f"p95={percentile(ms, 95):7.3f}ms  p99={percentile(ms, 99):7.3f}ms  mean={statistics.mean(ms):7.3f}ms")
+
+
+def synthetic_photo(rng: np.random.Generator, width: int = 1280, height: int = 960) -> Image.Image:
+    """Плавные пятна и градиенты со слабым шумом - грубое подобие фотографии"""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.zeros((height, width, 3), dtype=np.float32)
+    angle = rng.uniform(0, 2 * np.pi)
+    gradient = (np.cos(angle) * x / width + np.sin(angle) * y / height)
+    image += rng.uniform(0, 255, 3) * gradient[..., None] * rng.uniform(0.2, 0.8) + rng.uniform(0, 120, 3)
+    for _ in range(rng.integers(4, 9)):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        radius = rng.uniform(60, 400)
+        blob = np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * radius ** 2))
+        image += blob[..., None] * rng.uniform(-160, 200, 3)
+    image += rng.normal(0, 6, image.shape)
+    return Image.fromarray(np.clip(image, 0, 255).astype(np.uint8))
+
+
+def encode(image: Image.Image, fmt: str = "JPEG", **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def variants(image: Image.Image):
+    """Копии, которые пользователь мог загрузить повторно"""
+    width, height = image.size
+    yield "jpeg q=50", encode(image, quality=50)
+    yield "уменьшение 1/3", encode(image.resize((width // 3, height // 3)), quality=85)
+    screenshot = Image.new("RGB", (width, int(height * 1.1)), (18, 18, 18))
+    screenshot.paste(image, (0, int(height * 0.05)))
+    yield "скриншот с полосами", encode(screenshot, "PNG")
+    yield "яркость +15%", encode(ImageEnhance.Brightness(image).enhance(1.15), quality=90)
+    yield "обрезка 3%", encode(image.crop((width * 3 // 100, height * 3 // 100, width, height)), quality=90)
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса (Linux)"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def popcount_table():
+    return np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    print(f"🔍 {IMAGES} синтетических фото, порог расстояния {MAX_DISTANCE}")
+
+    originals, duplicates, hash_timings = [], [], []
+    for _ in range(IMAGES):
+        image = synthetic_photo(rng)
+        content = encode(image, quality=92)
+        start = time.perf_counter()
+        original = dhash(content)
+        hash_timings.append(time.perf_counter() - start)
+        originals.append(original)
+        for name, copy in variants(image):
+            duplicates.append((name, len(originals) - 1, dhash(copy)))
+
+    big = encode(synthetic_photo(rng, 4032, 3024), quality=90)
+    big_timings = []
+    for _ in range(10):
+        start = time.perf_counter()
+        dhash(big)
+        big_timings.append(time.perf_counter() - start)
+
+    print("\nВремя dHash:")
+    report("фото 1280x960 JPEG", hash_timings)
+    report("фото 4032x3024 JPEG", big_timings)
+
+    print(f"\nДубликаты (расстояние до оригинала <= {MAX_DISTANCE}):")
+    by_kind = {}
+    for name, source, value in duplicates:
+        by_kind.setdefault(name, []).append(hamming(value, originals[source]))
+    for name, distances in by_kind.items():
+        found = sum(1 for d in distances if d <= MAX_DISTANCE) / len(distances)
+        print(f"  {name:<22} найдено {found:6.1%}  медиана расстояния {statistics.median(distances):4.1f}  макс {max(distances)}")
+    distinct = [hamming(a, b) for i, a in enumerate(originals) for b in originals[i + 1:]]
+    false_matches = sum(1 for d in distinct if d <= MAX_DISTANCE)
+    print(f"  разные фото: медиана расстояния {statistics.median(distinct):.1f}, "
+          f"ложных совпадений {false_matches} из {len(distinct)} пар")
+
+    print(f"\nИндекс на {INDEX_SIZE} записей (случайные 64-битные хеши + {IMAGES} оригиналов):")
+    random.seed(42)
+    index = HammingIndex()
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    for i in range(INDEX_SIZE - IMAGES):
+        index.add(random.getrandbits(64), i)
+    for i, value in enumerate(originals):
+        index.add(value, ("original", i))
+    build_s = time.perf_counter() - start
+    print(f"  построение {build_s:.1f}s, память +{rss_mb() - rss_before:.0f}MB")
+
+    lookup_timings, hits = [], 0
+    for _, source, value in duplicates:
+        start = time.perf_counter()
+        found = index.search(value, MAX_DISTANCE)
+        lookup_timings.append(time.perf_counter() - start)
+        if any(v == ("original", source) for _, v in found):
+            hits += 1
+    miss_timings = []
+    for _ in range(1000):
+        query = random.getrandbits(64)
+        start = time.perf_counter()
+        index.search(query, MAX_DISTANCE)
+        miss_timings.append(time.perf_counter() - start)
+    report("поиск копии (multi-index)", lookup_timings)
+    report("поиск нового хеша", miss_timings)
+    print(f"  доля найденных дубликатов: {hits / len(duplicates):.1%} ({hits} из {len(duplicates)})")
+
+    hashes = np.array(index._hashes, dtype=np.uint64)
+    table = popcount_table()
+    brute_timings = []
+    for _, _, value in duplicates[:50]:
+        start = time.perf_counter()
+        distances = table[(hashes ^ np.uint64(value)).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+        np.flatnonzero(distances <= MAX_DISTANCE)
+        brute_timings.append(time.perf_counter() - start)
+    report("полный перебор (numpy)", brute_timings)
+
+
+if __name__ == "__main__":
+    main()
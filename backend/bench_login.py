@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк входа (/users/login) при конкурентных запросах.
+
+Приложение поднимается в процессе (httpx + ASGITransport) на временной SQLite.
+Пачка из BENCH_CONCURRENCY одновременных входов повторяется BENCH_ROUNDS раз;
+параллельно каждые 20ms запрашивается /health - его задержка показывает, насколько
+bcrypt блокирует event loop для остальных запросов.
+
+Сравниваются режимы PASSWORD_HASH_WORKERS: 0 (bcrypt прямо в event loop, как
+раньше) и пул потоков. Отдельно - первый вход пользователей со старой
+стоимостью хеша (пересчет хеша при входе).
+
+Запуск:
+    python bench_login.py
+    BENCH_CONCURRENCY=32 BENCH_WORKERS=0,2,4 BCRYPT_ROUNDS=10 python bench_login.py
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_login.db')}"
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from passlib.context import CryptContext
+
+from app.config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
+from app.database import SessionLocal, engine
+from app.main import app
+from app.models.user import Base, User
+from app.services.passwords import password_hasher, pwd_context
+
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "16"))
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "3"))
+WORKER_MODES = [int(w) for w in os.getenv("BENCH_WORKERS", f"0,{max(1, PASSWORD_HASH_WORKERS)}").split(",")]
+PASSWORD = "correct horse battery staple"
+HEALTH_INTERVAL = 0.02
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, timings):
+    ms = [t * 1000 for t in timings]
+    print(f"  {name:<24} n={len(ms):<5} p50={percentile(ms, 50):8.1f}ms  "
+          f"p95={percentile(ms, 95):8.1f}ms  max={max(ms):8.1f}ms  mean={statistics.mean(ms):8.1f}ms")
+
+
+def create_users(prefix: str, count: int, hashed_password: str) -> None:
+    db = SessionLocal()
+    for i in range(count):
+        db.add(User(email=f"{prefix}{i}@bench.local", username=f"{prefix}{i}", hashed_password=hashed_password,
+                    is_verified=True, provider="email", daily_usage=0))
+    db.commit()
+    db.close()
+
+
+async def login(client: httpx.AsyncClient, email: str, timings) -> None:
+    start = time.perf_counter()
+    response = await client.post("/users/login", json={"email": email, "password": PASSWORD})
+    timings.append(time.perf_counter() - start)
+    if response.status_code != 200:
+        raise RuntimeError(f"login {email}: {response.status_code} {response.text[:200]}")
+
+
+async def probe_health(client: httpx.AsyncClient, stop: asyncio.Event, timings) -> None:
+    """Задержка считается от запланированного момента запроса: пока event loop
+    занят bcrypt, запрос не может даже начаться"""
+    scheduled = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        await client.get("/health")
+        timings.append(time.perf_counter() - scheduled)
+        scheduled = max(scheduled + HEALTH_INTERVAL, time.perf_counter())
+
+
+async def burst(client: httpx.AsyncClient, prefix: str, rounds: int):
+    login_timings, health_timings = [], []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe_health(client, stop, health_timings))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(login(client, f"{prefix}{i}@bench.local", login_timings) for i in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await prober
+    return login_timings, health_timings, elapsed
+
+
+async def main():
+    Base.metadata.create_all(bind=engine)
+    current_hash = pwd_context.hash(PASSWORD)
+    old_rounds = max(4, BCRYPT_ROUNDS - 2)
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=old_rounds).hash(PASSWORD)
+    create_users("user", CONCURRENCY, current_hash)
+
+    print(f"🔐 bcrypt rounds={BCRYPT_ROUNDS}, {CONCURRENCY} одновременных входов x {ROUNDS}, CPU: {os.cpu_count()}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await login(client, "user0@bench.local", [])  # прогрев
+
+        for workers in WORKER_MODES:
+            password_hasher.shutdown()
+            password_hasher.workers = workers
+            mode = "в event loop" if workers == 0 else f"пул {workers} потоков"
+            login_timings, health_timings, elapsed = await burst(client, "user", ROUNDS)
+            print(f"\nPASSWORD_HASH_WORKERS={workers} ({mode}): "
+                  f"{len(login_timings) / elapsed:.1f} входов/с")
+            report("вход", login_timings)
+            report("/health во время входов", health_timings)
+
+            prefix = f"old{workers}_"
+            create_users(prefix, CONCURRENCY, old_hash)
+            first, _, _ = await burst(client, prefix, 1)
+            second, _, _ = await burst(client, prefix, 1)
+            db = SessionLocal()
+            upgraded = sum(1 for (h,) in db.query(User.hashed_password).filter(User.username.like(f"{prefix}%"))
+                           if not pwd_context.needs_update(h))
+            db.close()
+            report(f"вход rounds={old_rounds}->{BCRYPT_ROUNDS}", first)
+            report("следующий вход", second)
+            print(f"  хешей пересчитано: {upgraded} из {CONCURRENCY}")
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк избранного: задержка сохранения и получения списка при 10k песен у пользователя.
+
+Запуск:
+    python bench_saved_songs.py                     # SQLite во временном файле
+    BENCH_DATABASE_URL=postgresql://... python bench_saved_songs.py
+"""
+import os
+import sys
+import statistics
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.user import Base, User
+from app.services.saved_songs_service import SavedSongsService
+
+SONGS_PER_USER = int(os.getenv("BENCH_SONGS", "10000"))
+LIST_RUNS = int(os.getenv("BENCH_LIST_RUNS", "50"))
+PAGE_SIZE = int(os.getenv("BENCH_PAGE_SIZE", "50"))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, timings):
+    ms = [t * 1000 for t in timings]
+    print(f"  {name:<22} n={len(ms):<6} p50={percentile(ms, 50):7.2f}ms  "
+          f"p95={percentile(ms, 95):7.2f}ms  p99={percentile(ms, 99):7.2f}ms  mean={statistics.mean(ms):7.2f}ms")
+
+
+def main():
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    service = SavedSongsService()
+
+    db = Session()
+    user = User(email="bench@example.com", username="bench")
+    db.add(user)
+    db.commit()
+
+    print(f"🔍 {url.split('://')[0]}: {SONGS_PER_USER} песен на пользователя")
+
+    save_timings = []
+    for i in range(SONGS_PER_USER):
+        start = time.perf_counter()
+        service.add_song(db, user.id, f"vid{i:08d}", f"Track {i}", f"Artist {i % 500}")
+        save_timings.append(time.perf_counter() - start)
+
+    dup_timings = []
+    for i in range(0, SONGS_PER_USER, max(1, SONGS_PER_USER // 1000)):
+        start = time.perf_counter()
+        row = service.add_song(db, user.id, f"other{i:08d}", f"  track {i} ", f"ARTIST {i % 500}")
+        dup_timings.append(time.perf_counter() - start)
+        assert row is None, "дубликат по названию/исполнителю должен отсекаться"
+
+    list_timings = []
+    for _ in range(LIST_RUNS):
+        start = time.perf_counter()
+        songs, _ = service.list_songs(db, user.id)
+        list_timings.append(time.perf_counter() - start)
+    assert len(songs) == SONGS_PER_USER
+
+    page_timings = []
+    cursor, pages = None, 0
+    while True:
+        start = time.perf_counter()
+        page, cursor = service.list_songs(db, user.id, limit=PAGE_SIZE, cursor=cursor)
+        page_timings.append(time.perf_counter() - start)
+        pages += 1
+        if not cursor:
+            break
+    assert pages == -(-SONGS_PER_USER // PAGE_SIZE)
+
+    print("📊 Результаты:")
+    report("save (new)", save_timings)
+    report("save (duplicate)", dup_timings)
+    report(f"list ({SONGS_PER_USER} rows)", list_timings)
+    report(f"page ({PAGE_SIZE} rows)", page_timings)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта приложения.
+
+Каждый замер - отдельный процесс python (холодный импорт), как при запуске
+воркера uvicorn. Измеряются:
+  - import app.main - время до готовности приложения принимать запросы;
+  - первый ответ /health после импорта (startup-хуки + запрос);
+  - пиковая RSS процесса;
+  - какие тяжелые SDK оказались загружены при импорте (должны грузиться
+    при первом использовании сервиса, а не при старте).
+
+Запуск:
+    python bench_startup.py
+    BENCH_RUNS=20 python bench_startup.py
+    SERVICE_WARMUP=auth_service,chat_context_service python bench_startup.py
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RUNS = int(os.getenv("BENCH_RUNS", "10"))
+HEAVY_MODULES = ["openai", "yt_dlp", "sib_api_v3_sdk", "authlib", "google.oauth2", "aiohttp"]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.container import container
+with TestClient(app.main.app) as client:
+    assert client.get("/health").status_code == 200
+    ready = time.perf_counter()
+    # После выхода из TestClient lifespan закрывает и сбрасывает сервисы
+    services = sorted(container.built())
+print(json.dumps({
+    "import": imported - start,
+    "health": ready - start,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [name for name in %r if name in sys.modules],
+    "services": services,
+}))
+""" % (HEAVY_MODULES,)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, values, unit="ms"):
+    print(f"  {name:<24} n={len(values):<5} p50={percentile(values, 50):8.1f}{unit}  "
+          f"p95={percentile(values, 95):8.1f}{unit}  max={max(values):8.1f}{unit}  "
+          f"mean={statistics.mean(values):8.1f}{unit}")
+
+
+def run_once(env) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    # Приложение печатает свои сообщения при старте - результат в последней строке
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_startup.db')}",
+        "SECRET_KEY": os.getenv("SECRET_KEY", "bench-secret"),
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-bench"),
+        # Фоновый прогрев сервисов по умолчанию выключен, чтобы список SDK отражал сам старт
+        "SERVICE_WARMUP": os.getenv("SERVICE_WARMUP", ""),
+    }
+    run_once(env)  # прогрев: .pyc и схема SQLite
+    results = [run_once(env) for _ in range(RUNS)]
+
+    print(f"\n🚀 Холодный старт, {RUNS} процессов")
+    report("import app.main", [r["import"] * 1000 for r in results])
+    report("первый /health", [r["health"] * 1000 for r in results])
+    report("RSS", [r["rss_mb"] for r in results], unit="MB")
+    print(f"  Тяжелые SDK после старта: {', '.join(results[-1]['heavy']) or 'нет'}")
+    print(f"  Созданные сервисы:        {', '.join(results[-1]['services']) or 'нет'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк лимита попыток входа: сколько CPU стоит отклоненный запрос.
+
+Приложение поднимается в процессе (httpx + ASGITransport) на временной SQLite.
+Сравниваются:
+1. вход с неверным паролем без лимита - проверка bcrypt на каждый запрос;
+2. тот же перебор с лимитом - после исчерпания лимита запросы получают 429
+   до bcrypt и БД;
+3. сам вызов счетчика (MemoryThrottleStore.hit) без HTTP.
+CPU - time.process_time() процесса (все потоки, включая пул bcrypt).
+
+Запуск:
+    python bench_throttle.py
+    BENCH_REQUESTS=2000 BCRYPT_ROUNDS=10 python bench_throttle.py
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_throttle.db')}"
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from app.config import BCRYPT_ROUNDS
+from app.database import SessionLocal, engine
+from app.main import app
+from app.models.user import Base, User
+from app.services.passwords import pwd_context
+from app.services.throttle import THROTTLE_RULES, MemoryThrottleStore, throttle
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "1000"))
+BCRYPT_REQUESTS = int(os.getenv("BENCH_BCRYPT_REQUESTS", "20"))
+EMAIL = "victim@bench.local"
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, timings, cpu_seconds):
+    ms = [t * 1000 for t in timings]
+    print(f"  {name:<28} n={len(ms):<5} p50={percentile(ms, 50):8.3f}ms  p95={percentile(ms, 95):8.3f}ms  "
+          f"CPU/запрос={cpu_seconds / len(ms) * 1000:8.3f}ms")
+
+
+async def attack(client: httpx.AsyncClient, count: int, expected_status: int):
+    timings = []
+    cpu_start = time.process_time()
+    for i in range(count):
+        start = time.perf_counter()
+        response = await client.post("/users/login", json={"email": EMAIL, "password": f"guess-{i}"})
+        timings.append(time.perf_counter() - start)
+        if response.status_code != expected_status:
+            raise RuntimeError(f"ожидался {expected_status}, получен {response.status_code}: {response.text[:200]}")
+    return timings, time.process_time() - cpu_start
+
+
+async def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(email=EMAIL, username="victim", hashed_password=pwd_context.hash("real-password"),
+                is_verified=True, provider="email", daily_usage=0))
+    db.commit()
+    db.close()
+
+    print(f"🛡️ bcrypt rounds={BCRYPT_ROUNDS}, лимиты входа: "
+          + ", ".join(f"{r.key} {r.limit}/{r.window}s" for r in THROTTLE_RULES["login"]))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        throttle.rules = {**THROTTLE_RULES, "login": ()}
+        await attack(client, 2, 401)  # прогрев
+        bcrypt_timings, bcrypt_cpu = await attack(client, BCRYPT_REQUESTS, 401)
+
+        throttle.rules = THROTTLE_RULES
+        allowed = min(rule.limit for rule in THROTTLE_RULES["login"])
+        await attack(client, allowed, 401)
+        rejected_timings, rejected_cpu = await attack(client, REQUESTS, 429)
+
+    print("\nПеребор паролей одного аккаунта:")
+    report("без лимита (bcrypt)", bcrypt_timings, bcrypt_cpu)
+    report("с лимитом (429)", rejected_timings, rejected_cpu)
+    print(f"  отклоненный запрос дешевле в {bcrypt_cpu / len(bcrypt_timings) / (rejected_cpu / len(rejected_timings)):.0f} раз")
+
+    store = MemoryThrottleStore()
+    keys = [f"login:ip:{i}:60" for i in range(10_000)]
+    timings = []
+    cpu_start = time.process_time()
+    for i in range(100_000):
+        start = time.perf_counter()
+        store.hit(keys[i % len(keys)], 60)
+        timings.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+    print(f"\nСчетчик в памяти (10000 ключей): p50={percentile(timings, 50) * 1e6:.2f}us  "
+          f"p99={percentile(timings, 99) * 1e6:.2f}us  mean={statistics.mean(timings) * 1e6:.2f}us  "
+          f"CPU/вызов={cpu / len(timings) * 1e6:.2f}us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
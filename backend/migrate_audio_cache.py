@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Миграция audio_cache из плоской раскладки в шардированную.
+
+Переносит файлы `audio_cache/{id}.{ext}` в `audio_cache/ab/cd/{id}.{ext}`.
+Ссылки /audio_cache/... продолжают работать и во время миграции:
+роут ищет файл сначала в шарде, потом в корне кеша.
+
+Запуск:
+    python migrate_audio_cache.py            # перенести файлы
+    python migrate_audio_cache.py --dry-run  # только показать план
+"""
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.config import AUDIO_CACHE_DIR
+from app.services.audio_cache import cache_path
+
+SKIP_FILES = {".gitkeep"}
+
+
+def migrate(dry_run: bool = False) -> dict:
+    """Переносит файлы из корня кеша в шарды"""
+    stats = {"moved": 0, "skipped": 0, "conflicts": 0}
+
+    if not os.path.isdir(AUDIO_CACHE_DIR):
+        print(f"ℹ️  Директория {AUDIO_CACHE_DIR} не найдена")
+        return stats
+
+    with os.scandir(AUDIO_CACHE_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name in SKIP_FILES:
+                stats["skipped"] += 1
+                continue
+
+            target = cache_path(entry.name)
+            if os.path.exists(target):
+                # В шарде уже есть файл (например, скачан заново после деплоя) - старый не трогаем
+                print(f"⚠️  {entry.name}: уже есть {target}, пропускаем")
+                stats["conflicts"] += 1
+                continue
+
+            print(f"📦 {entry.name} -> {target}")
+            if not dry_run:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                # os.replace атомарен в пределах одной файловой системы
+                os.replace(entry.path, target)
+            stats["moved"] += 1
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграция audio_cache в шардированную раскладку")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет перенесено")
+    args = parser.parse_args()
+
+    print(f"🔍 Миграция {AUDIO_CACHE_DIR}{' (dry run)' if args.dry_run else ''}...")
+    stats = migrate(dry_run=args.dry_run)
+    print(f"✅ Перенесено: {stats['moved']}, пропущено: {stats['skipped']}, конфликтов: {stats['conflicts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Проверка отбора кандидатов из каталога (app/services/candidate_retrieval.py).
+
+Каталог собирается в памяти (без БД). Проверяются: порядок кандидатов по
+совпадению тегов, учет исполнителей из профиля вкуса, объединение списков
+без повторов и решение "ответить без модели": по широкому пулу, а не по
+CANDIDATES_FOR_LLM кандидатам, которые уходят в промпт.
+
+    python test_candidate_retrieval.py
+"""
+import os
+import sys
+from collections import namedtuple
+
+os.environ.setdefault("SECRET_KEY", "test-secret")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.candidate_retrieval import (
+    CANDIDATES_FOR_LLM,
+    LOCAL_POOL_FACTOR,
+    LOCAL_POOL_SIZE,
+    CandidateIndex,
+    CandidateRetrievalEngine,
+    merge_candidates,
+)
+
+Track = namedtuple("Track", "id title artist youtube_video_id save_count recommend_count")
+Tag = namedtuple("Tag", "track_id tag weight")
+MOOD = {"mood": "calm", "music_genre": "ambient", "emotions": ["peaceful"]}
+N_TRACKS = 5
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def build_catalog(confident: int, weak: int):
+    """confident треков со всеми тегами настроения, weak - с одним тегом из трех"""
+    tracks, tags = [], []
+    for i in range(confident + weak):
+        tracks.append(Track(i + 1, f"Song {i}", f"Artist {i}", f"vid{i}", 0, i % 3))
+        names = ["calm", "ambient", "peaceful"] if i < confident else ["calm", "rock", "loud"]
+        tags.extend(Tag(i + 1, name, 3) for name in names)
+    return tracks, tags
+
+
+def engine_for(tracks, tags) -> CandidateRetrievalEngine:
+    engine = CandidateRetrievalEngine()
+    engine._index = CandidateIndex(tracks, tags)
+    return engine
+
+
+def main():
+    check(LOCAL_POOL_SIZE >= LOCAL_POOL_FACTOR * N_TRACKS, "Пул для решения без модели не меньше порога")
+
+    # 1. Порядок по совпадению тегов
+    engine = engine_for(*build_catalog(confident=3, weak=3))
+    found = engine.retrieve(MOOD)
+    check({c["name"] for c in found[:3]} == {"Song 0", "Song 1", "Song 2"} and
+          all(c["match"] > 0.9 for c in found[:3]), "Сначала треки со всеми тегами настроения")
+    check(all(c["match"] < 0.5 for c in found[3:]), "Частичное совпадение - ниже")
+
+    # 2. Исполнитель из профиля поднимает трек с частичным совпадением
+    boosted = engine.retrieve(MOOD, {"artist_weights": {"Artist 5": 10.0}})
+    weak = [c["name"] for c in boosted if c["match"] < 0.5]
+    check(weak[0] == "Song 5", "Исполнитель из профиля - выше среди слабых совпадений")
+
+    # 3. Объединение без повторов, берется лучшее совпадение
+    merged = merge_candidates(
+        [{"name": "Song 1", "artist": "Artist 1", "score": 0.2, "match": 0.2}],
+        [{"name": "song 1", "artist": "artist 1", "score": 0.9, "match": 0.9, "source": "embedding"}],
+    )
+    check(len(merged) == 1 and merged[0]["match"] == 0.9, "Повторы объединены")
+
+    # 4. Уверенных кандидатов больше, чем уходит в промпт: модель не нужна
+    engine = engine_for(*build_catalog(confident=12, weak=20))
+    pool = merge_candidates(engine.retrieve(MOOD), k=LOCAL_POOL_SIZE)
+    check(len(pool) > CANDIDATES_FOR_LLM, f"Пул шире промпта ({len(pool)} > {CANDIDATES_FOR_LLM})")
+    local = engine.local_recommendations(MOOD, pool, n_tracks=N_TRACKS, language="en")
+    check(local is not None and local["source"] == "local", "12 уверенных из 32 - ответ без модели")
+    check(len(local["recommended_tracks"]) == N_TRACKS, "5 треков")
+    picked = {t["name"] for t in local["recommended_tracks"]}
+    check(picked <= {f"Song {i}" for i in range(12)}, "Только уверенные кандидаты")
+
+    # 5. Уверенных меньше порога - запрос к модели
+    engine = engine_for(*build_catalog(confident=LOCAL_POOL_FACTOR * N_TRACKS - 1, weak=20))
+    pool = merge_candidates(engine.retrieve(MOOD), k=LOCAL_POOL_SIZE)
+    check(engine.local_recommendations(MOOD, pool, n_tracks=N_TRACKS) is None, "9 уверенных - нужна модель")
+
+    # 6. Пустой каталог
+    check(engine_for([], []).retrieve(MOOD) == [], "Пустой каталог - нет кандидатов")
+
+
+if __name__ == "__main__":
+    main()
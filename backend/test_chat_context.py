@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Проверка контекста чата (app/services/chat_context.py) на временной SQLite
+с подменной моделью вместо OpenAI.
+
+Проверяются: длинная история из коротких сообщений не запускает сворачивание
+(триггер - только токены за окном), длинная переписка за окном - запускает,
+summarize сворачивает ее в резюме и читает не больше FOLD_FETCH_LIMIT строк
+за раунд, а повторный вызов без новой переписки ничего не пишет.
+
+    python test_chat_context.py
+"""
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'chat.db')}"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from app.database import SessionLocal, engine
+from app.models.user import Base, ChatMessage, ChatSummary, User
+from app.services.chat_context import FOLD_FETCH_LIMIT, HISTORY_FETCH_LIMIT, ChatContextService
+
+
+class FakeRouter:
+    def __init__(self):
+        self.calls = 0
+
+    def complete_sync(self, messages, **kwargs):
+        self.calls += 1
+        content = f"резюме {self.calls}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class Statements:
+    """Считает запросы к БД и запоминает их текст"""
+
+    def __init__(self):
+        self.sql = []
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.sql.append(statement)
+
+    def writes(self):
+        return [s for s in self.sql if s.lstrip().upper().startswith(("INSERT", "UPDATE"))]
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def add_user(db, name: str) -> int:
+    user = User(email=f"{name}@example.com", username=name, hashed_password="x", is_verified=True)
+    db.add(user)
+    db.commit()
+    return user.id
+
+
+def add_messages(db, user_id: int, count: int, text: str) -> None:
+    db.add_all(ChatMessage(user_id=user_id, role="user" if i % 2 == 0 else "ai", content=f"{text} {i}")
+               for i in range(count))
+    db.commit()
+
+
+def main():
+    Base.metadata.create_all(engine)
+    router = FakeRouter()
+    service = ChatContextService(openai_service=SimpleNamespace(router=router))
+    statements = Statements()
+    db = SessionLocal()
+
+    # 1. Много коротких сообщений: окно заполнено, но за ним почти ничего - резюме не нужно
+    short_user = add_user(db, "short")
+    add_messages(db, short_user, HISTORY_FETCH_LIMIT * 3, "ок")
+    _, needs_summary = service.build_messages(db, short_user, "привет")
+    check(not needs_summary, f"{HISTORY_FETCH_LIMIT * 3} коротких сообщений - без сворачивания")
+    statements.sql.clear()
+    service.summarize(db, short_user)
+    service.summarize(db, short_user)
+    check(router.calls == 0, "Модель не вызывалась")
+    check(len(statements.writes()) == 1, f"Пишется только пустое резюме, один раз ({len(statements.writes())})")
+
+    # 2. Длинная переписка за окном - пора сворачивать
+    long_user = add_user(db, "long")
+    add_messages(db, long_user, FOLD_FETCH_LIMIT * 2, "длинное сообщение про музыку и настроение " * 8)
+    _, needs_summary = service.build_messages(db, long_user, "привет")
+    check(needs_summary, "Переписка за окном - нужно резюме")
+
+    statements.sql.clear()
+    service.summarize(db, long_user)
+    summary = db.query(ChatSummary).filter(ChatSummary.user_id == long_user).populate_existing().one()
+    check(router.calls > 0 and summary.summary.startswith("резюме"), f"Резюме записано ({summary.summary!r})")
+    check(summary.summarized_until_id > 0, f"Свернуто до id {summary.summarized_until_id}")
+    fold_queries = [s for s in statements.sql if "ORDER BY chat_messages.id ASC" in s]
+    check(fold_queries and all("LIMIT" in s for s in fold_queries), "Запрос старых сообщений ограничен LIMIT")
+
+    # 3. Все свернуто - повторный вызов ничего не пишет
+    for _ in range(10):
+        service.summarize(db, long_user)
+    _, needs_summary = service.build_messages(db, long_user, "привет")
+    check(not needs_summary, "После сворачивания резюме больше не нужно")
+    calls, writes = router.calls, len(statements.writes())
+    service.summarize(db, long_user)
+    check(router.calls == calls and len(statements.writes()) == writes, "Повторный вызов без записей в БД")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Проверка контейнера сервисов (app/container.py) и lifespan приложения.
+
+Приложение через TestClient на временной SQLite. Проверяются: импорт приложения
+не создает хранилище аудио, один экземпляр каждого сервиса на приложение (AuthService и Clerk не создаются на каждый
+загруженный файл), общая HTTP-сессия у Clerk, кеш JWKS и закрытие клиентов
+при остановке приложения.
+
+    python test_container.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'container.db')}"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["SERVICE_WARMUP"] = ""
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+from app.container import container
+from app.database import SessionLocal
+from app.main import app
+from app.models.user import User
+from app.services import clerk_service as clerk_module
+from app.services.auth_service import AuthService
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+class FakeResponse:
+    status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"keys": [{"kid": "k1", "kty": "RSA"}]}
+
+
+class FakeHTTP:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        return FakeResponse()
+
+
+def main():
+    # 0. Хранилище аудио (в режиме S3 - boto3 и клиент) создается при первом запросе, не при импорте
+    check("audio_storage" not in container.built(), "Хранилище аудио не создано при импорте")
+
+    created = []
+    original_init = AuthService.__init__
+
+    def counting_init(self, *args, **kwargs):
+        created.append(self)
+        original_init(self, *args, **kwargs)
+
+    AuthService.__init__ = counting_init
+
+    with TestClient(app) as client:
+        check(app.state.container is container, "Контейнер в app.state")
+        db = SessionLocal()
+        db.add(User(email="c@example.com", username="c", is_verified=True, provider="email", account_type="pro"))
+        db.commit()
+        headers = {"Authorization": f"Bearer {container.auth_service.create_access_token({'sub': 'c'})}"}
+
+        # 1. Один AuthService на приложение, в том числе для загрузок файлов
+        for _ in range(3):
+            response = client.post("/chat/analyze-media", headers=headers,
+                                   files={"file": ("notes.txt", b"text", "text/plain")})
+            # Ошибки проверки файла обработчик отдает как 500 - важно, что лимит уже проверен
+            check(response.status_code >= 400, "Неподдерживаемый файл отклонен после проверки лимита")
+        check(len(created) == 1, f"AuthService создан один раз ({len(created)})")
+        auth_service = container.auth_service
+        check(auth_service.clerk_service is container.clerk_service, "Clerk - общий экземпляр")
+        check(container.clerk_service.http is container.http, "Clerk ходит через общую HTTP-сессию")
+
+        # 2. Клиенты, которые должны закрыться при остановке
+        http = container.http
+        closed = []
+        http.close = lambda: closed.append("http")
+        llm_client = container.openai_service.router.primary.async_client
+
+    # 3. Остановка приложения закрывает клиенты и сбрасывает контейнер
+    check(closed == ["http"], "HTTP-сессия закрыта")
+    check(llm_client.is_closed(), "Клиент OpenAI закрыт")
+    check(container.built() == {}, "Контейнер пуст после остановки")
+
+    with TestClient(app):
+        check(container.auth_service is not auth_service, "Новый запуск - новые сервисы")
+
+    # 4. Кеш JWKS: повторный запрос только по TTL или (не чаще раза в минуту) при незнакомом kid
+    http = FakeHTTP()
+    clerk = clerk_module.ClerkService(http=http)
+    clerk.jwks_url = "https://clerk.example.com/.well-known/jwks.json"
+    clerk.get_jwks()
+    clerk.get_jwks()
+    check(http.calls == 1, "JWKS из кеша")
+    clerk.get_jwks(refresh=True)
+    check(http.calls == 1, "Внеплановое обновление не чаще JWKS_MIN_REFRESH")
+    clerk._jwks_fetched_at = time.monotonic() - clerk_module.JWKS_MIN_REFRESH - 1
+    clerk.get_jwks(refresh=True)
+    check(http.calls == 2, "Незнакомый kid - JWKS запрошен заново")
+    AuthService.__init__ = original_init
+
+
+if __name__ == "__main__":
+    main()
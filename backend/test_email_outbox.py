@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Проверка очереди писем (app/services/email_outbox.py) на локальном stub-сервере Brevo.
+
+Stub - POST /v3/smtp/email на 127.0.0.1, отвечает как Brevo и умеет отдавать
+ошибки. Очередь - SQLite во временном файле. Проверяются: письмо добавляется в
+транзакции вызывающего кода (без своего commit), отправка пачкой одним
+запросом, повтор с задержкой после 5xx, отправка по одному после 400 на пачку,
+окончательная ошибка после EMAIL_MAX_ATTEMPTS и консольный режим без ключа.
+
+    python test_email_outbox.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.user import Base, EmailOutbox, User
+from app.services.email_outbox import EmailOutboxSender
+from app.services.email_service import EmailService
+
+
+class BrevoStub:
+    """fail_next - сколько следующих запросов ответят 500; bad_emails - адреса, на которые ответ 400"""
+
+    def __init__(self):
+        self.requests = []
+        self.fail_next = 0
+        self.bad_emails = set()
+        self.port = None
+
+    async def handle(self, request):
+        body = await request.json()
+        self.requests.append(body)
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            return web.json_response({"code": "internal_error", "message": "stub failure"}, status=500)
+        emails = [to["email"] for version in body.get("messageVersions", []) for to in version["to"]]
+        if self.bad_emails & set(emails):
+            return web.json_response({"code": "invalid_parameter", "message": "bad email"}, status=400)
+        return web.json_response({"messageIds": [f"<msg-{len(self.requests)}-{i}>" for i in range(len(emails))]},
+                                 status=201)
+
+    def start(self) -> "BrevoStub":
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            app = web.Application()
+            app.router.add_post("/v3/smtp/email", self.handle)
+            runner = web.AppRunner(app)
+            loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return self
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def make_due(Session) -> None:
+    """Сдвигает повторы на "сейчас", чтобы не ждать backoff"""
+    db = Session()
+    db.query(EmailOutbox).filter(EmailOutbox.status == "pending").update(
+        {"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    db.close()
+
+
+def statuses(Session):
+    db = Session()
+    rows = {row.to_email: (row.status, row.attempts, row.message_id, row.params) for row in db.query(EmailOutbox)}
+    db.close()
+    return rows
+
+
+def main():
+    stub = BrevoStub().start()
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'outbox.db')}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    service = EmailService(api_key="xkeysib-test", host=f"http://127.0.0.1:{stub.port}/v3")
+    sender = EmailOutboxSender(service, session_factory=Session, batch_size=10, max_attempts=3)
+    sender.notify = lambda: None  # в тесте очередь обрабатывается вручную, без фонового потока
+
+    # 0. Письмо - в транзакции вызывающего кода: откат отменяет и пользователя, и письмо
+    db = Session()
+    db.add(User(email="rollback@example.com", username="rollback", provider="email", daily_usage=0))
+    sender.enqueue(db, "rollback@example.com", "verification", {"code": "000000"})
+    db.rollback()
+    db.close()
+    check("rollback@example.com" not in statuses(Session), "Откат транзакции - письма в очереди нет")
+
+    # 1. Пачка: 5 писем - один запрос с 5 messageVersions
+    db = Session()
+    for i in range(5):
+        sender.enqueue(db, f"user{i}@example.com", "verification", {"code": f"10000{i}"})
+    db.commit()
+    db.close()
+    check(sender.process_once() == 5, "Взято 5 писем")
+    check(len(stub.requests) == 1 and len(stub.requests[0]["messageVersions"]) == 5, "Отправлено одним запросом")
+    check(stub.requests[0]["messageVersions"][2]["params"] == {"code": "100002"}, "У каждой версии свой код")
+    rows = statuses(Session)
+    check(all(status == "sent" and message_id and params is None for status, _, message_id, params in rows.values()),
+          "Все письма sent, id провайдера сохранен, код из очереди удален")
+
+    # 2. 5xx - повтор с задержкой, затем успех
+    stub.requests.clear()
+    stub.fail_next = 1
+    db = Session()
+    sender.enqueue(db, "retry@example.com", "verification", {"code": "200000"})
+    db.commit()
+    db.close()
+    sender.process_once()
+    status, attempts, _, _ = statuses(Session)["retry@example.com"]
+    check(status == "pending" and attempts == 1, "После 500 письмо ждет повтора")
+    check(sender.process_once() == 0, "До истечения задержки повтор не отправляется")
+    make_due(Session)
+    sender.process_once()
+    status, attempts, _, _ = statuses(Session)["retry@example.com"]
+    check(status == "sent" and attempts == 2, "Повтор отправлен со второй попытки")
+
+    # 3. 400 на пачку - по одному: неверный адрес failed, остальные sent
+    stub.requests.clear()
+    stub.bad_emails = {"bad@example.com"}
+    db = Session()
+    for email in ("ok1@example.com", "bad@example.com", "ok2@example.com"):
+        sender.enqueue(db, email, "verification", {"code": "300000"})
+    db.commit()
+    db.close()
+    sender.process_once()
+    rows = statuses(Session)
+    check(len(stub.requests) == 4, "Пачка + 3 отдельных запроса")
+    check(rows["ok1@example.com"][0] == "sent" and rows["ok2@example.com"][0] == "sent", "Корректные адреса отправлены")
+    check(rows["bad@example.com"][0] == "failed", "Неверный адрес - failed без повторов")
+
+    # 4. Провайдер недоступен - failed после max_attempts
+    stub.fail_next = 100
+    db = Session()
+    sender.enqueue(db, "down@example.com", "verification", {"code": "400000"})
+    db.commit()
+    db.close()
+    for _ in range(3):
+        sender.process_once()
+        make_due(Session)
+    status, attempts, _, _ = statuses(Session)["down@example.com"]
+    check(status == "failed" and attempts == 3, "После 3 попыток - failed")
+    stub.fail_next = 0
+
+    # 5. Без ключа - консольный режим
+    console = EmailOutboxSender(EmailService(api_key="", host=f"http://127.0.0.1:{stub.port}/v3"),
+                                session_factory=Session)
+    console.notify = lambda: None
+    console.email_service.configuration.api_key["api-key"] = None
+    stub.requests.clear()
+    db = Session()
+    console.enqueue(db, "console@example.com", "verification", {"code": "500000"})
+    db.commit()
+    db.close()
+    console.process_once()
+    check(not stub.requests and statuses(Session)["console@example.com"][0] == "sent", "Без ключа - вывод в консоль")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Проверка индекса эмбеддингов (app/services/embedding_index.py) с
+детерминированным HashingEmbeddingProvider - без сети, на временной SQLite.
+
+Проверяются: одинаковые векторы для одинакового текста, поиск треков под
+похожее настроение (и отсутствие их для непохожего), чтение индекса другим
+воркером из БД, recall@k и поиск одновременно с записью из других потоков.
+
+    python test_embedding_index.py
+"""
+import os
+import sys
+import tempfile
+import threading
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'embeddings.db')}"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app.database import SessionLocal, engine
+from app.models.user import Base
+from app.services.embedding_index import EmbeddingStore
+from app.services.embeddings import EmbeddingProvider, HashingEmbeddingProvider
+
+SAD = {"mood": "sad", "emotions": ["melancholy", "lonely"], "music_genre": "indie folk",
+       "description": "rainy window, grey evening"}
+SAD_AGAIN = {"mood": "sad", "emotions": ["melancholy"], "music_genre": "indie folk",
+             "description": "grey rainy evening"}
+PARTY = {"mood": "energetic", "emotions": ["excited", "happy"], "music_genre": "dance pop",
+         "description": "club lights and confetti"}
+SAD_TRACKS = [{"name": "Skinny Love", "artist": "Bon Iver"}, {"name": "Holocene", "artist": "Bon Iver"}]
+PARTY_TRACKS = [{"name": "Levitating", "artist": "Dua Lipa"}, {"name": "One Kiss", "artist": "Calvin Harris"}]
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def names(candidates):
+    return {c["name"] for c in candidates}
+
+
+def main():
+    Base.metadata.create_all(engine)
+    provider = HashingEmbeddingProvider(dim=256)
+
+    # 1. Провайдер детерминирован, базовый класс абстрактный
+    first, second = provider.embed(["sad indie folk"]), HashingEmbeddingProvider(dim=256).embed(["sad indie folk"])
+    check(np.array_equal(first, second), "Одинаковый текст - одинаковый вектор")
+    check(abs(float(np.linalg.norm(first[0])) - 1) < 1e-5, "Вектор нормирован")
+    try:
+        EmbeddingProvider()
+        check(False, "EmbeddingProvider нельзя создать без embed")
+    except TypeError:
+        check(True, "EmbeddingProvider абстрактный")
+
+    # 2. Запись анализов и поиск похожих
+    store = EmbeddingStore(provider=provider, session_factory=SessionLocal)
+    db = SessionLocal()
+    store.record(db, store.embed_mood(SAD), SAD_TRACKS)
+    store.record(db, store.embed_mood(PARTY), PARTY_TRACKS)
+    found = store.similar_tracks(store.embed_mood(SAD_AGAIN), 10)
+    check(names(SAD_TRACKS) <= names(found), f"Похожее настроение - те же треки ({sorted(names(found))})")
+    check(not names(PARTY_TRACKS) & names(found), "Треки непохожего настроения не попали")
+    check(all(c["source"] == "embedding" for c in found), "Источник - embedding")
+    check(store.similar_tracks(None, 10) == [], "Без вектора - пусто")
+
+    # 3. Другой воркер видит те же векторы из БД
+    other = EmbeddingStore(provider=HashingEmbeddingProvider(dim=256), session_factory=SessionLocal)
+    other.ensure_fresh()
+    check(other.similar_tracks(other.embed_mood(SAD_AGAIN), 10) == found, "Индекс из БД - тот же результат")
+
+    # 4. recall@k - доля треков модели среди локальных кандидатов
+    recall = store.record_recall(found, SAD_TRACKS + [{"name": "Unknown", "artist": "Nobody"}])
+    check(abs(recall - 2 / 3) < 1e-9, f"recall = 2/3 ({recall:.3f})")
+
+    # 5. Поиск параллельно с добавлением векторов (матрица растет и переносится)
+    errors, done = [], threading.Event()
+    query = store.embed_mood(SAD_AGAIN)
+
+    def writer():
+        try:
+            for i in range(3000):
+                vector = provider.embed([f"mood {i}"])[0]
+                with store._index_lock:
+                    store._index("mood", provider.dim).upsert(f"extra-{i}", vector, {"tracks": []})
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    searches = 0
+    while not done.is_set():
+        try:
+            result = store.similar_tracks(query, 10)
+            searches += 1
+            if not names(SAD_TRACKS) <= names(result):
+                errors.append(AssertionError("потерян результат поиска"))
+        except Exception as e:
+            errors.append(e)
+    thread.join()
+    check(not errors, f"{searches} поисков во время записи без ошибок ({errors[:1]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Проверка кэша анализов изображений (app/services/image_hash.py) в пакетном
+анализе карусели (OpenAIService.analyze_images_batch) с подменной моделью.
+
+Кэш - SQLite во временном файле. Проверяются: каждый анализ из пакетного ответа
+сохраняется в кэш отдельно; пережатые копии уже анализированных изображений
+берутся из кэша, и в запрос уходят только новые (номера в ответе - позиции в
+запросе); карусель целиком из кэша - без запроса к модели; свой анализ не
+попадает в индекс второй раз при дочитывании из БД.
+
+    python test_image_analysis_cache.py
+"""
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.user import Base, ImageAnalysis
+from app.services import openai_service as openai_service_module
+from app.services.image_hash import ImageAnalysisCache
+from app.services.openai_service import OpenAIService
+
+MOODS = ["calm", "energetic", "sad", "dreamy"]
+
+
+class FakeRouter:
+    """Отвечает пакетным анализом: i-е изображение запроса - MOODS[i]"""
+
+    def __init__(self):
+        self.backends = [SimpleNamespace(name="fake", model=lambda task: "fake-vision")]
+        self.requests = []
+
+    async def complete(self, messages, **kwargs):
+        images = [part for part in messages[0]["content"] if part["type"] == "image_url"]
+        self.requests.append(len(images))
+        content = json.dumps({
+            "images": [{"index": i, "mood": MOODS[i], "emotions": [MOODS[i]], "music_genre": "indie",
+                        "description": f"image {i}"} for i in range(len(images))],
+            "overall": {"mood": "mixed", "music_genre": "indie", "description": "carousel"},
+        })
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def photo(seed: int, quality: int = 90) -> bytes:
+    """Синтетическое "фото": крупные случайные блоки, чтобы dHash был устойчив к пережатию"""
+    rng = random.Random(seed)
+    small = Image.new("RGB", (8, 8))
+    small.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(64)])
+    buffer = io.BytesIO()
+    small.resize((256, 256), Image.BILINEAR).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+async def main():
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'images.db')}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    cache = ImageAnalysisCache(max_distance=5, session_factory=Session)
+    openai_service_module.image_analysis_cache = cache
+    router = FakeRouter()
+    service = OpenAIService(router=router)
+
+    # 1. Новая карусель: один пакетный запрос, каждый анализ - в кэш
+    first = [(photo(seed), f"photo{seed}.jpg") for seed in range(3)]
+    result = await service.analyze_images_batch(first, language="en")
+    check(router.requests == [3], "Один пакетный запрос на 3 изображения")
+    check([image["mood"] for image in result["images"]] == MOODS[:3], "Анализы по порядку")
+    db = Session()
+    check(db.query(ImageAnalysis).count() == 3, "3 анализа сохранены в кэш")
+    db.close()
+
+    # 2. Пережатые копии двух изображений + новое: в запрос уходит только новое
+    router.requests.clear()
+    second = [(photo(0, quality=60), "copy0.jpg"), (photo(7), "new.jpg"), (photo(2, quality=60), "copy2.jpg")]
+    result = await service.analyze_images_batch(second, language="en")
+    images = result["images"]
+    check(router.requests == [1], f"В запросе только новое изображение ({router.requests})")
+    check(images[0].get("cache_hit") and images[0]["mood"] == MOODS[0], "Копия первого - из кэша")
+    check(images[2].get("cache_hit") and images[2]["mood"] == MOODS[2], "Копия третьего - из кэша")
+    check(not images[1].get("cache_hit") and images[1]["mood"] == MOODS[0],
+          "Новое изображение - ответ модели на позицию 0 запроса")
+
+    # 3. Вся карусель уже анализировалась - без запроса к модели
+    router.requests.clear()
+    result = await service.analyze_images_batch([(photo(7, quality=70), "again.jpg")], language="en")
+    check(router.requests == [] and result["images"][0].get("cache_hit"), "Карусель из кэша - без запроса")
+    check(result["overall"]["mood"] == MOODS[0], "Общий вайб - по анализам из кэша")
+
+    # 4. Другой язык - отдельный анализ
+    router.requests.clear()
+    await service.analyze_images_batch([(photo(0), "photo0.jpg")], language="ru")
+    check(router.requests == [1], "На другом языке - запрос к модели")
+
+    # 5. Свои анализы не добавляются в индекс повторно при дочитывании из БД
+    size = cache._index.size
+    cache._refreshed_at = 0
+    cache.ensure_fresh()
+    db = Session()
+    rows = db.query(ImageAnalysis).count()
+    db.close()
+    check(cache._index.size == size == rows, f"В индексе {cache._index.size} записей - по одной на строку ({rows})")
+    other = ImageAnalysisCache(max_distance=5, session_factory=Session)
+    other.ensure_fresh()
+    check(other._index.size == rows, "Другой воркер дочитывает все строки")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
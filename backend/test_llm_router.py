@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Проверка роутера LLM-провайдеров на локальных stub-серверах (без реальных API).
+
+Каждый stub - OpenAI-совместимый /v1/chat/completions на 127.0.0.1 с настраиваемой
+задержкой и ошибками. Проверяются failover, hedged-запросы, вывод бэкенда из
+ротации, потоковый failover, ошибка, когда не отвечает никто, и очередь лимитера.
+
+    python test_llm_router.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+
+from app.services import llm_router
+from app.services.llm_limiter import PRIORITY_BASIC, PRIORITY_PRO
+from app.services.llm_router import LLMBackend, LLMRouter, LLMUnavailableError
+
+
+class StubServer:
+    """OpenAI-совместимый stub: mode = "ok" | "fail", delay - задержка ответа в секундах"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.mode = "ok"
+        self.delay = 0.0
+        self.calls = 0
+        self.cancelled = 0
+        self.port = None
+        self._runner = None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.calls += 1
+        body = await request.json()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.mode == "fail":
+            return web.json_response({"error": {"message": f"{self.name} down"}}, status=500)
+        if body.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for word in (self.name, " ok"):
+                chunk = {"id": "s", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            return response
+        return web.json_response({
+            "id": "c", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": self.name}}],
+        })
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        self._runner = web.AppRunner(app, handler_cancellation=True)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+    def backend(self, **kwargs) -> LLMBackend:
+        return LLMBackend(self.name, "openai", "test", chat_model=f"{self.name}-model",
+                          base_url=f"http://127.0.0.1:{self.port}/v1", max_retries=0, **kwargs)
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+async def main():
+    llm_router.LLM_CIRCUIT_COOLDOWN = 1.0
+    primary, secondary = StubServer("primary"), StubServer("secondary")
+    await primary.start()
+    await secondary.start()
+    messages = [{"role": "user", "content": "привет"}]
+    try:
+        router = LLMRouter([primary.backend(), secondary.backend()], hedge=True, timeout=5)
+
+        # 1. Обычный запрос уходит на первый бэкенд
+        response = await router.complete(messages)
+        check(response.choices[0].message.content == "primary", "запрос обслужен основным бэкендом")
+
+        # 2. Основной отвечает 500 - failover на второй
+        primary.mode = "fail"
+        response = await router.complete(messages)
+        check(response.choices[0].message.content == "secondary", "ошибка основного -> failover на второй бэкенд")
+
+        # 3. После нескольких ошибок подряд основной выводится из ротации
+        for _ in range(llm_router.LLM_CIRCUIT_FAILURES):
+            await router.complete(messages)
+        calls = primary.calls
+        await router.complete(messages)
+        check(primary.calls == calls, "основной бэкенд выведен из ротации после ошибок подряд")
+        check(not router.backends[0].available, "статус основного бэкенда: недоступен")
+
+        # 4. После паузы основной снова в ротации
+        await asyncio.sleep(llm_router.LLM_CIRCUIT_COOLDOWN + 0.1)
+        primary.mode = "ok"
+        response = await router.complete(messages)
+        check(response.choices[0].message.content == "primary", "после паузы основной бэкенд вернулся в ротацию")
+
+        # 5. Hedging: копим статистику задержек, затем основной "зависает"
+        primary.delay = 0.02
+        for _ in range(llm_router.HEDGE_MIN_SAMPLES):
+            await router.complete(messages)
+        hedge_delay = router.backends[0].hedge_delay("chat")
+        router._requests += 100  # бюджет на hedged-запросы
+        primary.delay = 3.0
+        start = time.perf_counter()
+        response = await router.complete(messages)
+        elapsed = time.perf_counter() - start
+        check(response.choices[0].message.content == "secondary", f"hedged-запрос выиграл (задержка hedge {hedge_delay * 1000:.0f} мс)")
+        check(elapsed < 1.0, f"ответ за {elapsed * 1000:.0f} мс вместо 3000 мс")
+        await asyncio.sleep(0.1)
+        check(primary.cancelled >= 1, "медленный запрос к основному бэкенду отменен")
+        primary.delay = 0.0
+
+        # 6. Потоковый ответ: failover до первого фрагмента
+        primary.mode = "fail"
+        chunks = [delta async for delta in router.stream(messages)]
+        check("".join(chunks) == "secondary ok", "потоковый ответ получен от второго бэкенда")
+
+        # 7. Не отвечает никто - LLMUnavailableError (дальше вызывающий код берет офлайн-заглушку)
+        secondary.mode = "fail"
+        try:
+            await router.complete(messages)
+            check(False, "ожидалась LLMUnavailableError")
+        except LLMUnavailableError as e:
+            check(True, f"все бэкенды недоступны: {type(e).__name__}")
+
+        # 8. Лимитер: не больше 2 запросов одновременно, PRO из очереди идут раньше basic
+        secondary.mode = "ok"
+        secondary.delay = 0.1
+        limited = LLMRouter([secondary.backend(max_concurrency=2)], hedge=False, timeout=5)
+        served = []
+
+        async def ask(name, priority):
+            await limited.complete(messages, priority=priority)
+            served.append(name)
+
+        jobs = [asyncio.create_task(ask(f"basic{i}", PRIORITY_BASIC)) for i in range(4)]
+        await asyncio.sleep(0.02)
+        jobs += [asyncio.create_task(ask(f"pro{i}", PRIORITY_PRO)) for i in range(2)]
+        await asyncio.gather(*jobs)
+        check(served[2:4] == ["pro0", "pro1"], f"PRO обслужены раньше ожидающих basic: {served}")
+
+        print(json.dumps(router.stats(), ensure_ascii=False, indent=2))
+    finally:
+        await primary.stop()
+        await secondary.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Проверка GET /users/me со снимком профиля (app/services/profile_cache.py).
+
+Приложение через TestClient на временной SQLite; SQL-запросы считаются
+слушателем движка. Проверяются: повторный запрос без обращений к БД,
+304 по If-None-Match, отсутствие записи в БД при GET в новый день,
+сброс снимка после анализа (счетчик) и после смены имени в профиле,
+истекший токен, снимок для токена Clerk (полная проверка один раз).
+
+    python test_profile_cache.py
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'profile.db')}"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.api import users as users_api
+from app.database import SessionLocal, engine
+from app.main import app
+from app.models.user import Base, User
+from app.services.auth_service import AuthService
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    auth_service = AuthService()
+    db = SessionLocal()
+    user = User(email="me@example.com", username="me", is_verified=True, provider="email", account_type="basic",
+                daily_usage=3, last_usage_date=datetime.utcnow() - timedelta(days=1))
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {auth_service.create_access_token({'sub': 'me'})}"}
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, sql, *args: statements.append(sql))
+    client = TestClient(app)
+
+    # 1. Первый запрос - из БД, без записи даже в новый день
+    response = client.get("/users/me", headers=headers)
+    body, etag = response.json(), response.headers.get("etag")
+    check(response.status_code == 200 and etag, "200 и ETag")
+    check(body["daily_usage"] == 0 and body["remaining_analyses"] == 3, "Вчерашний счетчик показан как 0/3")
+    check(not any(sql.lstrip().upper().startswith("UPDATE") for sql in statements), "GET ничего не пишет в БД")
+
+    # 2. Повторный запрос - из снимка
+    statements.clear()
+    response = client.get("/users/me", headers=headers)
+    check(response.status_code == 200 and response.json() == body, "Тот же профиль")
+    check(not statements, f"Ни одного запроса к БД ({len(statements)})")
+
+    response = client.get("/users/me", headers={**headers, "If-None-Match": etag})
+    check(response.status_code == 304 and response.headers.get("etag") == etag, "If-None-Match - 304")
+
+    # 3. Анализ меняет счетчик - снимок сброшен
+    db.refresh(user)
+    auth_service.check_usage_limit(db, user)
+    response = client.get("/users/me", headers={**headers, "If-None-Match": etag})
+    check(response.status_code == 200 and response.json()["daily_usage"] == 1, "После анализа - 1/3")
+    check(response.headers.get("etag") != etag, "Новый ETag")
+
+    # 4. Смена имени: снимок сброшен, старый токен больше не действует
+    response = client.put("/users/update-profile", headers=headers, json={"username": "me2"})
+    check(response.status_code == 200 and response.json()["username"] == "me2", "Имя изменено")
+    response = client.get("/users/me", headers=headers)
+    check(response.status_code == 401, "Токен со старым именем - 401")
+    new_headers = {"Authorization": f"Bearer {auth_service.create_access_token({'sub': 'me2'})}"}
+    check(client.get("/users/me", headers=new_headers).json()["username"] == "me2", "Новый токен - новый профиль")
+
+    # 5. Без токена - 403 как раньше (HTTPBearer)
+    check(client.get("/users/me").status_code == 403, "Без токена - 403")
+
+    # 6. Снимок не переживает exp токена
+    short = auth_service.create_access_token({"sub": "me2"}, expires_delta=timedelta(seconds=1))
+    check(client.get("/users/me", headers={"Authorization": f"Bearer {short}"}).status_code == 200, "Короткий токен - 200")
+    time.sleep(2)
+    check(client.get("/users/me", headers={"Authorization": f"Bearer {short}"}).status_code == 401,
+          "Истекший токен - 401, несмотря на снимок")
+
+    # 7. Токен Clerk: полная проверка (JWKS, БД) только при первом запросе
+    verified = []
+    original = users_api.get_current_user
+
+    def fake_clerk_user(credentials, db):
+        verified.append(credentials.credentials)
+        return db.query(User).filter(User.username == "me2").first()
+
+    users_api.get_current_user = fake_clerk_user
+    clerk_headers = {"Authorization": "Bearer clerk-session-token"}
+    first = client.get("/users/me", headers=clerk_headers)
+    statements.clear()
+    second = client.get("/users/me", headers=clerk_headers)
+    users_api.get_current_user = original
+    check(first.status_code == 200 and second.json() == first.json(), "Clerk - тот же профиль")
+    check(len(verified) == 1 and not statements, f"Clerk - повторный запрос из снимка ({len(verified)} проверок)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Рендер всех шаблонов промптов из реестра (app/services/prompts.py).
+
+Проверяется, что каждый шаблон рендерится без незаполненных полей, что статическая
+часть идет первой и одинакова при разных данных (кеширование префикса у провайдера),
+что у пользовательских задач есть все языки и что число токенов посчитано.
+
+    python test_prompts.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.prompts import LANGUAGES, RenderedPrompt, prompts
+from app.services.tokens import count_tokens
+
+# Задачи с ответом пользователю - должны быть на всех языках
+USER_FACING_TASKS = ("mood_analysis", "mood_analysis_batch", "recommendations", "chat", "chat_mood", "chat_history_summary")
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def sample_values(fields, variant: str):
+    return {name: f"<{name}-{variant}>" for name in fields}
+
+
+def main():
+    templates = prompts.templates()
+    check(len(templates) > 0, f"В реестре {len(templates)} шаблонов")
+    check(not any("static_tokens" in vars(t) for t in templates), "Импорт реестра не считает токены (tiktoken не загружен)")
+
+    for template in templates:
+        key = f"{template.task}/{template.language}"
+        first = template.render(**sample_values(template.fields, "a"))
+        second = template.render(**sample_values(template.fields, "b"))
+
+        check(isinstance(first, RenderedPrompt) and first.strip() != "", f"{key}: рендерится")
+        check(all(f"<{name}-a>" in first for name in template.fields), f"{key}: все поля {template.fields} подставлены")
+        check(all("{" + name + "}" not in first for name in template.fields), f"{key}: нет незаполненных полей")
+        check(first.startswith(template.static) and second.startswith(template.static),
+              f"{key}: статика ({template.static_tokens} ток.) - префикс промпта")
+        check(first.token_count > 0 and abs(first.token_count - count_tokens(str(first))) <= 2,
+              f"{key}: токены посчитаны заранее ({first.token_count})")
+        check(count_tokens(first) == first.token_count, f"{key}: count_tokens берет готовое значение")
+
+    for task in USER_FACING_TASKS:
+        for language in LANGUAGES:
+            check(prompts.get(task, language).language == language, f"{task}: есть язык {language}")
+
+    check(prompts.get("recommendations", "de").language == "ru", "Неизвестный язык -> ru")
+    check(prompts.get("chat_summary", "en").language == "ru", "chat_summary без перевода -> ru")
+    try:
+        prompts.get("no_such_task")
+        check(False, "Неизвестная задача -> KeyError")
+    except KeyError:
+        check(True, "Неизвестная задача -> KeyError")
+
+    print("\nСтатическая часть, токенов:")
+    for task, by_language in prompts.stats().items():
+        print(f"  {task}: " + ", ".join(f"{lang}={tokens}" for lang, tokens in by_language.items()))
+
+
+if __name__ == "__main__":
+    main()
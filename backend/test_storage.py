@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Проверка S3AudioStorage (app/services/storage.py) на локальном stub-сервере S3.
+
+Stub - минимальный S3 API на 127.0.0.1 (PUT/HEAD/GET объекта и multipart
+upload), объекты хранятся в памяти. Проверяются: базовый класс хранилища
+абстрактный, запись и чтение текста, exists, загрузка потока multipart-частями
+(файл больше S3_MULTIPART_CHUNK_SIZE), загрузка локального файла с удалением,
+Content-Type по расширению, ключи с префиксом шарда, presigned-ссылки,
+по которым файл скачивается без ключей доступа, и эндпоинты, читающие
+хранилище, - обычные функции (запросы boto3 не блокируют event loop).
+
+    python test_storage.py
+"""
+import asyncio
+import io
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+CHUNK_SIZE = 5 * 1024 * 1024  # минимальная часть multipart upload в S3
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+PORT = free_port()
+os.environ.update({
+    "AUDIO_STORAGE_BACKEND": "s3",
+    "S3_BUCKET": "audio-test",
+    "S3_ENDPOINT_URL": f"http://127.0.0.1:{PORT}",
+    "S3_ACCESS_KEY_ID": "test-key",
+    "S3_SECRET_ACCESS_KEY": "test-secret",
+    "S3_KEY_PREFIX": "audio_cache",
+    "S3_PRESIGN_EXPIRES": "600",
+    "S3_MULTIPART_CHUNK_SIZE": str(CHUNK_SIZE),
+})
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from aiohttp import web
+
+from app.services.audio_cache import cache_key, shard_prefix
+from app.services.storage import AudioStorage, S3AudioStorage
+
+
+class S3Stub:
+    """objects - {(bucket, key): (bytes, content_type)}; uploads - незавершенные multipart upload"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.objects = {}
+        self.uploads = {}
+        self.requests = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bucket, _, key = request.path.lstrip("/").partition("/")
+        query = request.query
+        self.requests.append((request.method, key, dict(query)))
+        if request.method == "PUT" and "uploadId" in query:
+            self.uploads[query["uploadId"]]["parts"][int(query["partNumber"])] = await request.read()
+            return web.Response(headers={"ETag": f'"part-{query["partNumber"]}"'})
+        if request.method == "PUT":
+            self.objects[(bucket, key)] = (await request.read(), request.headers.get("Content-Type"))
+            return web.Response(headers={"ETag": '"object"'})
+        if request.method == "POST" and "uploads" in query:
+            upload_id = f"upload-{len(self.uploads) + 1}"
+            self.uploads[upload_id] = {"key": key, "parts": {},
+                                       "content_type": request.headers.get("Content-Type")}
+            return web.Response(content_type="application/xml", text=(
+                f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"))
+        if request.method == "POST" and "uploadId" in query:
+            upload = self.uploads.pop(query["uploadId"])
+            body = b"".join(upload["parts"][number] for number in sorted(upload["parts"]))
+            self.objects[(bucket, key)] = (body, upload["content_type"])
+            return web.Response(content_type="application/xml", text=(
+                f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                f"<ETag>\"multipart\"</ETag></CompleteMultipartUploadResult>"))
+        if request.method in ("GET", "HEAD"):
+            if (bucket, key) not in self.objects:
+                return web.Response(status=404, content_type="application/xml", text=(
+                    "<Error><Code>NoSuchKey</Code><Message>not found</Message></Error>"))
+            body, content_type = self.objects[(bucket, key)]
+            headers = {"Content-Type": content_type or "application/octet-stream", "ETag": '"object"'}
+            if "response-content-disposition" in query:
+                headers["Content-Disposition"] = query["response-content-disposition"]
+            if request.method == "HEAD":
+                headers["Content-Length"] = str(len(body))
+                return web.Response(headers=headers)
+            return web.Response(body=body, headers=headers)
+        return web.Response(status=400)
+
+    def start(self) -> "S3Stub":
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            app = web.Application(client_max_size=64 * 1024 * 1024)
+            app.router.add_route("*", "/{tail:.*}", self.handle)
+            runner = web.AppRunner(app)
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", self.port).start())
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return self
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def main():
+    # 1. Базовый класс абстрактный
+    try:
+        AudioStorage()
+        check(False, "AudioStorage нельзя создать без реализации методов")
+    except TypeError:
+        check(True, "AudioStorage абстрактный")
+
+    stub = S3Stub(PORT).start()
+    storage = S3AudioStorage()
+    bucket = os.environ["S3_BUCKET"]
+
+    # 2. Текстовые файлы статуса и exists
+    key = storage._key("abc123.status")
+    check(key == f"audio_cache/{shard_prefix(cache_key('abc123.status'))}/abc123.status", f"Ключ с шардом ({key})")
+    check(not storage.exists("abc123.status") and storage.read_text("abc123.status") is None, "Нет файла - None")
+    storage.write_text("abc123.status", '{"status": "processing"}')
+    check(storage.exists("abc123.status"), "exists после записи")
+    check(storage.read_text("abc123.status") == '{"status": "processing"}', "read_text возвращает записанное")
+    check(stub.objects[(bucket, key)][1] == "application/json", "Content-Type статуса - application/json")
+
+    # 3. Поток больше части - multipart upload
+    audio = os.urandom(CHUNK_SIZE * 2 + 1234)
+    stub.requests.clear()
+    storage.save_stream("abc123.mp3", io.BytesIO(audio))
+    parts = [r for r in stub.requests if r[0] == "PUT" and "partNumber" in r[2]]
+    body, content_type = stub.objects[(bucket, storage._key("abc123.mp3"))]
+    check(len(parts) == 3, f"Загружено 3 частями ({len(parts)})")
+    check(body == audio and content_type == "audio/mpeg", "Файл собран целиком, Content-Type audio/mpeg")
+    check(storage.find_audio("abc123") == "abc123.mp3", "find_audio находит mp3")
+
+    # 4. Локальный файл загружается и удаляется
+    fd, path = tempfile.mkstemp(suffix=".m4a")
+    with os.fdopen(fd, "wb") as f:
+        f.write(b"m4a-bytes")
+    storage.save_file("track42.m4a", path)
+    check(stub.objects[(bucket, storage._key("track42.m4a"))] == (b"m4a-bytes", "audio/mp4"), "Локальный файл загружен")
+    check(not os.path.exists(path), "Локальный файл удален после загрузки")
+
+    # 5. Presigned-ссылка: подпись, срок и имя файла для скачивания
+    url = storage.url_for("abc123.mp3", download_name="song.mp3")
+    params = parse_qs(urlparse(url).query)
+    check(urlparse(url).path == f"/{bucket}/{storage._key('abc123.mp3')}", "Ссылка на ключ в бакете (path-style)")
+    # Подпись SigV4 (X-Amz-*) или SigV2 - зависит от версии botocore и региона
+    if "X-Amz-Signature" in params:
+        expires_in = int(params["X-Amz-Expires"][0])
+    else:
+        expires_in = int(params["Expires"][0]) - int(time.time())
+    check(("X-Amz-Signature" in params or "Signature" in params) and 590 <= expires_in <= 600,
+          f"Подписана на S3_PRESIGN_EXPIRES ({expires_in}с)")
+    response = requests.get(url, timeout=5)
+    check(response.status_code == 200 and response.content == audio, "По ссылке скачивается файл")
+    check(response.headers.get("Content-Disposition") == "attachment; filename=song.mp3", "Имя файла для скачивания")
+    check(storage.local_path("abc123.mp3") is None, "Локального пути у S3 нет")
+
+    # 6. Эндпоинты с хранилищем - обычные функции (boto3 в пуле потоков, не в event loop)
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api import audio, chat, recommend
+
+    handlers = [audio.get_cached_audio, chat.generate_beat, chat.check_generation_status, chat.download_beat,
+                chat._run_riffusion_generation, recommend.get_youtube_audio]
+    check(not any(asyncio.iscoroutinefunction(h) for h in handlers), "Обработчики с S3 выполняются в пуле потоков")
+    api = FastAPI()
+    api.include_router(audio.router, prefix="/audio_cache")
+    api.include_router(chat.router, prefix="/chat")
+    client = TestClient(api)
+    response = client.get("/audio_cache/abc123.mp3", follow_redirects=False)
+    check(response.status_code == 307 and "abc123.mp3" in response.headers["location"], "/audio_cache - редирект в S3")
+    check(client.get("/audio_cache/missing.mp3").status_code == 404, "Нет в S3 - 404")
+    status = client.post("/chat/generate-beat/status", json={"request_id": "abc123"}).json()
+    check(status.get("status") == "complete", f"Статус генерации по файлам в S3 ({status.get('status')})")
+
+
+if __name__ == "__main__":
+    main()
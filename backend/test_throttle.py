@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Проверка лимитов попыток (app/services/throttle.py) с подменными часами.
+
+Проверяются: скользящее окно (попытки предыдущего окна учитываются
+пропорционально), отдельные лимиты по IP и по email, 429 с Retry-After,
+по email для входа считаются только неудачные проверки, а отклоненные
+запросы счетчик email не увеличивают; сброс лимита по email и очистка
+истекших ключей из памяти.
+
+    python test_throttle.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import HTTPException
+
+from app.services import throttle as throttle_module
+from app.services.throttle import MemoryThrottleStore, Throttle, ThrottleRule
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeRequest:
+    def __init__(self, ip: str):
+        self.headers = {}
+        self.client = type("Client", (), {"host": ip})()
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+async def attempt(throttle: Throttle, ip: str, email: str, action: str = "login"):
+    try:
+        await throttle.check(FakeRequest(ip), action, email)
+        return None
+    except HTTPException as e:
+        return e
+
+
+async def failed_login(throttle: Throttle, ip: str, email: str):
+    """Попытка входа с неверным паролем"""
+    error = await attempt(throttle, ip, email)
+    if error is None:
+        await throttle.failed("login", email)
+    return error
+
+
+def email_count(throttle: Throttle, action: str, email: str) -> float:
+    rule = next(r for r in throttle.rules[action] if r.key == "email")
+    return throttle.memory.peek(throttle._key(action, rule, email), rule.window)[0]
+
+
+async def main():
+    clock = Clock()
+
+    # 1. Скользящее окно: 10 попыток в конце окна еще действуют в начале следующего
+    store = MemoryThrottleStore(clock=clock)
+    clock.now = 1_000_000 // 60 * 60 + 50  # 50-я секунда окна
+    counts = [store.hit("k:60", 60)[0] for _ in range(10)]
+    check(counts[-1] == 10, "10 попыток в текущем окне")
+    clock.now += 20  # 10-я секунда следующего окна: от предыдущего осталось 5/6
+    count, window_left = store.hit("k:60", 60)
+    check(abs(count - (10 * 50 / 60 + 1)) < 1e-6, f"Оценка учитывает предыдущее окно ({count:.2f})")
+    check(abs(window_left - 50) < 1e-6, "До конца окна 50с")
+    clock.now += 120
+    check(store.hit("k:60", 60)[0] == 1, "Через два окна счетчик начинается заново")
+
+    # 2. Лимиты по email и по IP
+    throttle = Throttle(rules={
+        "login": (ThrottleRule("ip", 5, 60), ThrottleRule("email", 3, 900, failures_only=True)),
+        "resend_verification": (ThrottleRule("email", 2, 900),),
+    })
+    throttle.memory = MemoryThrottleStore(clock=clock)
+    results = [await attempt(throttle, f"10.1.0.{i}", "owner@example.com") for i in range(5)]
+    check(results == [None] * 5 and email_count(throttle, "login", "owner@example.com") == 0,
+          "Проверка лимита сама по себе попытку по email не засчитывает")
+
+    results = [await failed_login(throttle, f"10.0.0.{i}", "victim@example.com") for i in range(4)]
+    check(results[:3] == [None, None, None], "3 неверных пароля для одного email с разных IP проходят")
+    check(results[3] is not None and results[3].status_code == 429, "После 3 неудач - 429")
+    check(int(results[3].headers["Retry-After"]) > 0, "Есть Retry-After")
+    check(await attempt(throttle, "10.0.0.1", "Victim@Example.com ") is not None,
+          "Email сравнивается без учета регистра и пробелов")
+    for i in range(20):
+        await attempt(throttle, f"10.2.0.{i}", "victim@example.com")
+    check(email_count(throttle, "login", "victim@example.com") == 3,
+          "Отклоненные запросы не продлевают блокировку email")
+    clock.now += 1800
+    check(await attempt(throttle, "10.0.0.1", "victim@example.com") is None, "Через два окна вход снова доступен")
+
+    # Повторное письмо считается при каждом пропущенном запросе, отклоненные - нет
+    results = [await attempt(throttle, "10.3.0.1", "new@example.com", "resend_verification") for i in range(4)]
+    check(results[:2] == [None, None] and all(r is not None for r in results[2:]), "3-е письмо за окно - 429")
+    check(email_count(throttle, "resend_verification", "new@example.com") == 2, "Засчитаны только отправленные")
+
+    results = [await attempt(throttle, "10.0.0.99", f"user{i}@example.com") for i in range(6)]
+    check(results[:5] == [None] * 5 and results[5] is not None, "С одного IP - не больше 5 попыток в минуту")
+
+    # 3. Сброс по email после успешного входа
+    for i in range(3):
+        await failed_login(throttle, f"10.4.0.{i}", "victim@example.com")
+    check(await attempt(throttle, "10.0.0.50", "victim@example.com") is not None, "Снова заблокирован")
+    await throttle.reset("login", "victim@example.com")
+    check(await attempt(throttle, "10.0.0.50", "victim@example.com") is None, "После сброса попытки снова проходят")
+
+    # 4. Истекшие ключи удаляются из памяти
+    before = throttle.memory.size()
+    clock.now += 3600
+    await attempt(throttle, "10.0.0.77", "fresh@example.com")
+    check(before > 1 and throttle.memory.size() == 1, f"Истекшие ключи удалены ({before} -> {throttle.memory.size()})")
+
+    # 5. Без THROTTLE_TRUST_FORWARDED заголовок X-Forwarded-For не используется
+    request = FakeRequest("192.168.1.1")
+    request.headers["x-forwarded-for"] = "1.2.3.4"
+    check(throttle_module.client_ip(request) == "192.168.1.1", "X-Forwarded-For игнорируется по умолчанию")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Проверка подбора свободного username для Google/Clerk (AuthService.next_free_username).
+
+SQLite во временном файле. Проверяются: один SELECT на подбор имени при
+десятках занятых вариантов (читаются только имена base + цифры), заполнение
+пропусков в номерах, экранирование % и _ в LIKE, повтор при unique violation
+(имя заняли между подбором и INSERT) и то, что конфликт по email не повторяется.
+
+    python test_username_generation.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app.models.user import Base, User
+from app.services.auth_service import AuthService
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def add_user(db, username: str) -> None:
+    db.add(User(email=f"{username}@existing.local", username=username, provider="email", daily_usage=0))
+    db.commit()
+
+
+def main():
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'usernames.db')}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    service = AuthService()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, sql, *args: statements.append(sql))
+
+    # 1. Свободное имя
+    check(service.next_free_username(db, "info") == "info", "Свободное имя возвращается как есть")
+
+    # 2. info, info1..info40 заняты - один запрос вместо 42
+    for name in ["info"] + [f"info{i}" for i in range(1, 41)] + ["information", "info_desk"]:
+        add_user(db, name)
+    statements.clear()
+    check(service.next_free_username(db, "info") == "info41", "Следующий номер - info41")
+    check(len(statements) == 1, f"Один запрос к БД ({len(statements)})")
+    taken = service.taken_usernames(db, "info")
+    check("information" not in taken and "info_desk" not in taken and len(taken) == 41,
+          "Читаются только info и info + цифры")
+
+    # 3. Пропуск в номерах занимается первым
+    db.query(User).filter(User.username == "info7").delete()
+    db.commit()
+    check(service.next_free_username(db, "info") == "info7", "Освободившийся info7 используется")
+
+    # 4. % и _ в имени не работают как шаблон LIKE
+    add_user(db, "a_b")
+    add_user(db, "axb1")
+    check(service.next_free_username(db, "a_b") == "a_b1", "_ экранируется (axb1 не мешает)")
+    check(service.next_free_username(db, "100%") == "100%", "% экранируется")
+
+    # 5. Имя заняли между подбором и INSERT - повтор с новым номером
+    original = service.next_free_username
+    calls = []
+
+    def stale_next_free_username(db_, base):
+        calls.append(base)
+        if len(calls) == 1:
+            add_user(db_, "racer")  # "параллельная" регистрация
+            return "racer"
+        return original(db_, base)
+
+    service.next_free_username = stale_next_free_username
+    user = service.create_user_with_unique_username(db, base_username="racer", email="racer@google.local",
+                                                    google_id="g-1", provider="google")
+    service.next_free_username = original
+    check(user.username == "racer1" and len(calls) == 2, f"После конфликта создан {user.username}")
+
+    # 6. Конфликт по email не повторяется
+    try:
+        service.create_user_with_unique_username(db, base_username="dup", email="racer@google.local",
+                                                 google_id="g-2", provider="google")
+        check(False, "Конфликт по email должен пробрасываться")
+    except IntegrityError:
+        db.rollback()
+        check(db.query(User).filter(User.username.like("dup%")).count() == 0, "Конфликт по email - ошибка без повторов")
+
+    # 7. Полный путь Google
+    user = service.create_or_update_google_user(db, google_id="g-3", email="info@gmail.com", name="Info")
+    check(user.username == "info7", f"Google-пользователь получил {user.username}")
+
+
+if __name__ == "__main__":
+    main()